@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SystemMetric, RegionalMetric, UserActivity, EmergencyTypeMetric
+from .models import SystemMetric, RegionalMetric, UserActivity, EmergencyTypeMetric, HourlyReportCube, DailyReportCube
 
 @admin.register(SystemMetric)
 class SystemMetricAdmin(admin.ModelAdmin):
@@ -8,7 +8,7 @@ class SystemMetricAdmin(admin.ModelAdmin):
 
 @admin.register(RegionalMetric)
 class RegionalMetricAdmin(admin.ModelAdmin):
-    list_display = ('date', 'region', 'emergency_count', 'response_time_avg')
+    list_display = ('date', 'region', 'emergency_count', 'response_time_avg', 'arrival_time_avg')
     list_filter = ('date', 'region')
 
 @admin.register(UserActivity)
@@ -19,5 +19,15 @@ class UserActivityAdmin(admin.ModelAdmin):
 
 @admin.register(EmergencyTypeMetric)
 class EmergencyTypeMetricAdmin(admin.ModelAdmin):
-    list_display = ('date', 'emergency_type', 'count', 'avg_response_time', 'resolution_rate')
+    list_display = ('date', 'emergency_type', 'count', 'avg_response_time', 'avg_arrival_time', 'resolution_rate')
     list_filter = ('date', 'emergency_type')
+
+@admin.register(HourlyReportCube)
+class HourlyReportCubeAdmin(admin.ModelAdmin):
+    list_display = ('bucket', 'emergency_type', 'status', 'region', 'count')
+    list_filter = ('emergency_type', 'status')
+
+@admin.register(DailyReportCube)
+class DailyReportCubeAdmin(admin.ModelAdmin):
+    list_display = ('bucket', 'emergency_type', 'status', 'region', 'count')
+    list_filter = ('bucket', 'emergency_type', 'status')
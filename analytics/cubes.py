@@ -0,0 +1,160 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import HourlyReportCube, DailyReportCube
+from emergency.models import EmergencyReport, EmergencyTag
+
+# Each report is counted once, under its highest priority tag type
+TYPE_PRIORITY = [choice for choice, _ in EmergencyTag.EMERGENCY_TYPE_CHOICES]
+
+# Dimensions that can be used to split a time series
+DIMENSIONS = {
+    'type': 'emergency_type',
+    'status': 'status',
+    'region': 'region',
+}
+
+
+def primary_emergency_type(types):
+    """Pick the single emergency type a report is counted under ('' if untagged)"""
+    types = set(t for t in types if t)
+    for emergency_type in TYPE_PRIORITY:
+        if emergency_type in types:
+            return emergency_type
+    return min(types) if types else ''
+
+
+def _hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def cube_key(report, status=None, tags=None):
+    """
+    The (hour, emergency_type, status, region) cell a report is counted in.
+    Pass tags when they are already known to avoid querying them.
+    """
+    types = [tag.emergency_type for tag in (report.tags.all() if tags is None else tags)]
+    return (
+        _hour(report.timestamp),
+        primary_emergency_type(types),
+        status or report.status,
+        report.region or '',
+    )
+
+
+def _add(key, delta):
+    """Add delta to the hourly cell and its daily roll-up"""
+    hour, emergency_type, status, region = key
+    with transaction.atomic():
+        for model, bucket in ((HourlyReportCube, hour), (DailyReportCube, hour.date())):
+            cell, _ = model.objects.get_or_create(
+                bucket=bucket,
+                emergency_type=emergency_type,
+                status=status,
+                region=region
+            )
+            model.objects.filter(pk=cell.pk).update(count=F('count') + delta)
+
+
+def record_report(report):
+    """Count a newly created report (call once its tags are set)"""
+    _add(cube_key(report), 1)
+
+
+def record_reports(keys):
+    """Count a batch of new reports given their cube keys, one update per cell"""
+    for key, count in Counter(keys).items():
+        _add(key, count)
+
+
+def remove_report(key):
+    """Uncount a deleted report given the cell it was counted in"""
+    _add(key, -1)
+
+
+def move_report(old_key, new_key):
+    """Move a report between cells after its status, tags or region changed"""
+    if old_key != new_key:
+        _add(old_key, -1)
+        _add(new_key, 1)
+
+
+def rebuild_cubes(start=None):
+    """
+    Recompute hourly and daily cubes from the reports table (from start onwards).
+    Used to backfill existing data or repair drift.
+    """
+    reports = EmergencyReport.objects.all()
+    if start is not None:
+        reports = reports.filter(timestamp__gte=start)
+
+    counts = Counter()
+    current_id = None
+    current = None
+    types = []
+    rows = reports.order_by('id').values_list('id', 'timestamp', 'status', 'region', 'tags__emergency_type')
+    for report_id, timestamp, status, region, emergency_type in rows.iterator(chunk_size=2000):
+        if report_id != current_id:
+            if current is not None:
+                counts[(current[0], primary_emergency_type(types), current[1], current[2])] += 1
+            current_id = report_id
+            current = (_hour(timestamp), status, region or '')
+            types = []
+        types.append(emergency_type)
+    if current is not None:
+        counts[(current[0], primary_emergency_type(types), current[1], current[2])] += 1
+
+    with transaction.atomic():
+        hourly = HourlyReportCube.objects.all()
+        daily = DailyReportCube.objects.all()
+        if start is not None:
+            hourly = hourly.filter(bucket__gte=_hour(start))
+            daily = daily.filter(bucket__gte=start.date())
+        hourly.delete()
+        daily.delete()
+
+        HourlyReportCube.objects.bulk_create([
+            HourlyReportCube(bucket=hour, emergency_type=emergency_type, status=status, region=region, count=count)
+            for (hour, emergency_type, status, region), count in counts.items()
+        ], batch_size=1000)
+
+        daily_counts = Counter()
+        for (hour, emergency_type, status, region), count in counts.items():
+            daily_counts[(hour.date(), emergency_type, status, region)] += count
+        DailyReportCube.objects.bulk_create([
+            DailyReportCube(bucket=day, emergency_type=emergency_type, status=status, region=region, count=count)
+            for (day, emergency_type, status, region), count in daily_counts.items()
+        ], batch_size=1000)
+
+    return len(counts)
+
+
+def time_series(start, granularity='day', group_by='type', filters=None):
+    """
+    Report counts per bucket, split by one dimension.
+
+    Returns a list of {'bucket', 'counts', 'total'} dicts ordered by bucket.
+    Reads one row per (bucket, dimension value) from the matching cube.
+    """
+    if granularity == 'hour':
+        cube = HourlyReportCube.objects.filter(bucket__gte=start)
+    else:
+        cube = DailyReportCube.objects.filter(bucket__gte=start.date())
+
+    for dimension, value in (filters or {}).items():
+        cube = cube.filter(**{DIMENSIONS[dimension]: value})
+
+    field = DIMENSIONS[group_by]
+    rows = cube.values('bucket', field).annotate(total=Sum('count')).order_by('bucket')
+
+    series = []
+    for row in rows:
+        if not row['total']:
+            continue
+        if not series or series[-1]['bucket'] != row['bucket']:
+            series.append({'bucket': row['bucket'], 'counts': {}, 'total': 0})
+        series[-1]['counts'][row[field]] = row['total']
+        series[-1]['total'] += row['total']
+    return series
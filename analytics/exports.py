@@ -0,0 +1,207 @@
+import csv
+import gzip
+import io
+import logging
+
+from emergency.models import EmergencyReport, EmergencyStatusTransition
+from location.models import Location
+
+logger = logging.getLogger(__name__)
+
+# pyarrow is optional: without it exports fall back to gzipped CSV
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Dataset name -> (model, [(column, type)])
+DATASETS = {
+    'reports': (EmergencyReport, [
+        ('id', 'string'),
+        ('reporter_id', 'string'),
+        ('reporter_type', 'string'),
+        ('description', 'string'),
+        ('latitude', 'float'),
+        ('longitude', 'float'),
+        ('is_emergency', 'bool'),
+        ('status', 'string'),
+        ('region', 'string'),
+        ('timestamp', 'timestamp'),
+    ]),
+    'transitions': (EmergencyStatusTransition, [
+        ('id', 'string'),
+        ('report_id', 'string'),
+        ('from_status', 'string'),
+        ('to_status', 'string'),
+        ('changed_by_id', 'string'),
+        ('timestamp', 'timestamp'),
+    ]),
+    'locations': (Location, [
+        ('id', 'string'),
+        ('user_id', 'string'),
+        ('latitude', 'float'),
+        ('longitude', 'float'),
+        ('is_emergency', 'bool'),
+        ('timestamp', 'timestamp'),
+    ]),
+}
+
+FORMATS = {
+    'parquet': '.parquet',
+    'csv': '.csv.gz',
+}
+
+
+def parquet_available():
+    return pa is not None
+
+
+def resolve_format(export_format):
+    """The format actually produced for a requested format"""
+    if export_format == 'parquet' and not parquet_available():
+        return 'csv'
+    return export_format
+
+
+def _convert(value, column_type):
+    if value is None:
+        return None
+    if column_type == 'string':
+        return str(value)
+    if column_type == 'float':
+        return float(value)
+    return value
+
+
+def iter_keyset(queryset, fields, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield lists of value tuples for fields (the first must be 'id') in primary
+    key order, one chunk per query.
+
+    Keyset pagination keeps memory flat on every backend; a plain .iterator()
+    does not stream on MySQL, where the driver buffers the whole result.
+    """
+    last_id = None
+    while True:
+        page = queryset.order_by('id')
+        if last_id is not None:
+            page = page.filter(id__gt=last_id)
+        chunk = list(page.values_list(*fields)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def iter_chunks(dataset, chunk_size=DEFAULT_CHUNK_SIZE, since=None):
+    """Yield lists of converted row tuples for a dataset, one chunk at a time"""
+    model, columns = DATASETS[dataset]
+    queryset = model.objects.all()
+    if since is not None:
+        queryset = queryset.filter(timestamp__gte=since)
+
+    names = [name for name, _ in columns]
+    types = [column_type for _, column_type in columns]
+    for rows in iter_keyset(queryset, names, chunk_size):
+        yield [
+            tuple(_convert(value, column_type) for value, column_type in zip(row, types))
+            for row in rows
+        ]
+
+
+class ChunkBuffer(io.RawIOBase):
+    """Write-only file object whose contents are drained after every chunk"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema(columns):
+    types = {
+        'string': pa.string(),
+        'float': pa.float64(),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(name, types[column_type]) for name, column_type in columns])
+
+
+def _write_parquet(dataset, fileobj, chunk_size, since):
+    """Write one row group per chunk; yields after each one"""
+    _, columns = DATASETS[dataset]
+    schema = _parquet_schema(columns)
+    writer = pq.ParquetWriter(fileobj, schema, compression='zstd')
+    try:
+        for chunk in iter_chunks(dataset, chunk_size, since):
+            arrays = [
+                pa.array([row[i] for row in chunk], type=schema.field(i).type)
+                for i in range(len(columns))
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield
+    finally:
+        writer.close()
+
+
+def _write_csv(dataset, fileobj, chunk_size, since):
+    """Write gzipped CSV with a header row; yields after each chunk"""
+    _, columns = DATASETS[dataset]
+    with gzip.GzipFile(fileobj=fileobj, mode='wb') as compressed:
+        text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow([name for name, _ in columns])
+        for chunk in iter_chunks(dataset, chunk_size, since):
+            writer.writerows(chunk)
+            text.flush()
+            yield
+        text.flush()
+        text.detach()
+
+
+def write_export(dataset, fileobj, export_format='parquet', chunk_size=DEFAULT_CHUNK_SIZE, since=None):
+    """
+    Generator that writes a dataset export to fileobj, yielding after each
+    chunk so callers can stream or report progress.
+    """
+    if resolve_format(export_format) != export_format:
+        logger.warning("pyarrow is not installed, exporting as gzipped CSV instead")
+        export_format = 'csv'
+
+    if export_format == 'parquet':
+        return _write_parquet(dataset, fileobj, chunk_size, since)
+    return _write_csv(dataset, fileobj, chunk_size, since)
+
+
+def stream_export(dataset, export_format='parquet', chunk_size=DEFAULT_CHUNK_SIZE, since=None):
+    """Yield the bytes of a dataset export chunk by chunk (for StreamingHttpResponse)"""
+    buffer = ChunkBuffer()
+    for _ in write_export(dataset, buffer, export_format, chunk_size, since):
+        data = buffer.drain()
+        if data:
+            yield data
+    data = buffer.drain()
+    if data:
+        yield data
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from analytics.regions import get_region_index
+from emergency.models import EmergencyReport
+
+
+class Command(BaseCommand):
+    help = 'Assign admin-boundary regions to emergency reports that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--all', action='store_true', help='Reassign every report, not only unassigned ones')
+
+    def handle(self, *args, **options):
+        index = get_region_index()
+        batch_size = options['batch_size']
+
+        reports = EmergencyReport.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        if not options['all']:
+            reports = reports.filter(region__isnull=True)
+
+        assigned = 0
+        batch = []
+        for report in reports.only('id', 'latitude', 'longitude', 'region').iterator(chunk_size=batch_size):
+            batch.append(report)
+            if len(batch) >= batch_size:
+                assigned += self._assign(index, batch)
+                batch = []
+        if batch:
+            assigned += self._assign(index, batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Assigned regions to {assigned} reports'))
+
+    def _assign(self, index, reports):
+        regions = index.assign_many([(r.latitude, r.longitude) for r in reports])
+        for report, region in zip(reports, regions):
+            report.region = region
+        EmergencyReport.objects.bulk_update(reports, ['region'])
+        return sum(1 for region in regions if region is not None)
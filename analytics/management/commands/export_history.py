@@ -0,0 +1,45 @@
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from analytics.exports import DATASETS, FORMATS, DEFAULT_CHUNK_SIZE, resolve_format, write_export
+
+
+class Command(BaseCommand):
+    help = 'Export emergency reports, status transitions and location history as compressed columnar files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('datasets', nargs='*', help=f'Datasets to export: {", ".join(DATASETS)} (default: all)')
+        parser.add_argument('--format', default='parquet', choices=list(FORMATS))
+        parser.add_argument('--output-dir', default='.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--since', help='Only export rows on or after this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        datasets = options['datasets'] or list(DATASETS)
+        unknown = [dataset for dataset in datasets if dataset not in DATASETS]
+        if unknown:
+            raise CommandError(f'Unknown datasets: {", ".join(unknown)}')
+
+        since = None
+        if options['since']:
+            try:
+                since = timezone.make_aware(datetime.strptime(options['since'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        export_format = resolve_format(options['format'])
+        if export_format != options['format']:
+            self.stderr.write(self.style.WARNING('pyarrow is not installed, exporting as gzipped CSV instead'))
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+
+        for dataset in datasets:
+            path = os.path.join(options['output_dir'], f'{dataset}{FORMATS[export_format]}')
+            chunks = 0
+            with open(path, 'wb') as f:
+                for _ in write_export(dataset, f, export_format, options['chunk_size'], since):
+                    chunks += 1
+            self.stdout.write(self.style.SUCCESS(f'Exported {dataset} to {path} ({chunks} chunks)'))
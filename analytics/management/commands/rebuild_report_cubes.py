@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from analytics.cubes import rebuild_cubes
+
+
+class Command(BaseCommand):
+    help = 'Recompute the hourly and daily report cubes from the emergency reports table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Only rebuild the last N days (default: everything)')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['days'] is not None:
+            start = (timezone.now() - timedelta(days=options['days'])).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        cells = rebuild_cubes(start)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {cells} hourly cube cells'))
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SystemMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('active_users', models.IntegerField(default=0)),
+                ('new_users', models.IntegerField(default=0)),
+                ('emergency_reports', models.IntegerField(default=0)),
+                ('resolved_emergencies', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmergencyTypeMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('emergency_type', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+                ('avg_response_time', models.FloatField(default=0)),
+                ('resolution_rate', models.FloatField(default=0)),
+            ],
+            options={
+                'ordering': ['-date', 'emergency_type'],
+                'unique_together': {('date', 'emergency_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RegionalMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('region', models.CharField(choices=[('NORTH', 'North'), ('SOUTH', 'South'), ('EAST', 'East'), ('WEST', 'West'), ('CENTRAL', 'Central')], max_length=20)),
+                ('emergency_count', models.IntegerField(default=0)),
+                ('response_time_avg', models.FloatField(default=0)),
+            ],
+            options={
+                'ordering': ['-date', 'region'],
+                'unique_together': {('date', 'region')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UserActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('logins', models.IntegerField(default=0)),
+                ('reports_submitted', models.IntegerField(default=0)),
+                ('notifications_received', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencytypemetric',
+            name='p50_response_time',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='emergencytypemetric',
+            name='p90_response_time',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='emergencytypemetric',
+            name='avg_arrival_time',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='emergencytypemetric',
+            name='p90_arrival_time',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='regionalmetric',
+            name='response_time_p90',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='regionalmetric',
+            name='arrival_time_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='regionalmetric',
+            name='arrival_time_p90',
+            field=models.FloatField(default=0),
+        ),
+    ]
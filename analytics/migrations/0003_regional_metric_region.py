@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_latency_percentiles'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='regionalmetric',
+            name='region',
+            field=models.CharField(max_length=50),
+        ),
+    ]
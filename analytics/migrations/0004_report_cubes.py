@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_regional_metric_region'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyReportCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('emergency_type', models.CharField(blank=True, max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('region', models.CharField(blank=True, max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'unique_together': {('bucket', 'emergency_type', 'status', 'region')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyReportCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateField()),
+                ('emergency_type', models.CharField(blank=True, max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('region', models.CharField(blank=True, max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'unique_together': {('bucket', 'emergency_type', 'status', 'region')},
+            },
+        ),
+    ]
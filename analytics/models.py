@@ -18,19 +18,13 @@ class SystemMetric(models.Model):
 
 class RegionalMetric(models.Model):
     """Track metrics by region/area"""
-    REGION_CHOICES = [
-        ('NORTH', 'North'),
-        ('SOUTH', 'South'),
-        ('EAST', 'East'),
-        ('WEST', 'West'),
-        ('CENTRAL', 'Central'),
-        # Add more regions as needed
-    ]
-    
     date = models.DateField(default=timezone.now)
-    region = models.CharField(max_length=20, choices=REGION_CHOICES)
+    region = models.CharField(max_length=50)  # Region id from the admin-boundary file, see analytics.regions
     emergency_count = models.IntegerField(default=0)
     response_time_avg = models.FloatField(default=0)  # Average response time in minutes
+    response_time_p90 = models.FloatField(default=0)  # 90th percentile response time in minutes
+    arrival_time_avg = models.FloatField(default=0)  # Average time until on scene in minutes
+    arrival_time_p90 = models.FloatField(default=0)  # 90th percentile time until on scene in minutes
     
     class Meta:
         ordering = ['-date', 'region']
@@ -60,6 +54,10 @@ class EmergencyTypeMetric(models.Model):
     emergency_type = models.CharField(max_length=50)  # corresponds to EmergencyTag.emergency_type
     count = models.IntegerField(default=0)
     avg_response_time = models.FloatField(default=0)  # in minutes
+    p50_response_time = models.FloatField(default=0)  # in minutes
+    p90_response_time = models.FloatField(default=0)  # in minutes
+    avg_arrival_time = models.FloatField(default=0)  # in minutes, until ON_SCENE
+    p90_arrival_time = models.FloatField(default=0)  # in minutes, until ON_SCENE
     resolution_rate = models.FloatField(default=0)  # percentage
     
     class Meta:
@@ -68,3 +66,33 @@ class EmergencyTypeMetric(models.Model):
         
     def __str__(self):
         return f"{self.emergency_type} Metrics for {self.date}"
+
+class HourlyReportCube(models.Model):
+    """Pre-aggregated report counts per hour, emergency type, status and region"""
+    bucket = models.DateTimeField()  # start of the hour
+    emergency_type = models.CharField(max_length=20, blank=True)  # '' for untagged reports
+    status = models.CharField(max_length=20)
+    region = models.CharField(max_length=50, blank=True)  # '' for reports without a region
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['bucket']
+        unique_together = ['bucket', 'emergency_type', 'status', 'region']
+        
+    def __str__(self):
+        return f"{self.bucket} {self.emergency_type}/{self.status}/{self.region}: {self.count}"
+
+class DailyReportCube(models.Model):
+    """Daily roll-up of HourlyReportCube"""
+    bucket = models.DateField()
+    emergency_type = models.CharField(max_length=20, blank=True)
+    status = models.CharField(max_length=20)
+    region = models.CharField(max_length=50, blank=True)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['bucket']
+        unique_together = ['bucket', 'emergency_type', 'status', 'region']
+        
+    def __str__(self):
+        return f"{self.bucket} {self.emergency_type}/{self.status}/{self.region}: {self.count}"
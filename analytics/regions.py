@@ -0,0 +1,173 @@
+import json
+import logging
+import math
+import os
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _bbox(rings):
+    """Bounding box (min_lng, min_lat, max_lng, max_lat) of a list of rings"""
+    xs = [x for ring in rings for x, _ in ring]
+    ys = [y for ring in rings for _, y in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _ring_contains_many(ring, points, inside):
+    """
+    Ray casting for a whole batch: walk the ring's edges once and flip the
+    crossing flag of every point whose horizontal ray crosses the edge.
+    """
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if yi != yj:
+            slope = (xj - xi) / (yj - yi)
+            for k, (x, y) in enumerate(points):
+                if (yi > y) != (yj > y) and x < slope * (y - yi) + xi:
+                    inside[k] = not inside[k]
+        j = i
+    return inside
+
+
+class RegionPolygon:
+    """A single polygon (outer ring plus holes) belonging to a region"""
+
+    def __init__(self, region_id, rings):
+        self.region_id = region_id
+        self.rings = [[(float(x), float(y)) for x, y, *_ in ring] for ring in rings]
+        self.bbox = _bbox(self.rings[:1])
+
+    def contains_many(self, points):
+        """Return a list of booleans, one per (lng, lat) point"""
+        min_x, min_y, max_x, max_y = self.bbox
+        candidates = [
+            k for k, (x, y) in enumerate(points)
+            if min_x <= x <= max_x and min_y <= y <= max_y
+        ]
+        result = [False] * len(points)
+        if not candidates:
+            return result
+
+        batch = [points[k] for k in candidates]
+        # Inside the outer ring and outside every hole
+        inside = _ring_contains_many(self.rings[0], batch, [False] * len(batch))
+        for hole in self.rings[1:]:
+            in_hole = _ring_contains_many(hole, batch, [False] * len(batch))
+            inside = [a and not b for a, b in zip(inside, in_hole)]
+
+        for k, is_inside in zip(candidates, inside):
+            result[k] = is_inside
+        return result
+
+
+class RegionIndex:
+    """
+    Assigns coordinates to admin-boundary regions.
+
+    Polygons are bucketed into a uniform grid by bounding box, so a lookup only
+    tests the handful of polygons overlapping the point's grid cell.
+    """
+
+    def __init__(self, polygons, cell_size=0.25):
+        self.polygons = polygons
+        self.cell_size = cell_size
+        self.grid = defaultdict(list)
+
+        for polygon in polygons:
+            min_x, min_y, max_x, max_y = polygon.bbox
+            for cx in range(self._cell(min_x), self._cell(max_x) + 1):
+                for cy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self.grid[(cx, cy)].append(polygon)
+
+    @classmethod
+    def from_geojson(cls, path, id_property='id', cell_size=0.25):
+        """Build an index from a GeoJSON FeatureCollection of (Multi)Polygons"""
+        with open(path, encoding='utf-8') as f:
+            collection = json.load(f)
+
+        polygons = []
+        for feature in collection.get('features', []):
+            properties = feature.get('properties') or {}
+            region_id = properties.get(id_property, feature.get('id'))
+            geometry = feature.get('geometry') or {}
+            if region_id is None:
+                continue
+
+            if geometry.get('type') == 'Polygon':
+                polygons.append(RegionPolygon(str(region_id), geometry['coordinates']))
+            elif geometry.get('type') == 'MultiPolygon':
+                for rings in geometry['coordinates']:
+                    polygons.append(RegionPolygon(str(region_id), rings))
+
+        return cls(polygons, cell_size=cell_size)
+
+    def _cell(self, value):
+        return math.floor(value / self.cell_size)
+
+    def assign(self, latitude, longitude):
+        """Return the region id containing the point, or None"""
+        return self.assign_many([(latitude, longitude)])[0]
+
+    def assign_many(self, coordinates):
+        """
+        Assign a batch of (latitude, longitude) pairs to region ids.
+
+        Points are grouped by grid cell so every candidate polygon is tested
+        once against all points of the cell rather than once per point.
+        """
+        result = [None] * len(coordinates)
+        by_cell = defaultdict(list)
+        for k, (latitude, longitude) in enumerate(coordinates):
+            if latitude is None or longitude is None:
+                continue
+            by_cell[(self._cell(float(longitude)), self._cell(float(latitude)))].append(k)
+
+        for cell, indexes in by_cell.items():
+            pending = indexes
+            for polygon in self.grid.get(cell, []):
+                points = [(float(coordinates[k][1]), float(coordinates[k][0])) for k in pending]
+                inside = polygon.contains_many(points)
+                remaining = []
+                for k, is_inside in zip(pending, inside):
+                    if is_inside:
+                        result[k] = polygon.region_id
+                    else:
+                        remaining.append(k)
+                pending = remaining
+                if not pending:
+                    break
+
+        return result
+
+
+_region_index = None
+
+
+def get_region_index():
+    """Return the process-wide region index, loading the boundaries file on first use"""
+    global _region_index
+    if _region_index is None:
+        path = getattr(settings, 'REGION_BOUNDARIES_FILE', '')
+        if path and os.path.exists(path):
+            _region_index = RegionIndex.from_geojson(
+                path,
+                id_property=getattr(settings, 'REGION_ID_PROPERTY', 'id'),
+                cell_size=getattr(settings, 'REGION_GRID_CELL_SIZE', 0.25)
+            )
+        else:
+            if path:
+                logger.warning(f"Region boundaries file not found: {path!r}, regions will not be assigned")
+            else:
+                logger.warning("REGION_BOUNDARIES_FILE is not set, regions will not be assigned")
+            _region_index = RegionIndex([])
+    return _region_index
+
+
+def assign_region(latitude, longitude):
+    """Return the region id for a single coordinate, or None"""
+    return get_region_index().assign(latitude, longitude)
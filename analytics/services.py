@@ -1,13 +1,141 @@
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Avg, Count, Min, Max
+from django.db.models import Avg, Count, Min, Max, Sum, Q, F, OuterRef, Subquery, ExpressionWrapper, DurationField, FloatField
+from django.db.models.functions import NullIf
 from collections import defaultdict
+import logging
 
 from .models import SystemMetric, RegionalMetric, UserActivity, EmergencyTypeMetric
-from emergency.models import EmergencyReport
+from .regions import get_region_index
+from .sketches import QuantileSketch
+from emergency.models import EmergencyReport, EmergencyStatusTransition
 from users.models import User
 from notifications.models import Notification
 
+logger = logging.getLogger(__name__)
+
+# Status a report has to reach for each tracked latency
+DISPATCH_STATUS = 'RESPONDING'
+ARRIVAL_STATUS = 'ON_SCENE'
+
+def _minutes(duration):
+    """Convert a timedelta to minutes, treating missing values as 0"""
+    return duration.total_seconds() / 60 if duration else 0
+
+def annotate_latency(reports, to_status, name='latency'):
+    """
+    Annotate reports with the time between their creation and the first
+    transition into to_status (None if the report never got there)
+    """
+    first_transition = EmergencyStatusTransition.objects.filter(
+        report=OuterRef('pk'),
+        to_status=to_status
+    ).order_by('timestamp').values('timestamp')[:1]
+    
+    return reports.annotate(**{
+        f'{name}_at': Subquery(first_transition),
+    }).annotate(**{
+        name: ExpressionWrapper(F(f'{name}_at') - F('timestamp'), output_field=DurationField()),
+    })
+
+def latency_summary(reports, to_status, group_by):
+    """
+    Average, median and 90th percentile latency (in minutes) until to_status,
+    keyed by the group_by value.
+    
+    Latencies are streamed into one QuantileSketch per group. Rows are made
+    distinct per report, so grouping through tags (e.g. tags__emergency_type)
+    counts a report with several tags of one type once.
+    """
+    latencies = annotate_latency(reports, to_status).filter(latency__isnull=False)
+    
+    sketches = defaultdict(QuantileSketch)
+    rows = latencies.values_list(group_by, 'pk', 'latency').order_by().distinct()
+    for key, _, latency in rows.iterator(chunk_size=2000):
+        sketches[key].add(_minutes(latency))
+    
+    return {
+        key: {
+            'count': sketch.count,
+            'avg': sketch.mean,
+            'p50': sketch.quantile(0.5),
+            'p90': sketch.quantile(0.9),
+        }
+        for key, sketch in sketches.items()
+    }
+
+def emergency_type_breakdown(start_date):
+    """
+    Report count, average response time and resolution rate per emergency type
+    since start_date, computed with a single grouped query.
+    
+    Uses the precomputed EmergencyTypeMetric rows when there are any (averages
+    weighted by each day's report count), otherwise aggregates live reports.
+    """
+    metrics = EmergencyTypeMetric.objects.filter(date__gte=start_date)
+    
+    if metrics.exists():
+        total = NullIf(Sum('count'), 0)
+        rows = metrics.values('emergency_type').annotate(
+            total=Sum('count'),
+            avg_response_time=ExpressionWrapper(
+                Sum(F('avg_response_time') * F('count')) / total, output_field=FloatField()
+            ),
+            resolution_rate=ExpressionWrapper(
+                Sum(F('resolution_rate') * F('count')) / total, output_field=FloatField()
+            )
+        ).order_by()
+        
+        return {
+            row['emergency_type']: {
+                'count': row['total'] or 0,
+                'avg_response_time': round(row['avg_response_time'] or 0, 2),
+                'resolution_rate': round(row['resolution_rate'] or 0, 2)
+            }
+            for row in rows
+        }
+    
+    # Calculate on the fly from emergency reports
+    reports = annotate_latency(
+        EmergencyReport.objects.filter(timestamp__date__gte=start_date),
+        DISPATCH_STATUS
+    )
+    rows = reports.filter(tags__isnull=False).values('tags__emergency_type').annotate(
+        total=Count('pk', distinct=True),
+        resolved=Count('pk', filter=Q(status='RESOLVED'), distinct=True),
+        avg_latency=Avg('latency')
+    ).order_by()
+    
+    return {
+        row['tags__emergency_type']: {
+            'count': row['total'],
+            'avg_response_time': round(_minutes(row['avg_latency']), 2),
+            'resolution_rate': round(row['resolved'] / row['total'] * 100, 2)
+        }
+        for row in rows
+    }
+
+def regional_breakdown(start_date):
+    """
+    Report count and average response time per region since start_date from
+    the RegionalMetric rows, with averages weighted by each day's report count.
+    """
+    rows = RegionalMetric.objects.filter(date__gte=start_date).values('region').annotate(
+        total=Sum('emergency_count'),
+        avg_response_time=ExpressionWrapper(
+            Sum(F('response_time_avg') * F('emergency_count')) / NullIf(Sum('emergency_count'), 0),
+            output_field=FloatField()
+        )
+    ).order_by()
+    
+    return {
+        row['region']: {
+            'emergency_count': row['total'] or 0,
+            'response_time_avg': row['avg_response_time'] or 0
+        }
+        for row in rows
+    }
+
 def collect_daily_metrics():
     """
     Collect and save daily system metrics
@@ -63,84 +191,71 @@ def collect_daily_metrics():
 
 def collect_emergency_type_metrics(date):
     """Collect metrics for each emergency type on the given date"""
-    from emergency.models import EmergencyTag
+    # Response times for the day, grouped by emergency type
+    day_reports = EmergencyReport.objects.filter(timestamp__date=date)
+    dispatch = latency_summary(day_reports, DISPATCH_STATUS, 'tags__emergency_type')
+    arrival = latency_summary(day_reports, ARRIVAL_STATUS, 'tags__emergency_type')
     
-    # Get all emergency types
-    emergency_types = EmergencyTag.objects.values_list('emergency_type', flat=True).distinct()
+    # Report counts per type, each report counted once however many of its
+    # tags share the type
+    type_counts = day_reports.filter(tags__isnull=False).values('tags__emergency_type').annotate(
+        total=Count('pk', distinct=True),
+        resolved=Count('pk', filter=Q(status='RESOLVED'), distinct=True)
+    ).order_by()
     
-    for e_type in emergency_types:
-        # Get reports for this type
-        reports = EmergencyReport.objects.filter(
-            timestamp__date=date,
-            tags__emergency_type=e_type
-        )
-        
-        # Skip if no reports
-        if not reports.exists():
-            continue
-        
-        # Count total reports for this type
-        total_count = reports.count()
-        
-        # Count resolved reports
-        resolved = reports.filter(status='RESOLVED').count()
+    for row in type_counts:
+        e_type = row['tags__emergency_type']
+        total_count = row['total']
         
         # Calculate resolution rate
-        resolution_rate = (resolved / total_count) * 100 if total_count > 0 else 0
+        resolution_rate = (row['resolved'] / total_count) * 100 if total_count > 0 else 0
         
-        # Calculate average response time (placeholder - need to implement based on your data model)
-        # This would require tracking when a report status changes to RESPONDING
-        avg_response_time = 0
+        # Response times from the status transition log
+        type_dispatch = dispatch.get(e_type, {})
+        type_arrival = arrival.get(e_type, {})
         
         # Save metrics
         EmergencyTypeMetric.objects.create(
             date=date,
             emergency_type=e_type,
             count=total_count,
-            avg_response_time=avg_response_time,
+            avg_response_time=type_dispatch.get('avg', 0),
+            p50_response_time=type_dispatch.get('p50', 0),
+            p90_response_time=type_dispatch.get('p90', 0),
+            avg_arrival_time=type_arrival.get('avg', 0),
+            p90_arrival_time=type_arrival.get('p90', 0),
             resolution_rate=resolution_rate
         )
 
 def collect_regional_metrics(date):
     """Collect metrics for each region on the given date"""
-    # This is a placeholder - you need to implement region determination
-    # based on your data model (e.g., geocoding based on lat/lng)
-    
-    # Example implementation
-    reports_by_region = defaultdict(list)
-    
-    # Assign reports to regions (simplified example)
-    for report in EmergencyReport.objects.filter(timestamp__date=date):
-        # Simplified region determination based on coordinates
-        # In a real app, you would use geocoding or predefined regions
-        if report.latitude and report.longitude:
-            if report.latitude > 0 and report.longitude > 0:
-                region = 'NORTH'
-            elif report.latitude > 0 and report.longitude < 0:
-                region = 'WEST'
-            elif report.latitude < 0 and report.longitude > 0:
-                region = 'EAST'
-            elif report.latitude < 0 and report.longitude < 0:
-                region = 'SOUTH'
-            else:
-                region = 'CENTRAL'
-                
-            reports_by_region[region].append(report)
+    if not get_region_index().polygons:
+        logger.warning("No region boundaries are loaded (REGION_BOUNDARIES_FILE), new reports have no region")
+    
+    # Reports carry the region assigned at creation (see analytics.regions),
+    # so the rollup is a plain GROUP BY
+    reports = EmergencyReport.objects.filter(timestamp__date=date, region__isnull=False)
+    
+    dispatch = latency_summary(reports, DISPATCH_STATUS, 'region')
+    arrival = latency_summary(reports, ARRIVAL_STATUS, 'region')
+    
+    region_counts = reports.values('region').annotate(count=Count('pk')).order_by()
     
     # Calculate metrics for each region
-    for region, reports in reports_by_region.items():
-        # Count reports
-        count = len(reports)
-        
-        # Calculate average response time (placeholder)
-        response_time_avg = 0
+    for row in region_counts:
+        region = row['region']
+        region_dispatch = dispatch.get(region, {})
+        region_arrival = arrival.get(region, {})
         
         # Save regional metrics
         RegionalMetric.objects.create(
             date=date,
             region=region,
-            emergency_count=count,
-            response_time_avg=response_time_avg
+            emergency_count=row['count'],
+            response_time_avg=region_dispatch.get('avg', 0),
+            response_time_p90=region_dispatch.get('p90', 0),
+            arrival_time_avg=region_arrival.get('avg', 0),
+            arrival_time_p90=region_arrival.get('p90', 0)
         )
 
 def collect_user_activity(date):
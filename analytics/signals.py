@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from .cubes import cube_key, remove_report
+from emergency.models import EmergencyReport
+
+@receiver(pre_delete, sender=EmergencyReport)
+def remember_cube_key(sender, instance, **kwargs):
+    """Take the report's cube cell while its tags are still linked"""
+    instance._cube_key = cube_key(instance)
+
+@receiver(post_delete, sender=EmergencyReport)
+def uncount_deleted_report(sender, instance, **kwargs):
+    """Keep the analytics cubes in step with deleted reports"""
+    key = getattr(instance, '_cube_key', None)
+    if key is not None:
+        remove_report(key)
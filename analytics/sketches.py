@@ -0,0 +1,55 @@
+import math
+from collections import defaultdict
+
+
+class QuantileSketch:
+    """
+    Streaming quantile estimator with a bounded relative error.
+
+    Values are counted in logarithmic buckets (as in DDSketch), so memory depends
+    on the spread of the values rather than on how many values were added.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        """Add a single non-negative value to the sketch"""
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+        self.count += 1
+        self.total += max(value, 0)
+
+    def merge(self, other):
+        """Fold another sketch with the same accuracy into this one"""
+        for key, count in other.buckets.items():
+            self.buckets[key] += count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def quantile(self, q):
+        """Return the estimated value at quantile q (0 <= q <= 1)"""
+        if not self.count:
+            return 0
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+
+        seen = self.zero_count
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
@@ -1,3 +1,368 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+from datetime import timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from config.tests import RoutedReadsTestCase
+from emergency.models import EmergencyReport, EmergencyStatusTransition, EmergencyTag
+from users.models import User
+from . import regions
+from .cubes import rebuild_cubes
+from .exports import iter_chunks, iter_keyset, parquet_available, stream_export
+from .models import DailyReportCube, EmergencyTypeMetric, HourlyReportCube, RegionalMetric
+from .services import collect_emergency_type_metrics, collect_regional_metrics
+
+
+class ResponseTimeMetricsTests(TestCase):
+    """Daily metrics derive response times from the status transition log"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.police = User.objects.create_user('police', 'police@example.com', 'pass', role='POLICE')
+        self.fire = EmergencyTag.objects.create(name='Fire', emergency_type='FIRE')
+        self.wildfire = EmergencyTag.objects.create(name='Wildfire', emergency_type='FIRE')
+        self.flood = EmergencyTag.objects.create(name='Flood', emergency_type='NATURAL')
+        self.created_at = timezone.now() - timedelta(days=1)
+        self.date = timezone.localtime(self.created_at).date()
+
+    def report(self, tags, region='izmir', dispatch=None, arrival=None, status='PENDING'):
+        """A report of self.date reaching RESPONDING/ON_SCENE after the given minutes"""
+        report = EmergencyReport.objects.create(
+            reporter=self.citizen, reporter_type='VICTIM', description='Smoke', region=region, status=status
+        )
+        report.tags.set(tags)
+        EmergencyReport.objects.filter(pk=report.pk).update(timestamp=self.created_at)
+        for to_status, minutes in (('RESPONDING', dispatch), ('ON_SCENE', arrival)):
+            if minutes is not None:
+                transition = EmergencyStatusTransition.objects.create(
+                    report=report, from_status='PENDING', to_status=to_status
+                )
+                EmergencyStatusTransition.objects.filter(pk=transition.pk).update(
+                    timestamp=self.created_at + timedelta(minutes=minutes)
+                )
+        return report
+
+    def test_type_metrics_count_each_report_once(self):
+        # Two tags of the same type must not count the report twice
+        self.report([self.fire, self.wildfire], dispatch=10, arrival=30, status='RESOLVED')
+        self.report([self.fire], dispatch=20)
+        self.report([self.flood], dispatch=4, arrival=8)
+
+        collect_emergency_type_metrics(self.date)
+
+        fire = EmergencyTypeMetric.objects.get(emergency_type='FIRE')
+        self.assertEqual(fire.count, 2)
+        self.assertEqual(fire.resolution_rate, 50)
+        self.assertAlmostEqual(fire.avg_response_time, 15)
+        self.assertAlmostEqual(fire.p50_response_time, 10, delta=0.1)
+        self.assertAlmostEqual(fire.avg_arrival_time, 30)
+        self.assertAlmostEqual(fire.p90_arrival_time, 30, delta=0.3)
+
+        flood = EmergencyTypeMetric.objects.get(emergency_type='NATURAL')
+        self.assertEqual(flood.count, 1)
+        self.assertAlmostEqual(flood.p50_response_time, 4, delta=0.1)
+        self.assertAlmostEqual(flood.avg_arrival_time, 8)
+
+    def test_regional_metrics(self):
+        self.report([self.fire], dispatch=10, arrival=20)
+        self.report([self.fire, self.wildfire])
+        self.report([self.flood], region='manisa')
+        self.report([self.flood], region=None, dispatch=1)
+
+        collect_regional_metrics(self.date)
+
+        izmir = RegionalMetric.objects.get(region='izmir')
+        self.assertEqual(izmir.emergency_count, 2)
+        self.assertAlmostEqual(izmir.response_time_avg, 10)
+        self.assertAlmostEqual(izmir.response_time_p90, 10, delta=0.1)
+        self.assertAlmostEqual(izmir.arrival_time_avg, 20)
+        self.assertAlmostEqual(izmir.arrival_time_p90, 20, delta=0.2)
+
+        # Regions without transitions get zero times
+        manisa = RegionalMetric.objects.get(region='manisa')
+        self.assertEqual(manisa.emergency_count, 1)
+        self.assertEqual(manisa.response_time_avg, 0)
+        self.assertEqual(RegionalMetric.objects.count(), 2)
+
+    def test_status_changes_through_the_api_are_logged(self):
+        report = self.report([self.fire])
+        client = APIClient()
+        client.force_authenticate(self.police)
+        url = f'/api/emergency/reports/{report.id}/'
+
+        self.assertEqual(client.post(url + 'update_status/', {'status': 'RESPONDING'}).status_code, 200)
+        self.assertEqual(client.patch(url, {'status': 'ON_SCENE'}, format='json').status_code, 200)
+        self.assertEqual(client.put(url, {
+            'reporter_type': 'VICTIM', 'description': 'Smoke', 'status': 'RESOLVED'
+        }, format='json').status_code, 200)
+        # Unchanged status is not logged again
+        client.patch(url, {'status': 'RESOLVED'}, format='json')
+
+        transitions = EmergencyStatusTransition.objects.filter(report=report)
+        self.assertEqual(
+            [(t.from_status, t.to_status, t.changed_by_id) for t in transitions],
+            [('PENDING', 'RESPONDING', self.police.id), ('RESPONDING', 'ON_SCENE', self.police.id),
+             ('ON_SCENE', 'RESOLVED', self.police.id)]
+        )
+
+
+class ReportCubeTests(RoutedReadsTestCase):
+    """The report cubes follow report creation, changes and deletion"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.police = User.objects.create_user('police', 'police@example.com', 'pass', role='POLICE')
+        self.fire = EmergencyTag.objects.create(name='Fire', emergency_type='FIRE')
+        self.flood = EmergencyTag.objects.create(name='Flood', emergency_type='NATURAL')
+        self.client = APIClient()
+        self.client.force_authenticate(self.police)
+
+    def report(self, tag):
+        response = self.client.post('/api/emergency/reports/', {
+            'reporter_type': 'VICTIM', 'description': 'Smoke', 'tag_ids': [str(tag.id)]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return EmergencyReport.objects.get(pk=response.data['id'])
+
+    def cells(self, model=HourlyReportCube):
+        return {
+            (cell.emergency_type, cell.status): cell.count
+            for cell in model.objects.all() if cell.count
+        }
+
+    def assertMatchesRebuild(self):
+        counted = {model: self.cells(model) for model in (HourlyReportCube, DailyReportCube)}
+        rebuild_cubes()
+        self.assertEqual({model: self.cells(model) for model in counted}, counted)
+
+    def test_record_move_and_delete(self):
+        first = self.report(self.fire)
+        second = self.report(self.fire)
+        self.assertEqual(self.cells(), {('FIRE', 'PENDING'): 2})
+        self.assertEqual(self.cells(DailyReportCube), {('FIRE', 'PENDING'): 2})
+
+        url = f'/api/emergency/reports/{first.id}/'
+        self.client.post(url + 'update_status/', {'status': 'RESPONDING'})
+        self.client.patch(f'/api/emergency/reports/{second.id}/', {'tag_ids': [str(self.flood.id)]}, format='json')
+        self.assertEqual(self.cells(), {('FIRE', 'RESPONDING'): 1, ('NATURAL', 'PENDING'): 1})
+        self.assertMatchesRebuild()
+
+        first.refresh_from_db()
+        first.delete()
+        EmergencyReport.objects.filter(pk=second.pk).delete()
+        self.assertEqual(self.cells(), {})
+        self.assertEqual(self.cells(DailyReportCube), {})
+
+    def test_time_series(self):
+        self.report(self.fire)
+        self.report(self.flood)
+        response = self.client.get('/api/analytics/timeseries/', {'days': 1, 'granularity': 'hour'})
+        self.assertEqual(response.status_code, 200)
+        [bucket] = response.data['buckets']
+        self.assertEqual(bucket['counts'], {'FIRE': 1, 'NATURAL': 1})
+
+        response = self.client.get('/api/analytics/timeseries/', {'group_by': 'status', 'type': 'FIRE'})
+        self.assertEqual(response.data['buckets'][0]['counts'], {'PENDING': 1})
+
+    def test_invalid_days(self):
+        for path in ('timeseries', 'global', 'regional', 'user'):
+            for days in ('abc', '0', '-3', '99999999'):
+                response = self.client.get(f'/api/analytics/{path}/', {'days': days})
+                self.assertEqual(response.status_code, 400, (path, days))
+                self.assertIn('days', response.data['error'])
+
+
+class RegionalAnalyticsTests(RoutedReadsTestCase):
+    """Regional analytics aggregate the daily RegionalMetric rows"""
+
+    def test_response_time_is_weighted_by_report_count(self):
+        today = timezone.now().date()
+        for days_ago, count, avg in ((0, 1, 40), (1, 3, 10), (2, 6, 20)):
+            RegionalMetric.objects.create(
+                date=today - timedelta(days=days_ago), region='izmir', emergency_count=count, response_time_avg=avg
+            )
+        RegionalMetric.objects.create(date=today, region='manisa', emergency_count=0, response_time_avg=0)
+        cache.clear()
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('police', 'police@example.com', 'pass', role='POLICE'))
+        response = client.get('/api/analytics/regional/', {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['regions']['izmir']['emergency_count'], 10)
+        self.assertAlmostEqual(response.data['regions']['izmir']['response_time_avg'], 19)
+        self.assertEqual(response.data['regions']['manisa'], {'emergency_count': 0, 'response_time_avg': 0})
+
+def square(west, south, east, north):
+    return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+REGIONS = {
+    'type': 'FeatureCollection',
+    'features': [
+        # A region with a hole, which is region B
+        {'type': 'Feature', 'properties': {'id': 'A'}, 'geometry': {
+            'type': 'Polygon', 'coordinates': [square(27.0, 38.0, 28.0, 39.0), square(27.4, 38.4, 27.6, 38.6)]
+        }},
+        {'type': 'Feature', 'properties': {'id': 'B'}, 'geometry': {
+            'type': 'Polygon', 'coordinates': [square(27.4, 38.4, 27.6, 38.6)]
+        }},
+        {'type': 'Feature', 'properties': {'id': 'C'}, 'geometry': {
+            'type': 'MultiPolygon', 'coordinates': [[square(29.0, 38.0, 29.5, 38.5)], [square(30.0, 38.0, 30.5, 38.5)]]
+        }},
+    ]
+}
+
+
+class RegionTests(TestCase):
+    """Reports are assigned to the admin-boundary region containing them"""
+
+    def setUp(self):
+        cache.clear()
+        fd, path = tempfile.mkstemp(suffix='.geojson')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(REGIONS, f)
+        self.addCleanup(os.remove, path)
+        self.path = path
+
+        self.enterContext(override_settings(REGION_BOUNDARIES_FILE=path))
+        regions._region_index = None
+        self.addCleanup(setattr, regions, '_region_index', None)
+
+    def test_polygon_with_hole(self):
+        index = regions.RegionIndex.from_geojson(self.path)
+        self.assertEqual(index.assign(38.2, 27.2), 'A')
+        self.assertEqual(index.assign(38.5, 27.5), 'B')  # In A's hole
+        self.assertEqual(index.assign(38.65, 27.5), 'A')  # Beside the hole
+        self.assertEqual(index.assign(38.2, 29.2), 'C')
+        self.assertEqual(index.assign(38.2, 30.2), 'C')
+        self.assertIsNone(index.assign(38.2, 29.7))
+        self.assertIsNone(index.assign(40.0, 27.5))
+
+        # Without B, the hole belongs to no region
+        without_b = regions.RegionIndex([p for p in index.polygons if p.region_id != 'B'])
+        self.assertIsNone(without_b.assign(38.5, 27.5))
+
+    def test_unset_boundaries_file_is_warned_about(self):
+        with override_settings(REGION_BOUNDARIES_FILE=''), self.assertLogs('analytics.regions', 'WARNING') as logs:
+            self.assertIsNone(regions.assign_region(38.2, 27.2))
+        self.assertIn('REGION_BOUNDARIES_FILE is not set', logs.output[0])
+
+    def test_batch_matches_single_lookups(self):
+        index = regions.RegionIndex.from_geojson(self.path, cell_size=0.1)
+        rng = random.Random(1)
+        points = [(rng.uniform(37.9, 39.1), rng.uniform(26.9, 30.6)) for _ in range(500)] + [(None, 27.5)]
+        self.assertEqual(index.assign_many(points), [
+            None if latitude is None else index.assign(latitude, longitude) for latitude, longitude in points
+        ])
+        self.assertEqual(set(index.assign_many(points)), {'A', 'B', 'C', None})
+
+    def test_moved_report_gets_its_new_region(self):
+        user = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        report = EmergencyReport.objects.create(
+            reporter=user, reporter_type='VICTIM', description='Smoke', latitude=38.2, longitude=27.2
+        )
+        self.assertEqual(report.region, 'A')
+
+        report.latitude, report.longitude = 38.5, 27.5
+        report.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(EmergencyReport.objects.get(pk=report.pk).region, 'B')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.patch(f'/api/emergency/reports/{report.id}/', {'latitude': 38.2, 'longitude': 30.2},
+                                format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(EmergencyReport.objects.get(pk=report.pk).region, 'C')
+
+        report = EmergencyReport.objects.get(pk=report.pk)
+        report.latitude = report.longitude = None
+        report.save()
+        self.assertIsNone(EmergencyReport.objects.get(pk=report.pk).region)
+
+        # Other changes keep the region
+        EmergencyReport.objects.filter(pk=report.pk).update(region='manual', latitude=38.2, longitude=27.2)
+        report = EmergencyReport.objects.get(pk=report.pk)
+        report.description = 'Smoke and fire'
+        report.save()
+        self.assertEqual(EmergencyReport.objects.get(pk=report.pk).region, 'manual')
+
+
+class HistoryExportTests(RoutedReadsTestCase):
+    """Exports page through a dataset by primary key and stream every row once"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', role='CITIZEN', is_staff=True)
+        self.reports = [
+            EmergencyReport.objects.create(
+                reporter=self.admin, reporter_type='VICTIM', description=f'Report {i}',
+                latitude=38.4, longitude=27.1, region='izmir'
+            )
+            for i in range(23)
+        ]
+        self.ids = sorted(str(report.id) for report in self.reports)
+
+    def test_keyset_pages_cover_every_row_once(self):
+        # 23 rows end inside the last chunk, 20 exactly on a chunk boundary
+        for count in (23, 20):
+            queryset = EmergencyReport.objects.filter(pk__in=[report.pk for report in self.reports[:count]])
+            for chunk_size in (1, 5, 23, 100):
+                chunks = list(iter_keyset(queryset, ['id', 'description'], chunk_size))
+                self.assertTrue(all(0 < len(chunk) <= chunk_size for chunk in chunks))
+                ids = [str(row[0]) for chunk in chunks for row in chunk]
+                self.assertEqual(ids, sorted(str(report.id) for report in self.reports[:count]))
+
+    def test_rows_are_converted(self):
+        [row] = [row for chunk in iter_chunks('reports', chunk_size=5) for row in chunk if row[0] == self.ids[0]]
+        self.assertEqual(row[1], str(self.admin.id))
+        self.assertEqual(row[4:9], (38.4, 27.1, False, 'PENDING', 'izmir'))
+
+    def read_csv(self, data):
+        return list(csv.reader(io.StringIO(gzip.decompress(data).decode('utf-8'))))
+
+    def test_csv_export(self):
+        rows = self.read_csv(b''.join(stream_export('reports', 'csv', chunk_size=5)))
+        self.assertEqual(rows[0][:3], ['id', 'reporter_id', 'reporter_type'])
+        self.assertEqual([row[0] for row in rows[1:]], self.ids)
+
+    @skipUnless(parquet_available(), 'pyarrow is not installed')
+    def test_parquet_export(self):
+        import pyarrow.parquet as pq
+        table = pq.read_table(io.BytesIO(b''.join(stream_export('reports', 'parquet', chunk_size=5))))
+        self.assertEqual(table.num_rows, 23)
+        self.assertEqual(table.column('id').to_pylist(), self.ids)
+        self.assertEqual(set(table.column('region').to_pylist()), {'izmir'})
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/analytics/export/reports/', {'export_format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="reports.csv.gz"')
+        rows = self.read_csv(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 24)
+
+        # Only rows since the given date
+        EmergencyReport.objects.filter(pk=self.reports[0].pk).update(timestamp=timezone.now() - timedelta(days=10))
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = client.get('/api/analytics/export/reports/', {'export_format': 'csv', 'since': since})
+        self.assertEqual(len(self.read_csv(b''.join(response.streaming_content))), 23)
+
+        self.assertEqual(client.get('/api/analytics/export/users/').status_code, 404)
+        self.assertEqual(client.get('/api/analytics/export/reports/', {'export_format': 'xml'}).status_code, 400)
+        self.assertEqual(client.get('/api/analytics/export/reports/', {'since': 'yesterday'}).status_code, 400)
+
+        client.force_authenticate(User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN'))
+        self.assertEqual(client.get('/api/analytics/export/reports/').status_code, 403)
@@ -6,5 +6,7 @@ app_name = 'analytics'
 urlpatterns = [
     path('global/', views.GlobalAnalyticsView.as_view(), name='global_analytics'),
     path('regional/', views.RegionalAnalyticsView.as_view(), name='regional_analytics'),
+    path('timeseries/', views.TimeSeriesAnalyticsView.as_view(), name='timeseries_analytics'),
     path('user/', views.UserAnalyticsView.as_view(), name='user_analytics'),
+    path('export/<str:dataset>/', views.HistoryExportView.as_view(), name='history_export'),
 ]
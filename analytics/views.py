@@ -1,21 +1,50 @@
 from django.shortcuts import render
 from django.db.models import Sum, Avg, Count
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from rest_framework import generics, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 
 from .models import SystemMetric, RegionalMetric, UserActivity, EmergencyTypeMetric
+from .services import emergency_type_breakdown, regional_breakdown
+from .cubes import DIMENSIONS, time_series
+from .exports import DATASETS, FORMATS, resolve_format, stream_export
 from emergency.models import EmergencyReport
 from users.models import User
 from users.permissions import IsEmergencyService
+from config.caching import cached_response
+from config.db_routing import stream_with_routing
+
+# Analytics responses are cached per query parameters, and per role or user
+# where the data or the permission check depends on them (see config.caching)
+GLOBAL_ANALYTICS_CACHE_TIMEOUT = 300  # seconds
+ANALYTICS_CACHE_TIMEOUT = 60  # seconds
+
+# Longest range that can be requested with ?days=
+MAX_DAYS = 3650
+
+def parse_days(request, default=30):
+    """The ?days= query parameter, or None unless it is a whole number from 1 to MAX_DAYS"""
+    try:
+        days = int(request.query_params.get('days', default))
+    except ValueError:
+        return None
+    return days if 1 <= days <= MAX_DAYS else None
+
+def invalid_days():
+    return Response({'error': f'days must be a whole number from 1 to {MAX_DAYS}'},
+                   status=status.HTTP_400_BAD_REQUEST)
 
 class GlobalAnalyticsView(APIView):
     """Provides system-wide analytics data"""
     permission_classes = [permissions.IsAuthenticated]
+    read_replica = True  # See config.db_routing
     
+    @cached_response('analytics:global', GLOBAL_ANALYTICS_CACHE_TIMEOUT, per='role', depends_on=['reports'])
     def get(self, request):
         # Only admins and emergency services can see global analytics
         if not (request.user.is_staff or request.user.role in ['FIRE_STATION', 'POLICE', 'RED_CRESCENT']):
@@ -23,7 +52,9 @@ class GlobalAnalyticsView(APIView):
                            status=status.HTTP_403_FORBIDDEN)
         
         # Get date range from request or use default (last 30 days)
-        days = int(request.query_params.get('days', 30))
+        days = parse_days(request)
+        if days is None:
+            return invalid_days()
         start_date = timezone.now().date() - timedelta(days=days)
         
         # Get global metrics
@@ -71,78 +102,78 @@ class GlobalAnalyticsView(APIView):
             }
         
         # Add emergency type breakdown
-        emergency_types = EmergencyTypeMetric.objects.filter(date__gte=start_date)
-        type_data = {}
-        
-        if emergency_types.exists():
-            for e_type in emergency_types:
-                if e_type.emergency_type not in type_data:
-                    type_data[e_type.emergency_type] = {
-                        'count': 0,
-                        'avg_response_time': 0,
-                        'resolution_rate': 0
-                    }
-                
-                type_data[e_type.emergency_type]['count'] += e_type.count
-                # Average the averages properly
-                if type_data[e_type.emergency_type]['avg_response_time'] > 0:
-                    type_data[e_type.emergency_type]['avg_response_time'] = (
-                        type_data[e_type.emergency_type]['avg_response_time'] + e_type.avg_response_time
-                    ) / 2
-                else:
-                    type_data[e_type.emergency_type]['avg_response_time'] = e_type.avg_response_time
-                
-                type_data[e_type.emergency_type]['resolution_rate'] = e_type.resolution_rate
-        else:
-            # Calculate on the fly from emergency reports
-            from emergency.models import EmergencyTag
-            for tag in EmergencyTag.objects.all():
-                reports = EmergencyReport.objects.filter(
-                    tags=tag,
-                    timestamp__date__gte=start_date
-                )
-                resolved = reports.filter(status='RESOLVED').count()
-                total = reports.count()
-                
-                if total > 0:
-                    type_data[tag.emergency_type] = {
-                        'count': total,
-                        'resolution_rate': round(resolved / total * 100, 2)
-                    }
+        type_data = emergency_type_breakdown(start_date)
         
         data['emergency_types'] = type_data
         
         return Response(data)
 
+class TimeSeriesAnalyticsView(APIView):
+    """
+    Report counts bucketed per hour or per day, split by type, status or region.
+    Served from the pre-aggregated report cubes.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    read_replica = True
+    
+    # Longest range served at hourly granularity
+    MAX_HOURLY_DAYS = 31
+    
+    @cached_response('analytics:timeseries', ANALYTICS_CACHE_TIMEOUT, per='role', depends_on=['reports'])
+    def get(self, request):
+        if not (request.user.is_staff or request.user.role in ['FIRE_STATION', 'POLICE', 'RED_CRESCENT']):
+            return Response({"detail": "You don't have permission to access global analytics"},
+                           status=status.HTTP_403_FORBIDDEN)
+        
+        days = parse_days(request)
+        if days is None:
+            return invalid_days()
+        granularity = request.query_params.get('granularity', 'day')
+        group_by = request.query_params.get('group_by', 'type')
+        
+        if granularity not in ['hour', 'day']:
+            return Response({'error': 'granularity must be one of hour, day'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        if group_by not in DIMENSIONS:
+            return Response({'error': f'group_by must be one of {list(DIMENSIONS)}'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        if granularity == 'hour' and days > self.MAX_HOURLY_DAYS:
+            return Response({'error': f'Hourly buckets are limited to {self.MAX_HOURLY_DAYS} days, use granularity=day'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        
+        # Optional filters on the other dimensions, e.g. ?type=FIRE&status=PENDING
+        filters = {
+            dimension: request.query_params[dimension]
+            for dimension in DIMENSIONS
+            if dimension in request.query_params
+        }
+        
+        start = timezone.now() - timedelta(days=days)
+        if granularity == 'day':
+            start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        return Response({
+            'period': f'Last {days} days',
+            'granularity': granularity,
+            'group_by': group_by,
+            'buckets': time_series(start, granularity, group_by, filters)
+        })
+
 class RegionalAnalyticsView(APIView):
     """Provides analytics data by region"""
     permission_classes = [permissions.IsAuthenticated, IsEmergencyService]
+    read_replica = True
     
+    @cached_response('analytics:regional', ANALYTICS_CACHE_TIMEOUT)
     def get(self, request):
         # Get date range from request or use default (last 30 days)
-        days = int(request.query_params.get('days', 30))
+        days = parse_days(request)
+        if days is None:
+            return invalid_days()
         start_date = timezone.now().date() - timedelta(days=days)
         
-        # Get regional metrics
-        regional_metrics = RegionalMetric.objects.filter(date__gte=start_date)
-        
-        # Aggregate by region
-        region_data = {}
-        for metric in regional_metrics:
-            if metric.region not in region_data:
-                region_data[metric.region] = {
-                    'emergency_count': 0,
-                    'response_time_avg': 0
-                }
-            
-            region_data[metric.region]['emergency_count'] += metric.emergency_count
-            # Average the averages properly
-            if region_data[metric.region]['response_time_avg'] > 0:
-                region_data[metric.region]['response_time_avg'] = (
-                    region_data[metric.region]['response_time_avg'] + metric.response_time_avg
-                ) / 2
-            else:
-                region_data[metric.region]['response_time_avg'] = metric.response_time_avg
+        # Aggregate by region, weighting each day's average by its report count
+        region_data = regional_breakdown(start_date)
         
         return Response({
             'period': f'Last {days} days',
@@ -152,10 +183,15 @@ class RegionalAnalyticsView(APIView):
 class UserAnalyticsView(APIView):
     """Provides analytics data for the current user"""
     permission_classes = [permissions.IsAuthenticated]
+    read_replica = True
     
+    @cached_response('analytics:user', ANALYTICS_CACHE_TIMEOUT, per='user',
+                     depends_on=['reports:user', 'notifications:user'])
     def get(self, request):
         # Get date range from request or use default (last 30 days)
-        days = int(request.query_params.get('days', 30))
+        days = parse_days(request)
+        if days is None:
+            return invalid_days()
         start_date = timezone.now().date() - timedelta(days=days)
         
         # Get user activity
@@ -210,3 +246,38 @@ class UserAnalyticsView(APIView):
             }
         
         return Response(data)
+
+class HistoryExportView(APIView):
+    """
+    Stream a full dataset export (reports, transitions or locations) as
+    Parquet, or gzipped CSV when pyarrow is not installed. Admin only.
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    read_replica = True
+    
+    def get(self, request, dataset):
+        if dataset not in DATASETS:
+            return Response({'error': f'Unknown dataset. Must be one of {list(DATASETS)}'},
+                           status=status.HTTP_404_NOT_FOUND)
+        
+        export_format = request.query_params.get('export_format', 'parquet')
+        if export_format not in FORMATS:
+            return Response({'error': f'export_format must be one of {list(FORMATS)}'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        export_format = resolve_format(export_format)
+        
+        since = None
+        if request.query_params.get('since'):
+            since_date = parse_date(request.query_params['since'])
+            if since_date is None:
+                return Response({'error': 'since must be a date in YYYY-MM-DD format'},
+                               status=status.HTTP_400_BAD_REQUEST)
+            since = timezone.make_aware(datetime.combine(since_date, time.min))
+        
+        content_type = 'application/vnd.apache.parquet' if export_format == 'parquet' else 'application/gzip'
+        response = StreamingHttpResponse(
+            stream_with_routing(stream_export(dataset, export_format, since=since)),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="{dataset}{FORMATS[export_format]}"'
+        return response
@@ -1,8 +1,76 @@
 import google.generativeai as genai
+import threading
+from asgiref.sync import sync_to_async
+from contextlib import asynccontextmanager
 from django.conf import settings
+from django.core.cache import cache
 from typing import Dict, List, Optional
 import json
+import logging
 from .models import ChatSession
+from monitoring.metrics import chatbot_response_seconds, chatbot_response_total
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_RESPONSE = "I'm sorry, I'm having trouble processing your request right now. For immediate emergencies, please call your local emergency services."
+
+
+class ChatBusy(Exception):
+    """No free chat slot for the user ('user') or in this worker process ('worker')"""
+
+    def __init__(self, scope):
+        super().__init__(scope)
+        self.scope = scope
+
+
+def user_slots_key(user_id):
+    return f'chatbot:in-flight:{user_id}'
+
+
+class ChatLimiter:
+    """
+    Bounds the model calls in flight, so chat traffic cannot take over the
+    workers serving emergency endpoints: CHATBOT_MAX_CONCURRENT_PER_USER
+    per user (counted in the cache, shared by all workers with a shared
+    backend) and CHATBOT_MAX_CONCURRENT per worker process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        """Hold a slot for one model call, or raise ChatBusy without waiting"""
+        with self._lock:
+            if self.in_flight >= settings.CHATBOT_MAX_CONCURRENT:
+                raise ChatBusy('worker')
+            self.in_flight += 1
+        try:
+            key = user_slots_key(user_id)
+            # Expires so that slots of a worker that died are eventually freed
+            timeout = settings.CHATBOT_TIMEOUT * 2
+            await cache.aadd(key, 0, timeout)
+            try:
+                count = await cache.aincr(key)
+            except ValueError:  # Expired since add()
+                await cache.aset(key, 1, timeout)
+                count = 1
+            try:
+                if count > settings.CHATBOT_MAX_CONCURRENT_PER_USER:
+                    raise ChatBusy('user')
+                yield
+            finally:
+                try:
+                    await cache.adecr(key)
+                except ValueError:
+                    pass  # Expired, nothing left to release
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+chat_limiter = ChatLimiter()
 
 class ChatbotService:
     def __init__(self):
@@ -54,6 +122,18 @@ class ChatbotService:
             for i, session in enumerate(reversed(recent_sessions))
         ]
     
+    def build_prompt(self, user, message: str) -> str:
+        """Context prompt followed by the user's role and message"""
+        # Create user context based on role
+        user_context = f"""
+            User Information:
+            - Role: {user.role}
+            - Username: {user.username}
+            
+            User Message: {message}
+            """
+        return f"{self.context_prompt}\n\n{user_context}"
+    
     def generate_response(self, user, message: str) -> str:
         """Generate AI response with session context"""
         try:
@@ -63,24 +143,40 @@ class ChatbotService:
             # Start chat with context
             chat = self.model.start_chat(history=history)
             
-            # Create user context based on role
-            user_context = f"""
-            User Information:
-            - Role: {user.role}
-            - Username: {user.username}
+            # Generate response
+            with chatbot_response_seconds.time():
+                response = chat.send_message(
+                    self.build_prompt(user, message),
+                    request_options={'timeout': settings.CHATBOT_TIMEOUT}
+                )
             
-            User Message: {message}
-            """
+            chatbot_response_total.inc(result='success')
+            return response.text
             
-            # Generate response
-            full_prompt = f"{self.context_prompt}\n\n{user_context}"
-            response = chat.send_message(full_prompt)
+        except Exception:
+            chatbot_response_total.inc(result='error')
+            logger.exception("Error generating AI response")
+            return FALLBACK_RESPONSE
+    
+    async def agenerate_response(self, user, message: str) -> str:
+        """generate_response() for async views: awaits the model instead of holding a thread"""
+        try:
+            history = await sync_to_async(self.get_user_sessions)(user)
+            chat = self.model.start_chat(history=history)
+            
+            with chatbot_response_seconds.time():
+                response = await chat.send_message_async(
+                    self.build_prompt(user, message),
+                    request_options={'timeout': settings.CHATBOT_TIMEOUT}
+                )
             
+            chatbot_response_total.inc(result='success')
             return response.text
             
-        except Exception as e:
-            print(f"Error generating AI response: {str(e)}")
-            return "I'm sorry, I'm having trouble processing your request right now. For immediate emergencies, please call your local emergency services."
+        except Exception:
+            chatbot_response_total.inc(result='error')
+            logger.exception("Error generating AI response")
+            return FALLBACK_RESPONSE
     
     def save_chat_session(self, user, message: str, response: str) -> ChatSession:
         """Save chat session to database"""
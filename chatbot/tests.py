@@ -1,3 +1,104 @@
-from django.test import TestCase
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import google.generativeai as genai
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+from .models import ChatSession
+from .services import chat_limiter, user_slots_key
+
+
+async def answer(chat, content, **kwargs):
+    return SimpleNamespace(text='Stay calm and call 112')
+
+
+class ChatEndpointTests(TestCase):
+    """The chat endpoints await the model (patched here) in async views"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.client = APIClient()
+        self.client.force_authenticate(self.citizen)
+        patcher = mock.patch.object(genai.ChatSession, 'send_message_async', answer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_send_message(self):
+        response = self.client.post('/api/chatbot/sessions/send_message/', {'message': ' Fire! '}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['message'], 'Fire!')
+        self.assertEqual(response.json()['response'], 'Stay calm and call 112')
+        session = ChatSession.objects.get(user=self.citizen)
+        self.assertEqual(str(session.id), response.json()['id'])
+
+        response = self.client.post('/api/chatbot/sessions/send_message/', {'message': ' '}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('message', response.json())
+
+    def test_chat(self):
+        response = self.client.post('/api/chatbot/chat/', {'message': 'Fire!'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user_role'], 'CITIZEN')
+        self.assertEqual(ChatSession.objects.filter(user=self.citizen).count(), 1)
+
+        response = self.client.post('/api/chatbot/chat/', {'message': ''}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_authentication_required(self):
+        response = APIClient().post('/api/chatbot/chat/', {'message': 'Fire!'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+        response = APIClient().get('/api/chatbot/chat/')
+        self.assertEqual(response.status_code, 405)
+
+    def test_one_message_per_user_at_a_time(self):
+        # A message of the user is still being answered, e.g. by another worker
+        cache.set(user_slots_key(self.citizen.pk), 1)
+        response = self.client.post('/api/chatbot/chat/', {'message': 'Fire!'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(cache.get(user_slots_key(self.citizen.pk)), 1)
+
+        cache.delete(user_slots_key(self.citizen.pk))
+        response = self.client.post('/api/chatbot/chat/', {'message': 'Fire!'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.get(user_slots_key(self.citizen.pk)), 0)
+
+    @override_settings(CHATBOT_MAX_CONCURRENT=0)
+    def test_worker_limit(self):
+        response = self.client.post('/api/chatbot/sessions/send_message/', {'message': 'Fire!'}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(chat_limiter.in_flight, 0)
+        self.assertFalse(ChatSession.objects.exists())
+
+    async def test_model_calls_overlap_under_asgi(self):
+        users = [await sync_to_async(User.objects.create_user)(f'user{i}', f'user{i}@example.com', 'pass', role='CITIZEN')
+                 for i in range(3)]
+        started = []
+        all_started = asyncio.Event()
+
+        async def slow_answer(chat, content, **kwargs):
+            started.append(content)
+            if len(started) == len(users):
+                all_started.set()
+            # Only returns if every request is waiting for the model at once
+            await asyncio.wait_for(all_started.wait(), 5)
+            return SimpleNamespace(text='Stay calm and call 112')
+
+        def post(user):
+            return self.async_client.post(
+                '/api/chatbot/chat/', {'message': 'Fire!'}, content_type='application/json',
+                headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+            )
+
+        with mock.patch.object(genai.ChatSession, 'send_message_async', slow_answer):
+            responses = await asyncio.gather(*(post(user) for user in users))
+        self.assertEqual([response.status_code for response in responses], [200] * len(users))
+        self.assertEqual({response.json()['response'] for response in responses}, {'Stay calm and call 112'})
+        self.assertEqual(await ChatSession.objects.acount(), len(users))
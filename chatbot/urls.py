@@ -1,13 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ChatViewSet, ChatBotAPIView, get_chat_stats
+from .views import ChatViewSet, chat, send_message, get_chat_stats
 
 router = DefaultRouter()
 router.register(r'sessions', ChatViewSet, basename='chat-sessions')
 
 
 urlpatterns = [
-    path('chat/', ChatBotAPIView.as_view(), name='chatbot'),
+    path('chat/', chat, name='chatbot'),
+    # Async view, routed ahead of the ChatViewSet routes
+    path('sessions/send_message/', send_message, name='chat-sessions-send-message'),
     path('stats/', get_chat_stats, name='chat-stats'),
     path('', include(router.urls)),
 ]
@@ -1,5 +1,9 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
 from django.shortcuts import render
-from rest_framework import status, permissions
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import exceptions, status, permissions
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -8,7 +12,7 @@ from rest_framework import mixins
 from django.shortcuts import get_object_or_404
 from .models import ChatSession
 from .serializers import ChatSessionSerializer, ChatMessageSerializer, ChatResponseSerializer
-from .services import ChatbotService
+from .services import ChatBusy, ChatbotService, chat_limiter
 from users.models import User
 
 class ChatViewSet(mixins.CreateModelMixin,
@@ -24,39 +28,6 @@ class ChatViewSet(mixins.CreateModelMixin,
     def get_queryset(self):
         return ChatSession.objects.filter(user=self.request.user).order_by('-timestamp')
     
-    @action(detail=False, methods=['post'])
-    def send_message(self, request):
-        """Send a message to the chatbot and get AI response"""
-        serializer = ChatMessageSerializer(data=request.data)
-        
-        if serializer.is_valid():
-            message = serializer.validated_data['message']
-            
-            # Initialize chatbot service
-            chatbot_service = ChatbotService()
-            
-            # Generate AI response
-            ai_response = chatbot_service.generate_response(request.user, message)
-            
-            # Save chat session
-            chat_session = chatbot_service.save_chat_session(
-                user=request.user,
-                message=message,
-                response=ai_response
-            )
-            
-            # Return response
-            response_serializer = ChatResponseSerializer({
-                'id': chat_session.id,
-                'message': message,
-                'response': ai_response,
-                'timestamp': chat_session.timestamp
-            })
-            
-            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
-        
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
     @action(detail=False, methods=['get'])
     def quick_responses(self, request):
         """Get predefined quick responses for emergency scenarios"""
@@ -90,49 +61,125 @@ class ChatViewSet(mixins.CreateModelMixin,
             status=status.HTTP_200_OK
         )
 
-class ChatBotAPIView(APIView):
+# The chat endpoints are async views rather than DRF views, so that under
+# ASGI (config.asgi) waiting for the model holds no worker thread. Only
+# authentication, validation and database access run in threads.
+
+def authenticate(request):
     """
-    Simple API view for chat interactions
+    Authenticate and parse a request to a plain Django view like an APIView
+    would. Returns (DRF request, None) or (None, error response).
     """
-    permission_classes = [permissions.IsAuthenticated]
+    view = APIView()
+    api_request = view.initialize_request(request)
+    try:
+        if not api_request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        api_request.data  # Parsed here, so a ParseError is handled too
+    except exceptions.APIException as exc:
+        response = JsonResponse({'detail': exc.detail}, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            header = view.get_authenticate_header(api_request)
+            if header:
+                response.status_code = status.HTTP_401_UNAUTHORIZED
+                response['WWW-Authenticate'] = header
+        return None, response
+    return api_request, None
+
+def busy_response(exc):
+    if exc.scope == 'user':
+        return JsonResponse(
+            {'error': 'Please wait for the answer to your previous message'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+    return JsonResponse(
+        {'error': 'The chatbot is busy, please try again shortly. For immediate emergencies, please call your local emergency services.'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+async def chat_reply(user, message):
+    """Generate and save the AI response, holding a chat slot while the model answers"""
+    chatbot_service = ChatbotService()
+    async with chat_limiter.slot(user.pk):
+        ai_response = await chatbot_service.agenerate_response(user, message)
+    chat_session = await sync_to_async(chatbot_service.save_chat_session)(
+        user=user,
+        message=message,
+        response=ai_response
+    )
+    return chat_session, ai_response
+
+def read_send_message(request):
+    """Returns (user, message, None) or (None, None, error response)"""
+    api_request, error = authenticate(request)
+    if error:
+        return None, None, error
+    serializer = ChatMessageSerializer(data=api_request.data)
+    if not serializer.is_valid():
+        return None, None, JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return api_request.user, serializer.validated_data['message'], None
+
+@csrf_exempt
+@require_POST
+async def send_message(request):
+    """Send a message to the chatbot and get AI response"""
+    user, message, error = await sync_to_async(read_send_message)(request)
+    if error:
+        return error
     
-    def post(self, request):
-        """Send message and get response"""
-        message = request.data.get('message', '').strip()
-        
-        if not message:
-            return Response(
-                {'error': 'Message cannot be empty'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Initialize chatbot service
-        chatbot_service = ChatbotService()
-        
-        try:
-            # Generate AI response
-            ai_response = chatbot_service.generate_response(request.user, message)
-            
-            # Save chat session
-            chat_session = chatbot_service.save_chat_session(
-                user=request.user,
-                message=message,
-                response=ai_response
-            )
-            
-            return Response({
-                'id': str(chat_session.id),
-                'message': message,
-                'response': ai_response,
-                'timestamp': chat_session.timestamp.isoformat(),
-                'user_role': request.user.role
-            }, status=status.HTTP_200_OK)
-            
-        except Exception as e:
-            return Response(
-                {'error': 'Failed to process message', 'details': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    try:
+        chat_session, ai_response = await chat_reply(user, message)
+    except ChatBusy as exc:
+        return busy_response(exc)
+    
+    # Return response
+    response_serializer = ChatResponseSerializer({
+        'id': chat_session.id,
+        'message': message,
+        'response': ai_response,
+        'timestamp': chat_session.timestamp
+    })
+    
+    return JsonResponse(response_serializer.data, status=status.HTTP_201_CREATED)
+
+def read_chat(request):
+    """Returns (user, message, None) or (None, None, error response)"""
+    api_request, error = authenticate(request)
+    if error:
+        return None, None, error
+    return api_request.user, str(api_request.data.get('message', '')).strip(), None
+
+@csrf_exempt
+@require_POST
+async def chat(request):
+    """Send message and get response"""
+    user, message, error = await sync_to_async(read_chat)(request)
+    if error:
+        return error
+    
+    if not message:
+        return JsonResponse(
+            {'error': 'Message cannot be empty'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        chat_session, ai_response = await chat_reply(user, message)
+    except ChatBusy as exc:
+        return busy_response(exc)
+    except Exception as e:
+        return JsonResponse(
+            {'error': 'Failed to process message', 'details': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+    return JsonResponse({
+        'id': str(chat_session.id),
+        'message': message,
+        'response': ai_response,
+        'timestamp': chat_session.timestamp.isoformat(),
+        'user_role': user.role
+    }, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -2,6 +2,10 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with gunicorn's uvicorn worker class (both in the Pipfile), so the
+async chat views wait for the model without holding a thread:
+
+    gunicorn config.asgi:application -k uvicorn_worker.UvicornWorker --workers 4
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
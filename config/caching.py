@@ -0,0 +1,138 @@
+"""
+Cache-aside helpers over the default cache (see CACHES in settings).
+
+Cached values are keyed by a name, the key parts (per user, per role,
+request parameters) and the current versions of the data they depend on.
+Versions are cache keys too: invalidate('reports', user_id) replaces the
+global 'reports' version and that user's, so every value built from the old
+data is never read again and simply expires.
+
+A dependency is a namespace ('reports', the version shared by everyone) or
+a namespace followed by ':user' ('reports:user', the version of the request
+user's own data).
+
+On a miss a single caller per key recomputes the value (single flight):
+the others wait up to CACHE_LOCK_WAIT seconds for it rather than all
+running the same queries at once, e.g. right after an invalidation.
+
+Hits, misses and waits are counted per name in resq_cache_requests_total.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from monitoring.metrics import cache_fill_seconds, cache_requests_total
+
+# Interval at which callers waiting for another one's value poll the cache
+LOCK_POLL_INTERVAL = 0.02  # seconds
+
+
+def version_key(namespace, scope=None):
+    if scope is None:
+        return f'cache:version:{namespace}'
+    return f'cache:version:{namespace}:{scope}'
+
+
+def invalidate(namespace, user_id=None):
+    """Outdate the values depending on a namespace (and on one user's data in it)"""
+    keys = [version_key(namespace)]
+    if user_id is not None:
+        keys.append(version_key(namespace, user_id))
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+
+def versions(keys):
+    """Current version of each version key, created on first use"""
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, uuid.uuid4().hex, None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _version_keys(depends_on, user_id):
+    keys = []
+    for dependency in depends_on:
+        namespace, _, scope = dependency.partition(':')
+        keys.append(version_key(namespace, user_id) if scope == 'user' else version_key(namespace))
+    return keys
+
+
+def get_or_set(name, compute, timeout, parts=(), depends_on=(), user_id=None):
+    """
+    The cached value of compute() for name and parts, computed on a miss by
+    a single caller at a time. user_id scopes ':user' dependencies.
+    """
+    key = ':'.join(['cache', name, *versions(_version_keys(depends_on, user_id)), *map(str, parts)])
+    value = cache.get(key)
+    if value is not None:
+        cache_requests_total.inc(cache=name, result='hit')
+        return value
+
+    lock = f'{key}:lock'
+    if not cache.add(lock, True, settings.CACHE_LOCK_TIMEOUT):
+        deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            found = cache.get_many([key, lock])
+            if found.get(key) is not None:
+                cache_requests_total.inc(cache=name, result='wait')
+                return found[key]
+            if lock not in found:
+                break  # Released without a value to share, e.g. an error response
+        # The other caller failed or is too slow, compute without the lock
+
+    cache_requests_total.inc(cache=name, result='miss')
+    try:
+        with cache_fill_seconds.time(cache=name):
+            value = compute()
+        if value is not None:
+            cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock)
+    return value
+
+
+def user_role(user):
+    return 'STAFF' if user.is_staff else user.role
+
+
+def cached_response(name, timeout, per=None, depends_on=()):
+    """
+    Cache the data of successful responses of an APIView get method.
+
+    The key includes the query parameters and URL arguments, and with
+    per='user' the user id or with per='role' the user's role (STAFF for
+    staff users). A hit skips the method, so a method that checks
+    permissions itself must be cached per user or per role.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            parts = []
+            if per == 'user':
+                parts.append(request.user.pk)
+            elif per == 'role':
+                parts.append(user_role(request.user))
+            arguments = sorted(kwargs.items()) + sorted(request.query_params.items())
+            parts.append(hashlib.md5(repr(arguments).encode()).hexdigest())
+
+            errors = []
+            def compute():
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    errors.append(response)
+                    return None  # Not cached
+                return response.data
+
+            data = get_or_set(name, compute, timeout, parts, depends_on, user_id=request.user.pk)
+            return errors[0] if errors else Response(data)
+        return wrapper
+    return decorator
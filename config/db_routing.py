@@ -0,0 +1,169 @@
+"""
+Read replica routing.
+
+Reads go to a replica in READ_REPLICAS only while a request that allows it
+is being handled:
+- GET and HEAD requests to the list and retrieve actions of viewsets;
+- GET and HEAD requests to views with `read_replica = True` (analytics and
+  dashboards).
+Every other read, and every write, uses the primary ('default'). Views that
+stream their response wrap the body in stream_with_routing, so its reads are
+routed the same way.
+
+Read your writes: once a request has written, its later reads use the
+primary. Its user is then pinned to the primary for READ_REPLICA_PIN_SECONDS,
+longer than the expected replication lag, so the next requests see the
+write too. The pin is a cache key, shared by all workers with a shared cache
+backend.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import LazyObject, empty
+
+REPLICA_ACTIONS = {'list', 'retrieve'}
+
+_routing = ContextVar('db_routing', default=None)
+
+
+def pin_key(user_id):
+    return f'db:pinned:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), True, settings.READ_REPLICA_PIN_SECONDS)
+
+
+class RequestRouting:
+    """Routing state of the request being handled"""
+
+    def __init__(self, request):
+        self.request = request
+        self.replica = False
+        self.wrote = False
+        self.pinned = None  # Looked up once the user is known
+
+    def user(self):
+        """The authenticated user, or None while unknown or anonymous"""
+        user = self.request.__dict__.get('user')
+        # Not evaluated yet: resolving it here would itself query the database
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            return None
+        if user is None or not user.is_authenticated:
+            return None
+        return user
+
+    def use_replica(self):
+        if not self.replica or self.wrote:
+            return False
+        if self.pinned is None:
+            user = self.user()
+            if user is None:
+                return True
+            self.pinned = bool(cache.get(pin_key(user.pk)))
+        return not self.pinned
+
+
+def allows_replica(request, view_func):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        return actions.get(request.method.lower()) in REPLICA_ACTIONS
+    return getattr(getattr(view_func, 'cls', None), 'read_replica', False)
+
+
+def stream_with_routing(iterable):
+    """
+    Iterate over a streaming response body with the routing state of the
+    request that creates it. The body is consumed after ReadReplicaMiddleware
+    has returned, so its queries would otherwise all use the primary.
+    """
+    routing = _routing.get()  # Now, not on the first chunk
+
+    def iterate():
+        iterator = iter(iterable)
+        while True:
+            # Set around each step: a server may consume every chunk in another context
+            token = _routing.set(routing)
+            try:
+                chunk = next(iterator, None)
+            finally:
+                _routing.reset(token)
+            if chunk is None:
+                return
+            yield chunk
+
+    return iterate()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.READ_REPLICAS:
+            return None
+        routing = _routing.get()
+        if routing is not None and routing.use_replica():
+            return random.choice(settings.READ_REPLICAS)
+        # Also for related objects of instances loaded from a replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+class ReadReplicaMiddleware:
+    """Tracks the routing state of each request and pins users to the primary after a write"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = RequestRouting(request)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        self.pin_writer(routing)
+        return response
+
+    async def __acall__(self, request):
+        # The routing state reaches the sync_to_async code of the request
+        # through the context
+        routing = RequestRouting(request)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        await sync_to_async(self.pin_writer)(routing)
+        return response
+
+    def pin_writer(self, routing):
+        if routing.wrote:
+            user = routing.user()
+            if user is not None:
+                pin_to_primary(user.pk)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = _routing.get()
+        if routing is not None:
+            routing.replica = allows_replica(request, view_func)
+        return None
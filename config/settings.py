@@ -56,6 +56,11 @@ FIREBASE_CONFIG = {
 
 # Gemini AI Configuration
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
+CHATBOT_TIMEOUT = config('CHATBOT_TIMEOUT', default=30, cast=int)  # Seconds a model call may take
+# Counted in the default cache: across workers only with a shared cache (REDIS_URL),
+# with the per-process LocMemCache each worker process allows this many per user
+CHATBOT_MAX_CONCURRENT_PER_USER = config('CHATBOT_MAX_CONCURRENT_PER_USER', default=1, cast=int)  # Messages of one user answered at a time, others get 429
+CHATBOT_MAX_CONCURRENT = config('CHATBOT_MAX_CONCURRENT', default=50, cast=int)  # Model calls per worker process, others get 503; keep below the thread count under WSGI
 
 DATABASES = {
     'default': {
@@ -65,8 +70,30 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='3306'),
+        # Reuse each thread's connection across requests instead of reconnecting every request
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),  # Seconds, below MySQL wait_timeout; 0 disables
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),  # Ping a reused connection before its first query of a request
+        'OPTIONS': {
+            'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),  # Seconds
+        },
     }
 }
+
+# Optional read replica for analytics, dashboards and list/retrieve requests (see config.db_routing)
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+if DB_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DB_REPLICA_HOST,
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'USER': config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        'TEST': {'MIRROR': 'default'},  # Tests have no replication
+    }
+READ_REPLICAS = ['replica'] if DB_REPLICA_HOST else []
+READ_REPLICA_PIN_SECONDS = config('READ_REPLICA_PIN_SECONDS', default=5, cast=int)  # Reads of a user stay on the primary this long after a write
+DATABASE_ROUTERS = ['config.db_routing.ReplicaRouter']
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -90,9 +117,12 @@ INSTALLED_APPS = [
     'analytics',
     'django_filters',
     'firebase_auth',
+    'monitoring',
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.QueryStatsMiddleware',  # First, so latency covers the whole stack
+    'config.db_routing.ReadReplicaMiddleware',  # Before any middleware that queries the database
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  
@@ -122,6 +152,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'  # Served by uvicorn workers, see config/asgi.py
 
 
 # Database
@@ -192,6 +223,83 @@ SOCIAL_MEDIA = {
     }
 }
 
+# Admin-boundary polygons (GeoJSON FeatureCollection) used to assign reports to regions.
+# Not shipped with the code: without it reports get no region and regional metrics stay empty
+REGION_BOUNDARIES_FILE = config('REGION_BOUNDARIES_FILE', default='')
+REGION_ID_PROPERTY = config('REGION_ID_PROPERTY', default='id')  # Feature property holding the region id
+REGION_GRID_CELL_SIZE = config('REGION_GRID_CELL_SIZE', default=0.25, cast=float)  # Spatial index cell size in degrees
+
+# Incident clustering: reports within this distance and time of an incident's
+# latest report, sharing an emergency type, are grouped into that incident
+INCIDENT_CLUSTER_RADIUS_KM = config('INCIDENT_CLUSTER_RADIUS_KM', default=1.0, cast=float)
+INCIDENT_CLUSTER_WINDOW_MINUTES = config('INCIDENT_CLUSTER_WINDOW_MINUTES', default=120, cast=int)
+
+# Dispatch recommender: grid cell size (degrees) of the station position index
+DISPATCH_GRID_CELL_SIZE = config('DISPATCH_GRID_CELL_SIZE', default=0.1, cast=float)
+
+# Offline routing: road graph built with `manage.py build_road_graph` (or an .osm extract)
+ROAD_GRAPH_FILE = config('ROAD_GRAPH_FILE', default=os.path.join(BASE_DIR, 'map_services', 'data', 'road_graph.bin'))
+ROUTING_SNAP_DISTANCE_M = config('ROUTING_SNAP_DISTANCE_M', default=1000, cast=float)  # Max distance from a location to the road network
+
+# Hazard-aware routing: travel time multipliers for roads near active emergencies
+HAZARD_RADIUS_M = config('HAZARD_RADIUS_M', default=500, cast=float)
+HAZARD_PENALTY = config('HAZARD_PENALTY', default=3.0, cast=float)
+HAZARD_BLOCK_RADIUS_M = config('HAZARD_BLOCK_RADIUS_M', default=150, cast=float)  # Effectively closed unless the destination is inside
+HAZARD_BLOCK_PENALTY = config('HAZARD_BLOCK_PENALTY', default=100.0, cast=float)
+ROUTE_CACHE_MAX_BYTES = config('ROUTE_CACHE_MAX_BYTES', default=16 * 1024 * 1024, cast=int)  # Per worker process
+
+# Map tiles of clustered active reports (/api/map/tiles/{z}/{x}/{y}/)
+MAP_TILE_MAX_ZOOM = config('MAP_TILE_MAX_ZOOM', default=18, cast=int)
+MAP_TILE_CLUSTER_GRID = config('MAP_TILE_CLUSTER_GRID', default=8, cast=int)  # Cluster cells per tile side (32 px on 256 px tiles)
+MAP_TILE_CACHE_TIMEOUT = config('MAP_TILE_CACHE_TIMEOUT', default=3600, cast=int)  # Seconds; report changes invalidate their tiles
+
+# Cluster index of active reports and emergency locations (/api/map/clusters/)
+MAP_CLUSTER_MAX_ZOOM = config('MAP_CLUSTER_MAX_ZOOM', default=16, cast=int)  # Points are returned unclustered beyond this zoom
+MAP_CLUSTER_RADIUS_PX = config('MAP_CLUSTER_RADIUS_PX', default=64, cast=int)  # Cluster cell width in screen pixels
+MAP_CLUSTER_JOURNAL_MAX = config('MAP_CLUSTER_JOURNAL_MAX', default=10000, cast=int)  # Workers further behind rebuild from the database
+MAP_CLUSTER_JOURNAL_TIMEOUT = config('MAP_CLUSTER_JOURNAL_TIMEOUT', default=86400, cast=int)
+
+# Per-request query statistics (monitoring.middleware.QueryStatsMiddleware)
+QUERY_STATS_ENABLED = config('QUERY_STATS_ENABLED', default=True, cast=bool)
+QUERY_STATS_HEADERS = config('QUERY_STATS_HEADERS', default=DEBUG, cast=bool)  # X-DB-* response headers
+QUERY_COUNT_WARNING = config('QUERY_COUNT_WARNING', default=50, cast=int)  # Log requests running more queries
+QUERY_DUPLICATE_WARNING = config('QUERY_DUPLICATE_WARNING', default=10, cast=int)  # Log requests repeating one query this often
+SLOW_REQUEST_WARNING_MS = config('SLOW_REQUEST_WARNING_MS', default=1000, cast=float)
+
+# Prometheus metrics at /metrics (monitoring.metrics)
+METRICS_MULTIPROC_DIR = config('METRICS_MULTIPROC_DIR', default='')  # Shared by the workers of a host; empty for one process
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=1.0, cast=float)  # Seconds between per-worker writes
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # If set, scrapes must send "Authorization: Bearer <token>"
+
+# Cache shared by the workers with REDIS_URL (needs the redis package), else one per process
+REDIS_URL = config('REDIS_URL', default='')  # e.g. redis://localhost:6379/0
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'resq',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'resq',
+            'OPTIONS': {
+                # Room for the whole cluster journal, cached map tiles, cache-aside
+                # values with their version keys and chat slots. The default of
+                # 300 entries would evict journal entries and version keys.
+                'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=MAP_CLUSTER_JOURNAL_MAX + 40000, cast=int),
+                'CULL_FREQUENCY': 10,  # Drop the least recently used tenth when full
+            },
+        }
+    }
+
+# Cache-aside values (config.caching)
+CACHE_LOCK_TIMEOUT = config('CACHE_LOCK_TIMEOUT', default=30, cast=int)  # Seconds a caller may hold the recompute lock of a key
+CACHE_LOCK_WAIT = config('CACHE_LOCK_WAIT', default=2.0, cast=float)  # Seconds other callers wait for its value before computing it themselves
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
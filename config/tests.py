@@ -0,0 +1,269 @@
+import gzip
+import threading
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from emergency.models import EmergencyReport
+from monitoring.metrics import registry
+from notifications.models import Notification
+from users.models import User
+from .caching import get_or_set, invalidate
+from .db_routing import ReplicaRouter, RequestRouting, _routing, pin_key
+
+
+def test_mirror(alias):
+    return settings.DATABASES[alias].get('TEST', {}).get('MIRROR')
+
+
+# Read replicas that hold the test data: test mirrors of 'default', as when
+# DB_REPLICA_HOST is set. Only ReadReplicaTests reads from a separate one.
+MIRRORED_REPLICAS = [alias for alias in settings.READ_REPLICAS if test_mirror(alias)]
+READ_DATABASES = {'default', *MIRRORED_REPLICAS}
+
+# A 'replica' alias that is a database of its own in the tests
+SEPARATE_REPLICA = 'replica' in settings.DATABASES and not test_mirror('replica')
+
+
+class RoutedReadsTestCase(TestCase):
+    """
+    TestCase for requests whose reads the routers may send to a replica. The
+    mirrored replicas share the primary's connection, so that they see the
+    rows written in the test's transaction.
+    """
+
+    databases = READ_DATABASES
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(override_settings(READ_REPLICAS=MIRRORED_REPLICAS))
+        replicas = {alias: connections[alias] for alias in MIRRORED_REPLICAS}
+        for alias in replicas:
+            connections[alias] = connections[test_mirror(alias)]
+        cls.addClassCleanup(lambda: [connections.__setitem__(*item) for item in replicas.items()])
+        super().setUpClass()
+
+
+@skipUnless(SEPARATE_REPLICA, "needs a second database aliased 'replica' that is not a test mirror")
+@override_settings(READ_REPLICAS=['replica'])
+class ReadReplicaTests(TestCase):
+    """
+    Reads allowed on a replica go to it, other reads and writes to the primary.
+    The 'replica' test database is not replicated, so rows written to only one
+    of the two databases show where a request read from.
+    """
+
+    # The runner sets up the databases of skipped classes too
+    databases = {'default', 'replica'} if SEPARATE_REPLICA else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.citizen.save(using='replica', force_insert=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.citizen)
+
+    def report(self, description, using):
+        return EmergencyReport.objects.db_manager(using).create(
+            reporter=self.citizen, reporter_type='VICTIM', description=description
+        )
+
+    def descriptions(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {report['description'] for report in response.data}
+
+    def test_list_and_retrieve_read_from_replica(self):
+        self.report('On the primary', 'default')
+        on_replica = self.report('On the replica', 'replica')
+
+        self.assertEqual(self.descriptions(self.client.get('/api/emergency/reports/')), {'On the replica'})
+        response = self.client.get(f'/api/emergency/reports/{on_replica.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboards_and_analytics_read_from_replica(self):
+        self.report('On the replica', 'replica')
+
+        response = self.client.get('/api/dashboards/citizen/')
+        self.assertEqual(response.data['total_reports'], 1)
+        response = self.client.get('/api/analytics/user/')
+        self.assertEqual(response.data['reports_submitted'], 1)
+
+    def test_streamed_export_reads_from_replica(self):
+        # The body is consumed after the middleware has returned
+        self.citizen.is_staff = True
+        self.citizen.save(using='replica')
+        self.report('On the primary', 'default')
+        on_replica = self.report('On the replica', 'replica')
+
+        response = self.client.get('/api/analytics/export/reports/', {'export_format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        rows = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([row.split(',')[0] for row in rows[1:]], [str(on_replica.id)])
+
+    def test_other_views_read_from_primary(self):
+        self.report('On the primary', 'default')
+
+        response = self.client.get('/api/emergency/nearby/?lat=41&lng=29')
+        self.assertEqual(response.status_code, 200)
+        # A POST to an action of the viewset reads and writes the primary
+        response = self.client.post('/api/emergency/reports/', {
+            'reporter_type': 'VICTIM', 'description': 'New', 'is_emergency': False
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(EmergencyReport.objects.using('default').filter(description='New').exists())
+        self.assertFalse(EmergencyReport.objects.using('replica').filter(description='New').exists())
+
+    def test_reads_follow_writes(self):
+        self.report('On the replica', 'replica')
+        response = self.client.post('/api/emergency/reports/', {
+            'reporter_type': 'VICTIM', 'description': 'New', 'is_emergency': False
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(cache.get(pin_key(self.citizen.pk)))
+
+        # Pinned: the new report is listed although it has not reached the replica
+        self.assertEqual(self.descriptions(self.client.get('/api/emergency/reports/')), {'New'})
+
+        # Other users are not pinned
+        other = User.objects.create_user('other', 'other@example.com', 'pass', role='POLICE')
+        other.save(using='replica', force_insert=True)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.descriptions(self.client.get('/api/emergency/reports/')), {'On the replica'})
+
+        # Once the pin expires
+        cache.delete(pin_key(self.citizen.pk))
+        self.client.force_authenticate(self.citizen)
+        self.assertEqual(self.descriptions(self.client.get('/api/emergency/reports/')), {'On the replica'})
+
+    def test_write_in_request_moves_later_reads_to_primary(self):
+        router = ReplicaRouter()
+        routing = RequestRouting(None)
+        routing.replica = True
+        routing.pinned = False
+        token = _routing.set(routing)
+        try:
+            self.assertEqual(router.db_for_read(EmergencyReport), 'replica')
+            self.assertEqual(router.db_for_write(EmergencyReport), 'default')
+            self.assertEqual(router.db_for_read(EmergencyReport), 'default')
+        finally:
+            _routing.reset(token)
+        # Outside a request
+        self.assertEqual(router.db_for_read(EmergencyReport), 'default')
+
+    @override_settings(READ_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(EmergencyReport))
+
+
+def lookups(name, result):
+    """resq_cache_requests_total for one cache name and result"""
+    return registry.collect().get(('resq_cache_requests_total', (('cache', name), ('result', result))), 0)
+
+
+class CachingTests(TestCase):
+    """Cache-aside values are keyed per user or role and outdated by version bumps"""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def compute(self, value='value'):
+        def compute():
+            self.calls.append(value)
+            return value
+        return compute
+
+    def test_hits_and_misses(self):
+        hits, misses = lookups('test', 'hit'), lookups('test', 'miss')
+        self.assertEqual(get_or_set('test', self.compute(), 60, parts=[1]), 'value')
+        self.assertEqual(get_or_set('test', self.compute('other'), 60, parts=[1]), 'value')
+        self.assertEqual(get_or_set('test', self.compute('other'), 60, parts=[2]), 'other')
+        self.assertEqual(self.calls, ['value', 'other'])
+        self.assertEqual(lookups('test', 'hit') - hits, 1)
+        self.assertEqual(lookups('test', 'miss') - misses, 2)
+
+    def test_invalidate(self):
+        def lookup(user_id):
+            return get_or_set('test', self.compute(user_id), 60, parts=[user_id],
+                              depends_on=['reports:user'], user_id=user_id)
+        shared = lambda: get_or_set('shared', self.compute('shared'), 60, depends_on=['reports'])
+        lookup(1), lookup(2), shared()
+
+        invalidate('reports', 1)
+        lookup(1), lookup(2), shared()
+        # User 2's own reports did not change
+        self.assertEqual(self.calls, [1, 2, 'shared', 1, 'shared'])
+
+        invalidate('notifications')
+        lookup(1), shared()
+        self.assertEqual(len(self.calls), 5)
+
+    def test_concurrent_misses_compute_once(self):
+        started, release = threading.Event(), threading.Event()
+        def slow():
+            started.set()
+            release.wait(5)
+            return self.compute()()
+        thread = threading.Thread(target=get_or_set, args=('test', slow, 60))
+        thread.start()
+        started.wait(5)
+        waits = lookups('test', 'wait')
+
+        threading.Timer(0.1, release.set).start()
+        self.assertEqual(get_or_set('test', self.compute('other'), 60), 'value')
+        thread.join()
+        self.assertEqual(self.calls, ['value'])
+        self.assertEqual(lookups('test', 'wait') - waits, 1)
+
+    def test_none_is_not_cached(self):
+        get_or_set('test', lambda: self.calls.append(None), 60)
+        get_or_set('test', lambda: self.calls.append(None), 60)
+        self.assertEqual(len(self.calls), 2)
+
+
+class CachedResponseTests(RoutedReadsTestCase):
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.police = User.objects.create_user('police', 'police@example.com', 'pass', role='POLICE')
+        self.client = APIClient()
+
+    def get(self, user, path):
+        self.client.force_authenticate(user)
+        return self.client.get(path)
+
+    def report(self, user):
+        return EmergencyReport.objects.create(reporter=user, reporter_type='VICTIM', description='Fire')
+
+    def test_permission_checked_per_role(self):
+        self.assertEqual(self.get(self.police, '/api/analytics/global/').status_code, 200)
+        self.assertEqual(self.get(self.citizen, '/api/analytics/global/').status_code, 403)
+
+    def test_errors_are_not_cached(self):
+        response = self.get(self.police, '/api/analytics/timeseries/?granularity=week')
+        self.assertEqual(response.status_code, 400)
+        response = self.get(self.police, '/api/analytics/timeseries/?granularity=day')
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_parameters_are_part_of_the_key(self):
+        self.assertEqual(self.get(self.police, '/api/analytics/global/?days=7').data['period'], 'Last 7 days')
+        self.assertEqual(self.get(self.police, '/api/analytics/global/?days=30').data['period'], 'Last 30 days')
+
+    def test_writes_invalidate(self):
+        self.assertEqual(self.get(self.police, '/api/analytics/global/').data['emergency_reports'], 0)
+        self.assertEqual(self.get(self.citizen, '/api/analytics/user/').data['reports_submitted'], 0)
+        self.assertEqual(self.get(self.citizen, '/api/dashboards/citizen/').data['unread_notifications'], 0)
+
+        self.report(self.citizen)
+        Notification.objects.create(recipient=self.citizen, title='Update', message='Responding')
+
+        self.assertEqual(self.get(self.police, '/api/analytics/global/').data['emergency_reports'], 1)
+        self.assertEqual(self.get(self.citizen, '/api/analytics/user/').data['reports_submitted'], 1)
+        self.assertEqual(self.get(self.citizen, '/api/dashboards/citizen/').data['unread_notifications'], 1)
+
+        # Per user: not the police account's own analytics
+        self.assertEqual(self.get(self.police, '/api/analytics/user/').data['reports_submitted'], 0)
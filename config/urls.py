@@ -6,6 +6,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from monitoring.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('users.urls')),
@@ -17,6 +19,8 @@ urlpatterns = [
     path('api/chatbot/', include('chatbot.urls')),
     path('api/dashboards/', include('dashboards.urls')),
     path('api/analytics/', include('analytics.urls')),
+    path('api/monitoring/', include('monitoring.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
 # Serve media files in development
 if settings.DEBUG:
@@ -6,19 +6,43 @@ from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Count, Q, F
 
-from emergency.models import EmergencyReport
+from emergency.models import EmergencyReport, EmergencyIncident
 from notifications.models import Notification
 from users.permissions import IsEmergencyService, IsCitizen
 from users.models import User
+from config.caching import get_or_set, user_role
+
+# Dashboard sections are cached per user or per role, and outdated by report,
+# incident, notification and user changes (see config.caching)
+DASHBOARD_CACHE_TIMEOUT = 60  # seconds
 
 class DashboardBaseView(APIView):
     """Base view for dashboards with common data"""
     permission_classes = [permissions.IsAuthenticated]
+    read_replica = True  # See config.db_routing
     
     def get_common_data(self, request):
         """Get data common to all dashboard types"""
         user = request.user
         
+        notifications = get_or_set(
+            'dashboard:notifications', lambda: self.get_notification_data(user), DASHBOARD_CACHE_TIMEOUT,
+            parts=[user.pk], depends_on=['notifications:user'], user_id=user.pk
+        )
+        
+        # User profile completeness - simple implementation
+        profile_fields = ['first_name', 'last_name', 'email', 'phone_number', 'role']
+        completed_fields = sum(1 for field in profile_fields if getattr(user, field))
+        profile_completeness = round((completed_fields / len(profile_fields)) * 100)
+        
+        return {
+            'username': user.username,
+            'role': user.role,
+            **notifications,
+            'profile_completeness': profile_completeness
+        }
+    
+    def get_notification_data(self, user):
         # Recent notifications
         recent_notifications = Notification.objects.filter(
             recipient=user
@@ -30,14 +54,7 @@ class DashboardBaseView(APIView):
             is_read=False
         ).count()
         
-        # User profile completeness - simple implementation
-        profile_fields = ['first_name', 'last_name', 'email', 'phone_number', 'role']
-        completed_fields = sum(1 for field in profile_fields if getattr(user, field))
-        profile_completeness = round((completed_fields / len(profile_fields)) * 100)
-        
         return {
-            'username': user.username,
-            'role': user.role,
             'recent_notifications': [
                 {
                     'id': n.id,
@@ -47,8 +64,7 @@ class DashboardBaseView(APIView):
                     'is_read': n.is_read
                 } for n in recent_notifications
             ],
-            'unread_notifications': unread_count,
-            'profile_completeness': profile_completeness
+            'unread_notifications': unread_count
         }
 
 class CitizenDashboardView(DashboardBaseView):
@@ -61,7 +77,14 @@ class CitizenDashboardView(DashboardBaseView):
         
         # Get citizen-specific data
         user = request.user
+        data.update(get_or_set(
+            'dashboard:citizen', lambda: self.get_citizen_data(user), DASHBOARD_CACHE_TIMEOUT,
+            parts=[user.pk], depends_on=['reports:user'], user_id=user.pk
+        ))
         
+        return Response(data)
+    
+    def get_citizen_data(self, user):
         # Recent emergency reports by this user
         recent_reports = EmergencyReport.objects.filter(
             reporter=user
@@ -73,8 +96,7 @@ class CitizenDashboardView(DashboardBaseView):
             status__in=['PENDING', 'RESPONDING', 'ON_SCENE']
         ).count()
         
-        # Add citizen-specific data
-        data.update({
+        return {
             'recent_reports': [
                 {
                     'id': r.id,
@@ -90,9 +112,7 @@ class CitizenDashboardView(DashboardBaseView):
                 reporter=user, 
                 status='RESOLVED'
             ).count()
-        })
-        
-        return Response(data)
+        }
 
 class EmergencyServiceDashboardView(DashboardBaseView):
     """Dashboard view for emergency services (fire, police, red crescent)"""
@@ -102,10 +122,16 @@ class EmergencyServiceDashboardView(DashboardBaseView):
         # Get common dashboard data
         data = self.get_common_data(request)
         
-        # Get emergency service specific data
-        user = request.user
-        user_role = user.role
+        # Get emergency service specific data, the same for every user of a role
+        role = request.user.role
+        data.update(get_or_set(
+            'dashboard:service', lambda: self.get_service_data(role), DASHBOARD_CACHE_TIMEOUT,
+            parts=[role], depends_on=['reports', 'incidents']
+        ))
         
+        return Response(data)
+    
+    def get_service_data(self, user_role):
         # Filter emergencies based on the service type (optional)
         # This assumes EmergencyTag has types that match service roles
         role_to_emergency_type = {
@@ -136,8 +162,13 @@ class EmergencyServiceDashboardView(DashboardBaseView):
         # Counters by status
         status_counts = dict(active.values_list('status').annotate(count=Count('status')))
         
-        # Add emergency service specific data
-        data.update({
+        # Active incidents (duplicate reports of one event are grouped together)
+        active_incidents = EmergencyIncident.objects.filter(is_active=True)
+        if emergency_type:
+            active_incidents = active_incidents.filter(tags__emergency_type=emergency_type).distinct()
+        recent_incidents = active_incidents.order_by('-last_reported_at')[:10]
+        
+        return {
             'pending_emergencies': [
                 {
                     'id': e.id,
@@ -154,6 +185,17 @@ class EmergencyServiceDashboardView(DashboardBaseView):
                 'responding': status_counts.get('RESPONDING', 0),
                 'on_scene': status_counts.get('ON_SCENE', 0)
             },
+            'active_incidents': [
+                {
+                    'id': i.id,
+                    'description': i.description,
+                    'latitude': i.latitude,
+                    'longitude': i.longitude,
+                    'report_count': i.report_count,
+                    'last_reported_at': i.last_reported_at
+                } for i in recent_incidents
+            ],
+            'active_incident_count': active_incidents.count(),
             'service_type': user_role,
             'recent_activity': {
                 'today': EmergencyReport.objects.filter(
@@ -165,9 +207,7 @@ class EmergencyServiceDashboardView(DashboardBaseView):
                     status='RESOLVED'
                 ).count()
             }
-        })
-        
-        return Response(data)
+        }
 
 class AdminDashboardView(DashboardBaseView):
     """Dashboard view for admin users"""
@@ -177,13 +217,21 @@ class AdminDashboardView(DashboardBaseView):
         # Get common dashboard data
         data = self.get_common_data(request)
         
-        # Get admin-specific data
+        # Get admin-specific data, the same for every admin
+        data.update(get_or_set(
+            'dashboard:admin', self.get_admin_data, DASHBOARD_CACHE_TIMEOUT,
+            parts=[user_role(request.user)], depends_on=['reports', 'incidents', 'users']
+        ))
         
+        return Response(data)
+    
+    def get_admin_data(self):
         # System status
         total_users = User.objects.count()
         total_emergencies = EmergencyReport.objects.count()
         pending_emergencies = EmergencyReport.objects.filter(status='PENDING').count()
         resolved_emergencies = EmergencyReport.objects.filter(status='RESOLVED').count()
+        active_incidents = EmergencyIncident.objects.filter(is_active=True).count()
         
         # Today's statistics
         today = timezone.now().date()
@@ -191,15 +239,15 @@ class AdminDashboardView(DashboardBaseView):
         emergencies_today = EmergencyReport.objects.filter(timestamp__date=today).count()
         
         # Recent emergency reports
-        recent_reports = EmergencyReport.objects.all().order_by('-timestamp')[:10]
+        recent_reports = EmergencyReport.objects.select_related('reporter').order_by('-timestamp')[:10]
         
-        # Add admin-specific data
-        data.update({
+        return {
             'system_status': {
                 'total_users': total_users,
                 'total_emergencies': total_emergencies,
                 'pending_emergencies': pending_emergencies,
                 'resolved_emergencies': resolved_emergencies,
+                'active_incidents': active_incidents,
                 'resolution_rate': round(resolved_emergencies / total_emergencies * 100, 2) if total_emergencies > 0 else 0
             },
             'today_stats': {
@@ -216,6 +264,4 @@ class AdminDashboardView(DashboardBaseView):
                     'reporter_type': r.reporter_type
                 } for r in recent_reports
             ]
-        })
-        
-        return Response(data)
+        }
@@ -1,6 +1,9 @@
 from django.contrib import admin
-from .models import EmergencyReport, EmergencyTag
+from .models import EmergencyReport, EmergencyTag, EmergencyStatusTransition, EmergencyIncident, EmergencyDispatch
 
 # Register your models here.
 admin.site.register(EmergencyReport)
 admin.site.register(EmergencyTag)
+admin.site.register(EmergencyStatusTransition)
+admin.site.register(EmergencyIncident)
+admin.site.register(EmergencyDispatch)
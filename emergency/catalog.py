@@ -0,0 +1,90 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+
+from .models import EmergencyTag
+
+# Shared cache key holding the current catalog version. Every worker compares
+# it with the version of its in-process copy, so invalidating it reloads the
+# catalog everywhere (with a cache backend shared between workers).
+TAG_CATALOG_VERSION_KEY = 'emergency:tag-catalog:version'
+
+
+class TagCatalog:
+    """
+    In-process copy of the EmergencyTag table.
+
+    Tags are tiny and rarely change, so reads are served from memory and the
+    table is reloaded only when the shared version key changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._tags = {}
+
+    def current_version(self):
+        """The shared catalog version, created on first use"""
+        version = cache.get(TAG_CATALOG_VERSION_KEY)
+        if version is None:
+            cache.add(TAG_CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(TAG_CATALOG_VERSION_KEY)
+        return version
+
+    def snapshot(self):
+        """Return (version, {id: EmergencyTag}), reloading if the version changed"""
+        version = self.current_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._load(version)
+        return self._version, self._tags
+
+    def _load(self, version):
+        # Read the version before loading so a concurrent change is picked up
+        # on the next access
+        self._tags = {tag.id: tag for tag in EmergencyTag.objects.all()}
+        self._version = version
+
+    def all(self):
+        """All tags ordered by name"""
+        _, tags = self.snapshot()
+        return sorted(tags.values(), key=lambda tag: tag.name)
+
+    def get(self, tag_id):
+        _, tags = self.snapshot()
+        return tags.get(tag_id)
+
+    def resolve(self, tag_ids):
+        """
+        Return (tags, missing_ids) for the given ids, preserving order and
+        dropping duplicates. Ids the copy lacks are looked up in the database
+        before being reported missing, so a stale copy never rejects a new tag.
+        """
+        _, tags = self.snapshot()
+        unknown = [tag_id for tag_id in tag_ids if tag_id not in tags]
+        if unknown:
+            tags = self._add(EmergencyTag.objects.filter(pk__in=unknown))
+        found, missing = [], []
+        for tag_id in dict.fromkeys(tag_ids):
+            if tag_id in tags:
+                found.append(tags[tag_id])
+            else:
+                missing.append(tag_id)
+        return found, missing
+
+    def _add(self, new_tags):
+        """Add tags created since the copy was loaded (their invalidation has
+        not reached this worker yet) and return the updated copy"""
+        with self._lock:
+            # Replaced, not updated, so readers never see the dict change
+            self._tags = {**self._tags, **{tag.id: tag for tag in new_tags}}
+            return self._tags
+
+    def invalidate(self):
+        """Bump the shared version so every worker reloads on next access"""
+        cache.set(TAG_CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+tag_catalog = TagCatalog()
@@ -0,0 +1,195 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import EmergencyIncident, EmergencyReport
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometers"""
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = math.sin(d_lat / 2) ** 2 + \
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def cell_size():
+    """Grid cell size in degrees: one clustering radius (of latitude) per cell"""
+    return settings.INCIDENT_CLUSTER_RADIUS_KM / KM_PER_DEGREE
+
+
+def grid_cell(latitude, longitude):
+    """The (cell_x, cell_y) grid cell of a coordinate"""
+    size = cell_size()
+    return math.floor(longitude / size), math.floor(latitude / size)
+
+
+def nearby_cells(latitude, longitude, radius_km):
+    """Inclusive (cell_x range, cell_y range) covering radius_km around a point"""
+    size = cell_size()
+    d_lat = radius_km / KM_PER_DEGREE
+    d_lng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return (
+        (math.floor((longitude - d_lng) / size), math.floor((longitude + d_lng) / size)),
+        (math.floor((latitude - d_lat) / size), math.floor((latitude + d_lat) / size)),
+    )
+
+
+def nearby_incidents(latitude, longitude, radius_km, since=None, lock=False):
+    """
+    Incidents whose centroid lies within radius_km, as (distance, incident)
+    pairs sorted by distance. Candidates come from the (cell, time) index;
+    only those are checked with the exact distance. With lock=True the
+    candidates are selected for update (inside a transaction).
+    """
+    x_range, y_range = nearby_cells(latitude, longitude, radius_km)
+    candidates = EmergencyIncident.objects.filter(
+        cell_x__range=x_range,
+        cell_y__range=y_range,
+        is_active=True
+    )
+    if since is not None:
+        candidates = candidates.filter(last_reported_at__gte=since)
+    if lock:
+        candidates = candidates.select_for_update()
+
+    matches = []
+    for incident in candidates:
+        distance = haversine_km(latitude, longitude, incident.latitude, incident.longitude)
+        if distance <= radius_km:
+            matches.append((distance, incident))
+    matches.sort(key=lambda match: match[0])
+    return matches
+
+
+def _shares_type(incident, types):
+    # Untagged reports carry no type information, so they match any incident
+    if not types:
+        return True
+    incident_types = {tag.emergency_type for tag in incident.tags.all()}
+    return not incident_types or bool(incident_types & types)
+
+
+def assign_incident(report, tags=None):
+    """
+    Attach a newly created report to an incident.
+
+    The report joins the nearest active incident whose latest report is within
+    the clustering window and radius and that shares an emergency type;
+    otherwise a new incident is opened for it. Pass tags when they are already
+    known to avoid querying them. Returns the incident, or None for reports
+    without coordinates.
+    """
+    if report.latitude is None or report.longitude is None:
+        return None
+    if report.incident_id:
+        return report.incident
+
+    tags = list(report.tags.all()) if tags is None else list(tags)
+    types = {tag.emergency_type for tag in tags}
+    since = report.timestamp - timedelta(minutes=settings.INCIDENT_CLUSTER_WINDOW_MINUTES)
+
+    with transaction.atomic():
+        incident = None
+        # Locking the candidates makes concurrent reports for the same area
+        # take turns: the centroid below is computed from current values, and
+        # on MySQL the locked index range also blocks a second new incident
+        # from being inserted next to the first
+        matches = nearby_incidents(
+            report.latitude, report.longitude, settings.INCIDENT_CLUSTER_RADIUS_KM, since, lock=True
+        )
+        for _, candidate in matches:
+            if _shares_type(candidate, types):
+                incident = candidate
+                break
+
+        if incident is None:
+            cell_x, cell_y = grid_cell(report.latitude, report.longitude)
+            incident = EmergencyIncident.objects.create(
+                created_by=report.reporter,
+                description=report.description,
+                latitude=report.latitude,
+                longitude=report.longitude,
+                cell_x=cell_x,
+                cell_y=cell_y,
+                report_count=1,
+                last_reported_at=report.timestamp
+            )
+        else:
+            # Move the centroid towards the new report and keep its cell current
+            count = incident.report_count
+            latitude = (incident.latitude * count + report.latitude) / (count + 1)
+            longitude = (incident.longitude * count + report.longitude) / (count + 1)
+            cell_x, cell_y = grid_cell(latitude, longitude)
+            EmergencyIncident.objects.filter(pk=incident.pk).update(
+                latitude=latitude,
+                longitude=longitude,
+                cell_x=cell_x,
+                cell_y=cell_y,
+                report_count=count + 1,
+                last_reported_at=max(incident.last_reported_at, report.timestamp),
+                is_active=True
+            )
+
+        if tags:
+            incident.tags.add(*tags)
+        EmergencyReport.objects.filter(pk=report.pk).update(incident=incident)
+        report.incident = incident
+
+    return incident
+
+
+def detach_incident(report):
+    """
+    Take a report out of its incident, e.g. before reclustering it after a
+    move. The incident is summarized again from its remaining reports, or
+    deleted when none are left.
+    """
+    if not report.incident_id:
+        return
+    with transaction.atomic():
+        incident = EmergencyIncident.objects.select_for_update().filter(pk=report.incident_id).first()
+        EmergencyReport.objects.filter(pk=report.pk).update(incident=None)
+        report.incident = None
+        if incident is None:
+            return
+        reports = list(incident.reports.all())
+        if reports:
+            summarize_incident(incident, reports)
+            refresh_incident_status(incident)
+        else:
+            incident.delete()
+
+
+def summarize_incident(incident, reports, tags=()):
+    """Set centroid, cell, count and tags of an incident created for a known set of reports"""
+    located = [r for r in reports if r.latitude is not None and r.longitude is not None]
+    fields = {
+        'report_count': len(reports),
+        'last_reported_at': max(r.timestamp for r in reports) if reports else None,
+    }
+    if located:
+        latitude = sum(r.latitude for r in located) / len(located)
+        longitude = sum(r.longitude for r in located) / len(located)
+        cell_x, cell_y = grid_cell(latitude, longitude)
+        fields.update(latitude=latitude, longitude=longitude, cell_x=cell_x, cell_y=cell_y)
+
+    EmergencyIncident.objects.filter(pk=incident.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(incident, name, value)
+    if tags:
+        incident.tags.add(*tags)
+
+
+def refresh_incident_status(incident):
+    """Mark an incident inactive once all of its reports are resolved (or active again)"""
+    is_active = incident.reports.exclude(status='RESOLVED').exists()
+    if is_active != incident.is_active:
+        EmergencyIncident.objects.filter(pk=incident.pk).update(is_active=is_active)
+        incident.is_active = is_active
@@ -0,0 +1,212 @@
+import heapq
+import math
+import threading
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .clustering import haversine_km, KM_PER_DEGREE
+from .models import EmergencyDispatch
+from users.models import User
+
+SERVICE_ROLES = ['FIRE_STATION', 'POLICE', 'RED_CRESCENT']
+
+# Which services respond to each emergency type, in order of preference
+ROLES_BY_EMERGENCY_TYPE = {
+    'FIRE': ['FIRE_STATION'],
+    'NATURAL': ['RED_CRESCENT', 'FIRE_STATION'],
+    'TRAFFIC': ['POLICE', 'RED_CRESCENT'],
+    'OTHER': ['POLICE'],
+}
+
+# Shared cache key holding the current station index version, bumped when a
+# service account's role or location changes (see emergency.signals)
+STATION_INDEX_VERSION_KEY = 'emergency:station-index:version'
+
+
+def roles_for_types(emergency_types):
+    """Service roles matching a report's emergency types (every service if untagged)"""
+    roles = []
+    for emergency_type in emergency_types:
+        for role in ROLES_BY_EMERGENCY_TYPE.get(emergency_type, []):
+            if role not in roles:
+                roles.append(role)
+    return roles or list(SERVICE_ROLES)
+
+
+def station_position(location):
+    """(latitude, longitude) from a User.location JSON value, or None"""
+    if not isinstance(location, dict):
+        return None
+    try:
+        latitude = float(location['latitude'])
+        longitude = float(location['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+class StationIndex:
+    """
+    Uniform grid of station positions, one grid per role.
+
+    A nearest-k query scans rings of cells outwards from the query point and
+    stops as soon as the next ring cannot hold anything closer than the
+    current k-th candidate, so only a few cells are read however many
+    stations there are.
+    """
+
+    def __init__(self, stations, cell_size=0.1):
+        """stations: iterable of (user_id, role, latitude, longitude)"""
+        self.cell_size = cell_size
+        self.grids = defaultdict(lambda: defaultdict(list))
+        self.bounds = {}
+        self.user_ids = set()
+
+        for user_id, role, latitude, longitude in stations:
+            cell = self._cell(latitude, longitude)
+            self.grids[role][cell].append((latitude, longitude, user_id))
+            self.user_ids.add(user_id)
+
+        for role, grid in self.grids.items():
+            xs = [x for x, _ in grid]
+            ys = [y for _, y in grid]
+            self.bounds[role] = (min(xs), min(ys), max(xs), max(ys))
+
+    def _cell(self, latitude, longitude):
+        return math.floor(longitude / self.cell_size), math.floor(latitude / self.cell_size)
+
+    def _ring(self, cx, cy, radius):
+        """Cells at Chebyshev distance radius from (cx, cy)"""
+        if radius == 0:
+            yield cx, cy
+            return
+        for x in range(cx - radius, cx + radius + 1):
+            yield x, cy - radius
+            yield x, cy + radius
+        for y in range(cy - radius + 1, cy + radius):
+            yield cx - radius, y
+            yield cx + radius, y
+
+    def _min_ring_distance(self, latitude, radius):
+        """Lower bound (km) on the distance to any point outside rings 0..radius-1"""
+        if radius <= 1:
+            return 0.0
+        # Longitude cells are narrowest at the latitude farthest from the equator
+        edge = min(abs(latitude) + radius * self.cell_size, 89.9)
+        width = self.cell_size * KM_PER_DEGREE * math.cos(math.radians(edge))
+        return (radius - 1) * min(width, self.cell_size * KM_PER_DEGREE)
+
+    def nearest(self, latitude, longitude, roles, k=5, exclude=(), max_distance_km=None):
+        """
+        Return up to k (distance_km, user_id, role) tuples, nearest first,
+        for stations of the given roles, skipping user ids in exclude.
+        """
+        cx, cy = self._cell(latitude, longitude)
+        best = []  # max-heap of (-distance, user_id, role)
+
+        for role in roles:
+            grid = self.grids.get(role)
+            if not grid:
+                continue
+            min_x, min_y, max_x, max_y = self.bounds[role]
+            last_ring = max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+
+            for radius in range(last_ring + 1):
+                bound = self._min_ring_distance(latitude, radius)
+                if max_distance_km is not None and bound > max_distance_km:
+                    break
+                if len(best) >= k and bound > -best[0][0]:
+                    break
+                for cell in self._ring(cx, cy, radius):
+                    for station_lat, station_lng, user_id in grid.get(cell, ()):
+                        if user_id in exclude:
+                            continue
+                        distance = haversine_km(latitude, longitude, station_lat, station_lng)
+                        if max_distance_km is not None and distance > max_distance_km:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, user_id, role))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, user_id, role))
+
+        return sorted((-distance, user_id, role) for distance, user_id, role in best)
+
+
+class StationRegistry:
+    """Process-wide StationIndex, rebuilt when the shared version key changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._index = None
+
+    def current_version(self):
+        version = cache.get(STATION_INDEX_VERSION_KEY)
+        if version is None:
+            cache.add(STATION_INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(STATION_INDEX_VERSION_KEY)
+        return version
+
+    def index(self):
+        version = self.current_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._index = self.build()
+                    self._version = version
+        return self._index
+
+    def build(self):
+        """Load every active service account with a usable location"""
+        stations = []
+        users = User.objects.filter(role__in=SERVICE_ROLES, is_active=True, location__isnull=False)
+        for user_id, role, location in users.values_list('id', 'role', 'location'):
+            position = station_position(location)
+            if position is not None:
+                stations.append((user_id, role, *position))
+        return StationIndex(stations, cell_size=getattr(settings, 'DISPATCH_GRID_CELL_SIZE', 0.1))
+
+    def contains(self, user_id):
+        """Whether the index loaded in this process includes user_id (no rebuild)"""
+        return self._index is not None and user_id in self._index.user_ids
+
+    def invalidate(self):
+        """Bump the shared version so every worker rebuilds on next access"""
+        cache.set(STATION_INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+station_registry = StationRegistry()
+
+
+def busy_responder_ids():
+    """Ids of units with an unreleased dispatch"""
+    return set(
+        EmergencyDispatch.objects.filter(released_at__isnull=True).values_list('responder_id', flat=True)
+    )
+
+
+def recommend_responders(report, k=5, roles=None, max_distance_km=None):
+    """
+    Rank available service units for a report by distance.
+
+    Returns [{'responder': user_id, 'role', 'distance'}], nearest first. Units
+    with an open dispatch are skipped. Reports without coordinates get [].
+    """
+    if report.latitude is None or report.longitude is None:
+        return []
+    if roles is None:
+        roles = roles_for_types(tag.emergency_type for tag in report.tags.all())
+
+    ranked = station_registry.index().nearest(
+        report.latitude, report.longitude, roles,
+        k=k, exclude=busy_responder_ids(), max_distance_km=max_distance_km
+    )
+    return [
+        {'responder': user_id, 'role': role, 'distance': round(distance, 2)}
+        for distance, user_id, role in ranked
+    ]
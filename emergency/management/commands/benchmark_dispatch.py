@@ -0,0 +1,49 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from emergency.dispatch import SERVICE_ROLES, StationIndex
+
+
+class Command(BaseCommand):
+    help = 'Time nearest-unit queries against a synthetic station index (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', type=int, default=5000, help='Number of synthetic stations')
+        parser.add_argument('--queries', type=int, default=10000, help='Number of queries to time')
+        parser.add_argument('-k', type=int, default=5, help='Units returned per query')
+        parser.add_argument('--busy', type=float, default=0.2, help='Fraction of units marked busy')
+        parser.add_argument('--cell-size', type=float, default=0.1, help='Grid cell size in degrees')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Stations spread over a country-sized box (roughly Turkey)
+        stations = [
+            (uuid.uuid4(), rng.choice(SERVICE_ROLES), rng.uniform(36, 42), rng.uniform(26, 45))
+            for _ in range(options['stations'])
+        ]
+        busy = {s[0] for s in stations if rng.random() < options['busy']}
+
+        started = time.perf_counter()
+        index = StationIndex(stations, cell_size=options['cell_size'])
+        build_ms = (time.perf_counter() - started) * 1000
+
+        points = [(rng.uniform(36, 42), rng.uniform(26, 45)) for _ in range(options['queries'])]
+        timings = []
+        for latitude, longitude in points:
+            started = time.perf_counter()
+            index.nearest(latitude, longitude, [rng.choice(SERVICE_ROLES)], k=options['k'], exclude=busy)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        def percentile(p):
+            return timings[min(int(len(timings) * p), len(timings) - 1)]
+
+        self.stdout.write(f"Built index of {len(stations)} stations in {build_ms:.1f} ms")
+        self.stdout.write(
+            f"{len(timings)} queries (k={options['k']}): "
+            f"p50 {percentile(0.5):.3f} ms, p95 {percentile(0.95):.3f} ms, p99 {percentile(0.99):.3f} ms"
+        )
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:26
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0005_remove_location_references'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmergencyStatusTransition',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('from_status', models.CharField(choices=[('PENDING', 'Pending'), ('RESPONDING', 'Emergency Services Responding'), ('ON_SCENE', 'Emergency Services On Scene'), ('RESOLVED', 'Resolved')], max_length=20)),
+                ('to_status', models.CharField(choices=[('PENDING', 'Pending'), ('RESPONDING', 'Emergency Services Responding'), ('ON_SCENE', 'Emergency Services On Scene'), ('RESOLVED', 'Resolved')], max_length=20)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='status_transitions', to=settings.AUTH_USER_MODEL)),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_transitions', to='emergency.emergencyreport')),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'indexes': [models.Index(fields=['report', 'to_status'], name='emergency_e_report__2777f1_idx')],
+            },
+        ),
+    ]
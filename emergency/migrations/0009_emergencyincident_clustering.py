@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0008_emergencyincident'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emergencyincident',
+            name='cell_x',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyincident',
+            name='cell_y',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyincident',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyincident',
+            name='last_reported_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyincident',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyincident',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emergencyincident',
+            name='report_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='emergencyincident',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='incidents', to='emergency.emergencytag'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyincident',
+            index=models.Index(fields=['cell_x', 'cell_y', 'last_reported_at'], name='emergency_e_cell_x_84426b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyincident',
+            index=models.Index(fields=['is_active', 'last_reported_at'], name='emergency_e_is_acti_02b46c_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0010_emergencydispatch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emergencyreport',
+            index=models.Index(fields=['latitude', 'longitude'], name='emergency_e_latitud_8bf1a8_idx'),
+        ),
+    ]
@@ -23,12 +23,53 @@ class EmergencyReport(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     timestamp = models.DateTimeField(auto_now_add=True)  
     tags = models.ManyToManyField('EmergencyTag', related_name='reports', blank=True)
+    region = models.CharField(max_length=50, null=True, blank=True)  # Admin-boundary region id, see analytics.regions
+    incident = models.ForeignKey('EmergencyIncident', on_delete=models.SET_NULL, null=True, blank=True, related_name='reports')
 
     class Meta:
         indexes = [
             models.Index(fields=['reporter', 'timestamp']),
+            models.Index(fields=['region', 'timestamp']),
+            models.Index(fields=['latitude', 'longitude']),  # Map tile bounding boxes
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_state()
+        return instance
+
+    def _remember_loaded_state(self):
+        # The stored position and status (deferred fields left out), so save()
+        # can tell whether the report moved and the map signals what changed
+        self._loaded_state = {
+            name: self.__dict__[name] for name in ('latitude', 'longitude', 'status') if name in self.__dict__
+        }
+
+    @property
+    def loaded_state(self):
+        """The position and status as last loaded or saved (the current ones for unsaved reports)"""
+        return getattr(self, '_loaded_state', self.__dict__)
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_loaded_state()
+
+    def save(self, *args, **kwargs):
+        # Resolve the region when the report is created with coordinates (unless
+        # given) and again whenever it moves
+        loaded = getattr(self, '_loaded_state', {})
+        moved = 'latitude' in loaded and 'longitude' in loaded and \
+            (self.latitude, self.longitude) != (loaded['latitude'], loaded['longitude'])
+        if self._state.adding and self.region is None or moved:
+            from analytics.regions import assign_region
+            position = (self.latitude, self.longitude)
+            self.region = None if None in position else assign_region(*position)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'region'}
+        super().save(*args, **kwargs)
+        self._remember_loaded_state()
+
     def __str__(self):
         return f"{self.reporter.username} - {self.timestamp}"
 
@@ -46,4 +87,84 @@ class EmergencyTag(models.Model):
     description = models.TextField(blank=True, null=True)
     
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class EmergencyIncident(models.Model):
+    """
+    A single real-world event that one or more reports belong to,
+    e.g. a wildfire reported at many locations or by many citizens.
+    See emergency.clustering for how reports are grouped.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='incidents')
+    description = models.TextField(blank=True)
+    latitude = models.FloatField(null=True, blank=True)  # Centroid of the located reports
+    longitude = models.FloatField(null=True, blank=True)
+    cell_x = models.IntegerField(null=True, blank=True)  # Clustering grid cell of the centroid
+    cell_y = models.IntegerField(null=True, blank=True)
+    report_count = models.IntegerField(default=0)
+    is_active = models.BooleanField(default=True)  # False once every report is resolved
+    tags = models.ManyToManyField('EmergencyTag', related_name='incidents', blank=True)
+    timestamp = models.DateTimeField(auto_now_add=True)
+    last_reported_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['cell_x', 'cell_y', 'last_reported_at']),
+            models.Index(fields=['is_active', 'last_reported_at']),
+        ]
+
+    def __str__(self):
+        return f"Incident {self.id} - {self.timestamp}"
+
+
+class EmergencyStatusTransition(models.Model):
+    """
+    Append-only log of report status changes, written by
+    emergency.services.record_status_change.
+    Used by analytics to measure dispatch (RESPONDING) and arrival (ON_SCENE) times.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    report = models.ForeignKey(EmergencyReport, on_delete=models.CASCADE, related_name='status_transitions')
+    from_status = models.CharField(max_length=20, choices=EmergencyReport.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=EmergencyReport.STATUS_CHOICES)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='status_transitions')
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['report', 'to_status']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Transitions are never edited once recorded
+        if not self._state.adding:
+            raise ValueError('Status transitions are append-only')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.report_id}: {self.from_status} -> {self.to_status}"
+
+
+class EmergencyDispatch(models.Model):
+    """
+    A service unit sent to a report. The unit counts as busy until the
+    dispatch is released (when the report is resolved).
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    report = models.ForeignKey(EmergencyReport, on_delete=models.CASCADE, related_name='dispatches')
+    responder = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dispatches')
+    dispatched_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='dispatches_made')
+    timestamp = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['responder', 'released_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.responder_id} -> {self.report_id}"
@@ -1,6 +1,12 @@
 # emergency/serializers.py
+from django.db import transaction
 from rest_framework import serializers
-from .models import EmergencyReport, EmergencyTag
+from .models import EmergencyReport, EmergencyTag, EmergencyIncident
+from .catalog import tag_catalog
+from .clustering import assign_incident, detach_incident
+from .services import record_status_change
+from analytics.cubes import record_report, cube_key, move_report
+from config.caching import invalidate
 
 class EmergencyTagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,6 +15,7 @@ class EmergencyTagSerializer(serializers.ModelSerializer):
 
 class EmergencyReportSerializer(serializers.ModelSerializer):
     reporter = serializers.PrimaryKeyRelatedField(read_only=True)
+    incident = serializers.PrimaryKeyRelatedField(read_only=True)
     tags = EmergencyTagSerializer(many=True, required=False, read_only=True)
     tag_ids = serializers.ListField(child=serializers.UUIDField(), write_only=True, required=False)
     status_display = serializers.SerializerMethodField(read_only=True)
@@ -18,35 +25,85 @@ class EmergencyReportSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'reporter', 'reporter_type', 'description',
             'latitude', 'longitude', 'is_emergency', 'status', 'status_display', 
-            'timestamp', 'tags', 'tag_ids'
+            'timestamp', 'tags', 'tag_ids', 'incident'
         ]
     
     def get_status_display(self, obj):
         """Return the human-readable status"""
         return dict(EmergencyReport.STATUS_CHOICES).get(obj.status, obj.status)
     
+    def validate_tag_ids(self, value):
+        """Resolve tag IDs against the in-process tag catalog (no DB query unless an ID is unknown)"""
+        tags, missing = tag_catalog.resolve(value)
+        if missing:
+            raise serializers.ValidationError(f"Unknown tag IDs: {', '.join(str(tag_id) for tag_id in missing)}")
+        return [tag.id for tag in tags]
+    
     def create(self, validated_data):
         tag_ids = validated_data.pop('tag_ids', [])
         report = EmergencyReport.objects.create(**validated_data)
         
         # Add tags if provided
+        tags = []
         if tag_ids:
-            tags = EmergencyTag.objects.filter(id__in=tag_ids)
+            tags, _ = tag_catalog.resolve(tag_ids)
             report.tags.set(tags)
+            # Tag statistics read the links (no m2m_changed receiver, which
+            # would cost set() a query)
+            invalidate('reports')
+        
+        # Group the report with nearby duplicates of the same incident
+        assign_incident(report, tags=tags)
+        
+        # Count the report in the analytics time-series cubes
+        record_report(report)
         
         return report
     
     def update(self, instance, validated_data):
         tag_ids = validated_data.pop('tag_ids', None)
+        request = self.context.get('request')
         
-        # Update regular fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        with transaction.atomic():
+            # Take the previous state from the locked row, not the instance
+            # read before the transaction, so concurrent updates serialize
+            current = EmergencyReport.objects.select_for_update().get(pk=instance.pk)
+            old_cube_key = cube_key(current)
+            old_position = (current.latitude, current.longitude)
+            old_status = current.status
+            
+            # Update regular fields
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            
+            # Status changed through PUT/PATCH count for response times too
+            record_status_change(instance, old_status, request.user if request else None)
+            
+            # Update tags if provided
+            tags = None
+            if tag_ids is not None:
+                tags, _ = tag_catalog.resolve(tag_ids)
+                instance.tags.set(tags)
+                invalidate('reports')
+            
+            # A moved report may now belong to another incident
+            if (instance.latitude, instance.longitude) != old_position:
+                detach_incident(instance)
+                assign_incident(instance, tags=tags)
+            
+            # Keep the analytics cubes in step with status/tag changes
+            move_report(old_cube_key, cube_key(instance))
         
-        # Update tags if provided
-        if tag_ids is not None:
-            tags = EmergencyTag.objects.filter(id__in=tag_ids)
-            instance.tags.set(tags)
-        
-        return instance
\ No newline at end of file
+        return instance
+
+class EmergencyIncidentSerializer(serializers.ModelSerializer):
+    tags = EmergencyTagSerializer(many=True, read_only=True)
+    distance = serializers.FloatField(read_only=True, required=False)
+    
+    class Meta:
+        model = EmergencyIncident
+        fields = [
+            'id', 'description', 'latitude', 'longitude', 'report_count',
+            'is_active', 'tags', 'timestamp', 'last_reported_at', 'distance'
+        ]
@@ -0,0 +1,115 @@
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .catalog import tag_catalog
+from .clustering import refresh_incident_status, summarize_incident
+from .models import EmergencyReport, EmergencyTag, EmergencyIncident, EmergencyStatusTransition
+from analytics.cubes import cube_key, record_reports
+from analytics.regions import get_region_index
+from config.caching import get_or_set, invalidate
+from map_services.clusters import record_point_changes, report_change
+from map_services.hazards import bump_hazard_version
+from map_services.tiles import invalidate_tiles
+
+# Tag statistics change slowly enough that a short cache is safe
+TAG_STATS_CACHE_TIMEOUT = 60  # seconds
+
+def tag_report_counts(status=None, since=None, until=None):
+    """
+    Return [{'id', 'name', 'emergency_type', 'count'}] for every tag, counting
+    the tag's reports with a single grouped query.
+    
+    Args:
+        status: Only count reports with this status
+        since: Only count reports created on or after this date
+        until: Only count reports created on or before this date
+    """
+    return get_or_set(
+        'tag-stats', lambda: _tag_report_counts(status, since, until), TAG_STATS_CACHE_TIMEOUT,
+        parts=[status, since, until], depends_on=['reports', 'tags']
+    )
+
+def _tag_report_counts(status, since, until):
+    report_filter = Q()
+    if status:
+        report_filter &= Q(reports__status=status)
+    if since:
+        report_filter &= Q(reports__timestamp__date__gte=since)
+    if until:
+        report_filter &= Q(reports__timestamp__date__lte=until)
+    
+    return list(
+        EmergencyTag.objects.annotate(
+            count=Count('reports', filter=report_filter)
+        ).values('id', 'name', 'emergency_type', 'count').order_by('name')
+    )
+
+def record_status_change(report, old_status, user=None):
+    """
+    Follow up on a saved report whose status was old_status: log the
+    transition (analytics derives response times from it), refresh the
+    incident and free the dispatched units once the report is resolved.
+    Call inside the transaction that saved the report.
+    """
+    if report.status != old_status:
+        EmergencyStatusTransition.objects.create(
+            report=report,
+            from_status=old_status,
+            to_status=report.status,
+            changed_by=user
+        )
+        if report.incident_id:
+            refresh_incident_status(report.incident)
+    
+    # Also when already resolved, so no dispatch is ever left open on one
+    if report.status == 'RESOLVED':
+        report.dispatches.filter(released_at__isnull=True).update(released_at=timezone.now())
+
+def create_incident_reports(reporter, reports_data, description=''):
+    """
+    Create one report per entry of reports_data (validated serializer data)
+    under a new EmergencyIncident.
+    
+    Reports and their tag links are written with one bulk insert each, all
+    in a single transaction, so a failure leaves nothing behind.
+    
+    Returns:
+        (incident, [EmergencyReport])
+    """
+    regions = get_region_index().assign_many(
+        [(data.get('latitude'), data.get('longitude')) for data in reports_data]
+    )
+    through = EmergencyReport.tags.through
+    
+    with transaction.atomic():
+        incident = EmergencyIncident.objects.create(created_by=reporter, description=description or '')
+        
+        reports = []
+        report_tags = []
+        for data, region in zip(reports_data, regions):
+            data = dict(data)
+            tags, _ = tag_catalog.resolve(data.pop('tag_ids', []))
+            reports.append(EmergencyReport(reporter=reporter, incident=incident, region=region, **data))
+            report_tags.append(tags)
+        
+        EmergencyReport.objects.bulk_create(reports, batch_size=500)
+        through.objects.bulk_create([
+            through(emergencyreport_id=report.id, emergencytag_id=tag.id)
+            for report, tags in zip(reports, report_tags)
+            for tag in tags
+        ], batch_size=1000)
+        
+        summarize_incident(incident, reports, tags={tag for tags in report_tags for tag in tags})
+        
+        # Count the reports in the analytics time-series cubes
+        record_reports([cube_key(report, tags=tags) for report, tags in zip(reports, report_tags)])
+    
+    # bulk_create sends no post_save signals, so tell routing, the map
+    # tiles and the caches about the new reports
+    bump_hazard_version()
+    invalidate('reports', reporter.pk)
+    invalidate_tiles([(report.latitude, report.longitude) for report in reports])
+    record_point_changes(report_change(report) for report in reports)
+    
+    return incident, reports
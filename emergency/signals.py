@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .catalog import tag_catalog
+from .dispatch import SERVICE_ROLES, station_registry
+from .models import EmergencyIncident, EmergencyReport, EmergencyTag
+from config.caching import invalidate
+from users.models import User
+
+# User fields the station index is built from
+STATION_FIELDS = {'role', 'location', 'is_active'}
+
+@receiver([post_save, post_delete], sender=EmergencyTag)
+def invalidate_tag_catalog(sender, **kwargs):
+    """Reload the tag catalog in every worker after a tag changes"""
+    tag_catalog.invalidate()
+    invalidate('tags')
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_station_index(sender, instance, update_fields=None, **kwargs):
+    """Rebuild the dispatch station index after a service account may have moved"""
+    if update_fields is not None and not STATION_FIELDS.intersection(update_fields):
+        return  # e.g. last_login updates
+    if instance.role in SERVICE_ROLES or station_registry.contains(instance.pk):
+        station_registry.invalidate()
+
+@receiver([post_save, post_delete], sender=EmergencyReport)
+def invalidate_report_caches(sender, instance, **kwargs):
+    """Outdate cached dashboards, analytics and tag statistics built from reports"""
+    invalidate('reports', instance.reporter_id)
+
+@receiver([post_save, post_delete], sender=EmergencyIncident)
+def invalidate_incident_caches(sender, **kwargs):
+    invalidate('incidents')
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_caches(sender, created=False, **kwargs):
+    """User counts change only when accounts are created or deleted"""
+    if created or kwargs['signal'] is post_delete:
+        invalidate('users')
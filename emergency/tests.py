@@ -1,3 +1,461 @@
+import json
+import random
+import uuid
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.models import HourlyReportCube
+from config.tests import RoutedReadsTestCase
+from users.models import User
+from .catalog import tag_catalog
+from .clustering import haversine_km
+from .dispatch import SERVICE_ROLES, StationIndex
+from .models import EmergencyDispatch, EmergencyIncident, EmergencyReport, EmergencyTag
+from .services import create_incident_reports
+
+
+class TagStatsTests(TestCase):
+    """Tag statistics endpoints are served by one grouped query"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.police = User.objects.create_user('police', 'police@example.com', 'pass', role='POLICE')
+
+        self.fire = EmergencyTag.objects.create(name='Fire', emergency_type='FIRE')
+        self.flood = EmergencyTag.objects.create(name='Flood', emergency_type='NATURAL')
+        self.crash = EmergencyTag.objects.create(name='Crash', emergency_type='TRAFFIC')
+
+        for i in range(3):
+            report = EmergencyReport.objects.create(
+                reporter=self.citizen,
+                reporter_type='VICTIM',
+                description=f'Report {i}',
+                status='RESOLVED' if i == 0 else 'PENDING'
+            )
+            report.tags.set([self.fire, self.flood] if i < 2 else [self.fire])
+
+        # An old report outside any recent date range
+        old_report = EmergencyReport.objects.create(
+            reporter=self.citizen, reporter_type='SPECTATOR', description='Old report'
+        )
+        old_report.tags.set([self.crash])
+        EmergencyReport.objects.filter(pk=old_report.pk).update(timestamp=timezone.now() - timedelta(days=60))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.police)
+
+    def counts(self, response):
+        return {row['name']: row['count'] for row in response.data}
+
+    def test_stats_by_tag_uses_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/emergency/stats/tags/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(response), {'Fire': 3, 'Flood': 2, 'Crash': 1})
+
+    def test_tag_viewset_stats_uses_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/emergency/tags/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(response), {'Fire': 3, 'Flood': 2, 'Crash': 1})
+
+    def test_query_count_does_not_grow_with_tags(self):
+        for i in range(10):
+            EmergencyTag.objects.create(name=f'Extra {i}')
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/emergency/stats/tags/')
+        self.assertEqual(len(response.data), 13)
+
+    def test_repeated_request_is_cached(self):
+        self.client.get('/api/emergency/stats/tags/')
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/emergency/stats/tags/')
+
+    def test_status_filter(self):
+        response = self.client.get('/api/emergency/stats/tags/', {'status': 'PENDING'})
+        self.assertEqual(self.counts(response), {'Fire': 2, 'Flood': 1, 'Crash': 1})
+
+    def test_date_filter(self):
+        since = (timezone.now() - timedelta(days=7)).date().isoformat()
+        response = self.client.get('/api/emergency/tags/stats/', {'since': since})
+        self.assertEqual(self.counts(response), {'Fire': 3, 'Flood': 2, 'Crash': 0})
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get('/api/emergency/stats/tags/', {'status': 'LOST'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/emergency/stats/tags/', {'since': 'yesterday'}).status_code, 400)
+
+    def test_stats_by_tag_hidden_from_citizens(self):
+        self.client.force_authenticate(self.citizen)
+        response = self.client.get('/api/emergency/stats/tags/')
+        self.assertEqual(response.data, [])
+
+
+class TagCatalogTests(RoutedReadsTestCase):
+    """Tags are served and validated from the in-process catalog"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.fire = EmergencyTag.objects.create(name='Fire', emergency_type='FIRE')
+        self.client = APIClient()
+        self.client.force_authenticate(self.citizen)
+
+    def report(self, tag_ids):
+        return self.client.post('/api/emergency/reports/', {
+            'reporter_type': 'VICTIM', 'description': 'Smoke', 'tag_ids': [str(tag_id) for tag_id in tag_ids]
+        }, format='json')
+
+    def test_list_is_revalidated_with_etag(self):
+        response = self.client.get('/api/emergency/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([tag['name'] for tag in response.data], ['Fire'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/emergency/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        EmergencyTag.objects.create(name='Flood', emergency_type='NATURAL')
+        response = self.client.get('/api/emergency/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([tag['name'] for tag in response.data], ['Fire', 'Flood'])
+
+    def test_unknown_tag_ids_are_rejected(self):
+        response = self.report([self.fire.id, uuid.uuid4()])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown tag IDs', str(response.data['tag_ids']))
+        self.assertFalse(EmergencyReport.objects.exists())
+
+    def test_only_unknown_ids_are_queried(self):
+        tag_catalog.snapshot()
+        unknown = uuid.uuid4()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(tag_catalog.resolve([self.fire.id, unknown]), ([self.fire], [unknown]))
+        [query] = queries.captured_queries
+        self.assertIn(unknown.hex, query['sql'])
+        self.assertNotIn(self.fire.id.hex, query['sql'])
+
+    def test_tags_missing_from_a_stale_catalog_are_looked_up(self):
+        self.client.get('/api/emergency/tags/')
+        # Created without signals, as if the invalidation had not reached
+        # this worker yet
+        [flood] = EmergencyTag.objects.bulk_create([EmergencyTag(name='Flood', emergency_type='NATURAL')])
+
+        response = self.report([flood.id, self.fire.id])
+        self.assertEqual(response.status_code, 201)
+        report = EmergencyReport.objects.get()
+        self.assertEqual({tag.name for tag in report.tags.all()}, {'Fire', 'Flood'})
+
+
+class IncidentClusteringTests(TestCase):
+    """Reports are grouped into incidents when created and regrouped when moved"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.fire = EmergencyTag.objects.create(name='Fire', emergency_type='FIRE')
+        self.flood = EmergencyTag.objects.create(name='Flood', emergency_type='NATURAL')
+        self.client = APIClient()
+        self.client.force_authenticate(self.citizen)
+
+    def report(self, latitude, longitude, tag=None):
+        response = self.client.post('/api/emergency/reports/', {
+            'reporter_type': 'VICTIM', 'description': 'Smoke', 'latitude': latitude, 'longitude': longitude,
+            'tag_ids': [str((tag or self.fire).id)]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return EmergencyReport.objects.select_related('incident').get(pk=response.data['id'])
+
+    def test_nearby_report_joins_the_incident(self):
+        first = self.report(38.42, 27.13)
+        second = self.report(38.422, 27.132)
+        self.assertEqual(second.incident_id, first.incident_id)
+
+        incident = second.incident
+        self.assertEqual(incident.report_count, 2)
+        self.assertAlmostEqual(incident.latitude, 38.421)
+        self.assertAlmostEqual(incident.longitude, 27.131)
+
+        # The centroid is read afresh for every report that joins
+        third = self.report(38.424, 27.134)
+        incident.refresh_from_db()
+        self.assertEqual(third.incident_id, incident.id)
+        self.assertEqual(incident.report_count, 3)
+        self.assertAlmostEqual(incident.latitude, 38.422)
+
+    def test_distant_or_unrelated_report_opens_an_incident(self):
+        first = self.report(38.42, 27.13)
+        distant = self.report(38.6, 27.3)
+        unrelated = self.report(38.42, 27.13, tag=self.flood)
+        self.assertEqual(len({first.incident_id, distant.incident_id, unrelated.incident_id}), 3)
+        self.assertEqual(EmergencyIncident.objects.count(), 3)
+
+    def test_moved_report_is_reclustered(self):
+        first = self.report(38.42, 27.13)
+        second = self.report(38.422, 27.132)
+        distant = self.report(38.6, 27.3)
+
+        response = self.client.patch(f'/api/emergency/reports/{second.id}/', {
+            'latitude': 38.601, 'longitude': 27.301
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        second.refresh_from_db()
+        self.assertEqual(second.incident_id, distant.incident_id)
+        self.assertEqual(response.data['incident'], distant.incident_id)
+
+        # The incident it left is summarized from the report that remains
+        left = EmergencyIncident.objects.get(pk=first.incident_id)
+        self.assertEqual(left.report_count, 1)
+        self.assertAlmostEqual(left.latitude, 38.42)
+        self.assertEqual(EmergencyIncident.objects.get(pk=distant.incident_id).report_count, 2)
+
+        # An incident whose only report moves away is removed
+        self.client.patch(f'/api/emergency/reports/{first.id}/', {'latitude': 38.6, 'longitude': 27.3}, format='json')
+        self.assertFalse(EmergencyIncident.objects.filter(pk=left.pk).exists())
+        self.assertEqual(EmergencyIncident.objects.get().report_count, 3)
+
+
+class MultiLocationReportTests(TestCase):
+    """Multi-location reports are written in one transaction with a fixed number of queries"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.fire = EmergencyTag.objects.create(name='Fire', emergency_type='FIRE')
+        self.client = APIClient()
+        self.client.force_authenticate(self.citizen)
+
+    def locations(self, count):
+        return [{'latitude': 38.4 + i * 0.001, 'longitude': 27.1} for i in range(count)]
+
+    def post(self, locations):
+        return self.client.post('/api/emergency/reports/multi_location/', {
+            'description': 'Wildfire', 'tag_ids': [str(self.fire.id)], 'locations': locations
+        }, format='json')
+
+    def assertNothingCreated(self):
+        self.assertFalse(EmergencyReport.objects.exists())
+        self.assertFalse(EmergencyIncident.objects.exists())
+        self.assertFalse(HourlyReportCube.objects.exists())
+
+    def test_creates_reports_under_one_incident(self):
+        response = self.post(self.locations(3))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_locations'], 3)
+        incident = EmergencyIncident.objects.get()
+        self.assertEqual(incident.report_count, 3)
+        self.assertEqual(EmergencyReport.objects.filter(incident=incident, tags=self.fire).count(), 3)
+
+    def test_invalid_location_creates_nothing(self):
+        locations = self.locations(3)
+        locations[2]['latitude'] = 'north'
+        response = self.post(locations)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('latitude', response.data['locations'][2])
+        self.assertNothingCreated()
+
+    def test_failing_row_rolls_back_the_batch(self):
+        reports_data = [
+            {'description': 'Wildfire', 'reporter_type': 'SPECTATOR', 'latitude': 38.4, 'longitude': 27.1,
+             'tag_ids': [self.fire.id]}
+            for _ in range(3)
+        ]
+        # Rejected by the database, after the incident was written
+        reports_data[2]['description'] = None
+        with self.assertRaises(IntegrityError):
+            create_incident_reports(self.citizen, reports_data)
+        self.assertNothingCreated()
+
+    def test_query_count_does_not_grow_with_locations(self):
+        # Loads the tag catalog and creates this hour's cube cells
+        self.post(self.locations(1))
+        counts = []
+        for size in (2, 20):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post(self.locations(size)).status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ReportExportTests(RoutedReadsTestCase):
+    """The report export streams the filtered reports with their tag names"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pass', role='CITIZEN')
+        self.police = User.objects.create_user('police', 'police@example.com', 'pass', role='POLICE')
+        self.fire = EmergencyTag.objects.create(name='Fire', emergency_type='FIRE')
+        self.smoke = EmergencyTag.objects.create(name='Smoke', emergency_type='FIRE')
+
+        def report(reporter, latitude, longitude, status='PENDING', tags=()):
+            report = EmergencyReport.objects.create(
+                reporter=reporter, reporter_type='VICTIM', description='Fire',
+                latitude=latitude, longitude=longitude, status=status
+            )
+            report.tags.set(tags)
+            return report
+
+        self.inside = report(self.citizen, 38.42, 27.13, tags=[self.fire, self.smoke])
+        self.resolved = report(self.citizen, 38.43, 27.14, status='RESOLVED')
+        self.by_other = report(self.other, 38.44, 27.15)
+        self.outside = report(self.citizen, 39.5, 27.13, tags=[self.fire])
+        self.unlocated = report(self.citizen, None, None)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.police)
+
+    def export(self, **params):
+        response = self.client.get('/api/emergency/reports/export/', {'export_format': 'ndjson', **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_bbox_filtered_ndjson(self):
+        rows = self.export(bbox='26.9,38.3,27.3,38.5')
+        self.assertEqual(
+            sorted(row['id'] for row in rows),
+            sorted(str(report.id) for report in (self.inside, self.resolved, self.by_other))
+        )
+        row = next(row for row in rows if row['id'] == str(self.inside.id))
+        self.assertEqual(sorted(row['tags'].split(';')), ['Fire', 'Smoke'])
+        self.assertEqual((row['latitude'], row['longitude'], row['status']), (38.42, 27.13, 'PENDING'))
+
+        # Combined with the list filters
+        rows = self.export(bbox='26.9,38.3,27.3,38.5', status='PENDING', emergency_type='FIRE')
+        self.assertEqual([row['id'] for row in rows], [str(self.inside.id)])
+
+    def test_citizens_export_their_own_reports(self):
+        self.client.force_authenticate(self.citizen)
+        rows = self.export(bbox='26.9,38.3,27.3,38.5')
+        self.assertEqual(
+            sorted(row['id'] for row in rows), sorted(str(report.id) for report in (self.inside, self.resolved))
+        )
+
+    def test_invalid_bbox(self):
+        for bbox in ('26.9,38.3,27.3', 'a,b,c,d'):
+            response = self.client.get('/api/emergency/reports/export/', {'export_format': 'ndjson', 'bbox': bbox})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('bbox', response.data['error'])
+
+
+class StationIndexTests(TestCase):
+    """Grid ranking returns the same units as a brute-force scan"""
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        stations = [
+            (uuid.uuid4(), rng.choice(SERVICE_ROLES), rng.uniform(36, 42), rng.uniform(26, 45))
+            for _ in range(1000)
+        ]
+        busy = {station[0] for station in stations[:200]}
+        index = StationIndex(stations, cell_size=0.1)
+
+        for _ in range(100):
+            latitude, longitude = rng.uniform(35, 43), rng.uniform(25, 46)
+            roles = rng.sample(SERVICE_ROLES, rng.randint(1, 3))
+            expected = sorted(
+                (haversine_km(latitude, longitude, lat, lng), user_id)
+                for user_id, role, lat, lng in stations
+                if role in roles and user_id not in busy
+            )[:5]
+            ranked = index.nearest(latitude, longitude, roles, k=5, exclude=busy)
+            self.assertEqual([user_id for _, user_id, _ in ranked], [user_id for _, user_id in expected])
+
+    def test_max_distance(self):
+        near, far = uuid.uuid4(), uuid.uuid4()
+        index = StationIndex([(near, 'POLICE', 38.0, 27.0), (far, 'POLICE', 39.0, 27.0)])
+        ranked = index.nearest(38.0, 27.0, ['POLICE'], k=5, max_distance_km=50)
+        self.assertEqual([user_id for _, user_id, _ in ranked], [near])
+
+
+class DispatchTests(TestCase):
+    """Recommendations skip busy units until their report is resolved"""
+
+    def setUp(self):
+        cache.clear()
+        self.citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass', role='CITIZEN')
+        self.police = User.objects.create_user(
+            'police', 'police@example.com', 'pass', role='POLICE',
+            location={'latitude': 38.42, 'longitude': 27.13}
+        )
+        self.near = User.objects.create_user(
+            'near', 'near@example.com', 'pass', role='FIRE_STATION',
+            location={'latitude': 38.43, 'longitude': 27.13}
+        )
+        self.far = User.objects.create_user(
+            'far', 'far@example.com', 'pass', role='FIRE_STATION',
+            location={'latitude': 38.60, 'longitude': 27.13}
+        )
+        fire = EmergencyTag.objects.create(name='Fire', emergency_type='FIRE')
+        self.report = EmergencyReport.objects.create(
+            reporter=self.citizen, reporter_type='VICTIM', description='Fire',
+            latitude=38.42, longitude=27.13
+        )
+        self.report.tags.set([fire])
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.police)
+        self.url = f'/api/emergency/reports/{self.report.id}/'
+
+    def ranked(self, **params):
+        response = self.client.get(self.url + 'recommended_responders/', params)
+        self.assertEqual(response.status_code, 200)
+        return [candidate['username'] for candidate in response.data]
+
+    def test_ranks_matching_role_by_distance(self):
+        self.assertEqual(self.ranked(), ['near', 'far'])
+        self.assertEqual(self.ranked(k=1), ['near'])
+        self.assertEqual(self.ranked(role='POLICE'), ['police'])
+
+    def test_busy_units_are_excluded_until_resolved(self):
+        response = self.client.post(self.url + 'assign_responder/', {'responder': str(self.near.id)})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.ranked(), ['far'])
+
+        response = self.client.post(self.url + 'assign_responder/', {'responder': str(self.near.id)})
+        self.assertEqual(response.status_code, 409)
+
+        self.client.post(self.url + 'update_status/', {'status': 'RESOLVED'})
+        self.assertEqual(self.ranked(), ['near', 'far'])
+
+    def test_resolved_reports_take_no_dispatches(self):
+        self.client.post(self.url + 'update_status/', {'status': 'RESOLVED'})
+        response = self.client.post(self.url + 'assign_responder/', {'responder': str(self.near.id)})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.ranked(), ['near', 'far'])
+
+    def test_resolving_again_releases_open_dispatches(self):
+        self.report.status = 'RESOLVED'
+        self.report.save()
+        # e.g. left open by an earlier version
+        EmergencyDispatch.objects.create(report=self.report, responder=self.near)
+        self.assertEqual(self.ranked(), ['far'])
+
+        response = self.client.post(self.url + 'update_status/', {'status': 'RESOLVED'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ranked(), ['near', 'far'])
+
+    def test_moved_station_is_reindexed(self):
+        self.ranked()
+        self.far.location = {'latitude': 38.42, 'longitude': 27.13}
+        self.far.save()
+        self.assertEqual(self.ranked(), ['far', 'near'])
 
-# Create your tests here.
+    def test_hidden_from_citizens(self):
+        self.client.force_authenticate(self.citizen)
+        response = self.client.get(self.url + 'recommended_responders/')
+        self.assertEqual(response.status_code, 403)
@@ -4,7 +4,9 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     EmergencyTagViewSet,
     EmergencyReportViewSet,
+    EmergencyIncidentViewSet,
     NearbyEmergenciesView,
+    NearbyIncidentsView,
     EmergencyStatsByTagView
 )
 
@@ -12,10 +14,12 @@ router = DefaultRouter()
 # Ensure trailing slashes for viewsets
 router.register(r'reports', EmergencyReportViewSet, basename='emergencyreport')
 router.register(r'tags', EmergencyTagViewSet)
+router.register(r'incidents', EmergencyIncidentViewSet, basename='emergencyincident')
 
 urlpatterns = [
     path('', include(router.urls)),
     # Add trailing slashes to other URLs
     path('nearby/', NearbyEmergenciesView.as_view(), name='nearby-emergencies'),
+    path('nearby/incidents/', NearbyIncidentsView.as_view(), name='nearby-incidents'),
     path('stats/tags/', EmergencyStatsByTagView.as_view(), name='emergency-tag-stats'),
 ]
@@ -1,15 +1,32 @@
 from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from rest_framework import generics, mixins, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 from django_filters.rest_framework import DjangoFilterBackend
+import csv
+import json
 import math
-from django.db.models import F, Func
+import uuid
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 import logging
 
-from .models import EmergencyReport, EmergencyTag
-from .serializers import EmergencyReportSerializer, EmergencyTagSerializer
+from .models import EmergencyReport, EmergencyTag, EmergencyIncident, EmergencyDispatch
+from .serializers import EmergencyReportSerializer, EmergencyTagSerializer, EmergencyIncidentSerializer
+from .services import tag_report_counts, create_incident_reports, record_status_change
+from .catalog import tag_catalog
+from .clustering import nearby_incidents
+from .dispatch import SERVICE_ROLES, recommend_responders
+from analytics.cubes import cube_key, move_report
+from analytics.exports import iter_keyset
+from monitoring.metrics import (
+    report_create_seconds, report_create_total, report_status_update_seconds, report_status_update_total, timed_view
+)
 from users.permissions import IsCitizen, IsFireStation, IsPolice, IsRedCrescent
 from notifications.models import Notification
 from users.models import User
@@ -18,6 +35,36 @@ from social.views import post_emergency_to_social_media
 # Set up logger
 logger = logging.getLogger(__name__)
 
+class Echo:
+    """File-like object that returns what is written, for streaming csv.writer output"""
+    def write(self, value):
+        return value
+
+def tag_stats_response(request):
+    """
+    Tag usage counts for the stats endpoints, with optional status and
+    since/until (YYYY-MM-DD) filters
+    """
+    status_value = request.query_params.get('status')
+    if status_value and status_value not in dict(EmergencyReport.STATUS_CHOICES):
+        return Response(
+            {'error': f'Invalid status. Must be one of {list(dict(EmergencyReport.STATUS_CHOICES))}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    dates = {}
+    for param in ['since', 'until']:
+        value = request.query_params.get(param)
+        if value:
+            dates[param] = parse_date(value)
+            if dates[param] is None:
+                return Response(
+                    {'error': f'{param} must be a date in YYYY-MM-DD format'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+    
+    return Response(tag_report_counts(status=status_value, **dates))
+
 class EmergencyTagViewSet(mixins.RetrieveModelMixin,
                           mixins.ListModelMixin,
                           GenericViewSet):
@@ -28,14 +75,35 @@ class EmergencyTagViewSet(mixins.RetrieveModelMixin,
     serializer_class = EmergencyTagSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def list(self, request, *args, **kwargs):
+        """
+        List tags from the in-process tag catalog. The catalog version is sent
+        as an ETag so clients can revalidate with If-None-Match.
+        """
+        version, _ = tag_catalog.snapshot()
+        etag = f'"{version}"'
+        
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [value.strip() for value in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        serializer = self.get_serializer(tag_catalog.all(), many=True)
+        return Response(serializer.data, headers={'ETag': etag})
+    
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a tag from the catalog"""
+        try:
+            tag = tag_catalog.get(uuid.UUID(str(kwargs[self.lookup_field])))
+        except ValueError:
+            tag = None
+        if tag is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(tag).data)
+    
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get statistics about emergency tags usage"""
-        tags_with_counts = EmergencyTag.objects.annotate(
-            count=Func(F('emergencyreport'), function='COUNT')
-        ).values('id', 'name', 'emergency_type', 'count')
-        
-        return Response(tags_with_counts)
+        return tag_stats_response(request)
 
 class EmergencyReportViewSet(mixins.CreateModelMixin,
                             mixins.RetrieveModelMixin,
@@ -48,7 +116,7 @@ class EmergencyReportViewSet(mixins.CreateModelMixin,
     """
     serializer_class = EmergencyReportSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['status', 'is_emergency', 'reporter_type']
+    filterset_fields = ['status', 'is_emergency', 'reporter_type', 'incident']
     search_fields = ['description']
     ordering_fields = ['timestamp']
     ordering = ['-timestamp']
@@ -57,7 +125,7 @@ class EmergencyReportViewSet(mixins.CreateModelMixin,
         """
         Instantiates and returns the list of permissions that this view requires.
         """
-        if self.action == 'update_status':
+        if self.action in ['update_status', 'recommended_responders', 'assign_responder']:
             permission_classes = [permissions.IsAuthenticated, IsFireStation | IsPolice | IsRedCrescent]
         else:
             permission_classes = [permissions.IsAuthenticated]
@@ -71,8 +139,13 @@ class EmergencyReportViewSet(mixins.CreateModelMixin,
         """
         user = self.request.user
         if user.is_staff or user.role in ['FIRE_STATION', 'POLICE', 'RED_CRESCENT']:
-            return EmergencyReport.objects.all().select_related('reporter').prefetch_related('tags')
-        return EmergencyReport.objects.filter(reporter=user).select_related('reporter').prefetch_related('tags')
+            queryset = EmergencyReport.objects.all()
+        else:
+            queryset = EmergencyReport.objects.filter(reporter=user)
+        if self.action == 'update_status':
+            # Read inside update_status' transaction; the reporter row stays unlocked
+            queryset = queryset.select_for_update(of=('self',))
+        return queryset.select_related('reporter').prefetch_related('tags')
     
     def perform_create(self, serializer):
         """
@@ -88,6 +161,7 @@ class EmergencyReportViewSet(mixins.CreateModelMixin,
         logger.debug(f"Creating emergency report with serializer data: {serializer.validated_data}")
         return serializer.save(reporter=self.request.user)
 
+    @timed_view(report_create_seconds, report_create_total, endpoint='create')
     def create(self, request, *args, **kwargs):
         """Create a standard emergency report with detailed logging for debugging"""
         logger.debug("=== EmergencyReportViewSet.create Request ===")
@@ -154,6 +228,7 @@ class EmergencyReportViewSet(mixins.CreateModelMixin,
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['post'])
+    @timed_view(report_create_seconds, report_create_total, endpoint='report_emergency')
     def report_emergency(self, request):
         """
         Custom action for reporting emergencies
@@ -232,30 +307,40 @@ class EmergencyReportViewSet(mixins.CreateModelMixin,
             )
     
     @action(detail=True, methods=['post'])
+    @timed_view(report_status_update_seconds, report_status_update_total)
     def update_status(self, request, pk=None):
         """
         Update the status of an emergency report (for emergency services)
         """
-        report = self.get_object()
-        old_status = report.status
-        
         status_value = request.data.get('status')
-        if not status_value:
-            return Response(
-                {'error': 'Status is required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if status is valid
         valid_statuses = ['PENDING', 'RESPONDING', 'ON_SCENE', 'RESOLVED']
-        if status_value not in valid_statuses:
-            return Response(
-                {'error': f'Invalid status. Must be one of {valid_statuses}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
         
-        report.status = status_value
-        report.save()
+        with transaction.atomic():
+            # get_queryset locks the row for this action, so concurrent updates
+            # each log and move the cube counts from the status they replaced
+            report = self.get_object()
+            
+            if not status_value:
+                return Response(
+                    {'error': 'Status is required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Check if status is valid
+            if status_value not in valid_statuses:
+                return Response(
+                    {'error': f'Invalid status. Must be one of {valid_statuses}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            old_status = report.status
+            report.status = status_value
+            report.save()
+            
+            # Log the transition so analytics can measure response times
+            record_status_change(report, old_status, request.user)
+            if status_value != old_status:
+                move_report(cube_key(report, status=old_status), cube_key(report))
         
         # Create notification for the reporter
         if report.reporter.id != request.user.id:
@@ -270,59 +355,258 @@ class EmergencyReportViewSet(mixins.CreateModelMixin,
         serializer = self.get_serializer(report)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def recommended_responders(self, request, pk=None):
+        """
+        Rank available service units for a report by distance.
+        Query params: k (default 5, max 50), role (restrict to one service),
+        max_distance (km).
+        """
+        report = self.get_object()
+        params = request.query_params
+        
+        try:
+            k = min(max(int(params.get('k', 5)), 1), 50)
+            max_distance = float(params['max_distance']) if params.get('max_distance') else None
+        except ValueError:
+            return Response(
+                {'error': 'k must be an integer and max_distance a number'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        roles = None
+        if params.get('role'):
+            if params['role'] not in SERVICE_ROLES:
+                return Response(
+                    {'error': f'Invalid role. Must be one of {SERVICE_ROLES}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            roles = [params['role']]
+        
+        candidates = recommend_responders(report, k=k, roles=roles, max_distance_km=max_distance)
+        usernames = dict(User.objects.filter(
+            id__in=[c['responder'] for c in candidates]
+        ).values_list('id', 'username'))
+        for candidate in candidates:
+            candidate['username'] = usernames.get(candidate['responder'])
+        
+        return Response(candidates)
+    
+    @action(detail=True, methods=['post'])
+    def assign_responder(self, request, pk=None):
+        """
+        Dispatch a service unit to a report. The unit stays busy (and out of
+        recommendations) until the report is resolved.
+        """
+        report = self.get_object()
+        
+        # The report and responder rows are locked until the dispatch is
+        # written, so that concurrent requests cannot dispatch one unit twice
+        # or to a report being resolved
+        with transaction.atomic():
+            report = EmergencyReport.objects.select_for_update().get(pk=report.pk)
+            if report.status == 'RESOLVED':
+                return Response(
+                    {'error': 'Report is already resolved'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            try:
+                responder = User.objects.select_for_update().get(
+                    pk=request.data.get('responder'), role__in=SERVICE_ROLES
+                )
+            except (User.DoesNotExist, ValueError, DjangoValidationError):
+                return Response(
+                    {'error': 'responder must be the id of a service account'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if responder.dispatches.filter(released_at__isnull=True).exists():
+                return Response(
+                    {'error': 'Responder is already dispatched to another emergency'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            dispatch = EmergencyDispatch.objects.create(
+                report=report,
+                responder=responder,
+                dispatched_by=request.user
+            )
+        
+        if responder.id != request.user.id:
+            Notification.objects.create(
+                recipient=responder,
+                title='Emergency Dispatch',
+                message=f'You have been dispatched to an emergency: {report.description[:100]}',
+                notification_type='EMERGENCY'
+            )
+        
+        return Response({
+            'id': dispatch.id,
+            'report': report.id,
+            'responder': responder.id,
+            'timestamp': dispatch.timestamp
+        }, status=status.HTTP_201_CREATED)
+    
+    # Columns of the streaming export, read with values_list instead of the serializer
+    EXPORT_FIELDS = [
+        'id', 'reporter_id', 'reporter_type', 'description', 'latitude', 'longitude',
+        'is_emergency', 'status', 'region', 'timestamp'
+    ]
+    EXPORT_CHUNK_SIZE = 2000
+    
+    def filter_export_queryset(self, queryset):
+        """
+        Apply the export-only filters: tag (id), emergency_type, since/until
+        (YYYY-MM-DD) and bbox (min_lng,min_lat,max_lng,max_lat).
+        Raises ValueError for malformed values.
+        """
+        params = self.request.query_params
+        through = EmergencyReport.tags.through
+        
+        if params.get('tag'):
+            try:
+                tag_id = uuid.UUID(params['tag'])
+            except ValueError:
+                raise ValueError('tag must be a tag id')
+            queryset = queryset.filter(id__in=through.objects.filter(
+                emergencytag_id=tag_id
+            ).values('emergencyreport_id'))
+        if params.get('emergency_type'):
+            queryset = queryset.filter(id__in=through.objects.filter(
+                emergencytag__emergency_type=params['emergency_type']
+            ).values('emergencyreport_id'))
+        
+        for param, lookup in (('since', 'timestamp__date__gte'), ('until', 'timestamp__date__lte')):
+            if params.get(param):
+                value = parse_date(params[param])
+                if value is None:
+                    raise ValueError(f'{param} must be a date in YYYY-MM-DD format')
+                queryset = queryset.filter(**{lookup: value})
+        
+        if params.get('bbox'):
+            try:
+                min_lng, min_lat, max_lng, max_lat = [float(v) for v in params['bbox'].split(',')]
+            except ValueError:
+                raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+            queryset = queryset.filter(
+                latitude__gte=min_lat, latitude__lte=max_lat,
+                longitude__gte=min_lng, longitude__lte=max_lng
+            )
+        
+        return queryset
+    
+    def iter_export_rows(self, queryset):
+        """Yield export rows as dicts, one chunk of reports (plus one tag query) at a time"""
+        through = EmergencyReport.tags.through
+        for chunk in iter_keyset(queryset, self.EXPORT_FIELDS, self.EXPORT_CHUNK_SIZE):
+            tag_names = {}
+            tag_rows = through.objects.filter(
+                emergencyreport_id__in=[row[0] for row in chunk]
+            ).values_list('emergencyreport_id', 'emergencytag__name')
+            for report_id, name in tag_rows:
+                tag_names.setdefault(report_id, []).append(name)
+            
+            for row in chunk:
+                data = dict(zip(self.EXPORT_FIELDS, row))
+                data['tags'] = ';'.join(tag_names.get(row[0], []))
+                yield data
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the (filtered) incident list as CSV or NDJSON.
+        Accepts the list filters plus tag, emergency_type, since, until and bbox.
+        """
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in ['csv', 'ndjson']:
+            return Response(
+                {'error': 'export_format must be one of csv, ndjson'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        try:
+            queryset = self.filter_export_queryset(queryset)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        columns = self.EXPORT_FIELDS + ['tags']
+        rows = self.iter_export_rows(queryset)
+        
+        if export_format == 'csv':
+            writer = csv.writer(Echo())
+            
+            def stream():
+                # The header goes out before the first query runs
+                yield writer.writerow(columns)
+                for data in rows:
+                    yield writer.writerow([data[column] for column in columns])
+            
+            response = StreamingHttpResponse(stream(), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="emergency_reports.csv"'
+        else:
+            stream = (json.dumps(data, cls=DjangoJSONEncoder) + '\n' for data in rows)
+            response = StreamingHttpResponse(stream, content_type='application/x-ndjson')
+            response['Content-Disposition'] = 'attachment; filename="emergency_reports.ndjson"'
+        
+        return response
+    
     @action(detail=False, methods=['post'])
+    @timed_view(report_create_seconds, report_create_total, endpoint='multi_location')
     def multi_location(self, request):
         """
-        Report an emergency affecting multiple locations (e.g., wildfire)
+        Report an emergency affecting multiple locations (e.g., wildfire).
+        Every location is validated before anything is written; the reports are
+        then bulk inserted in one transaction and linked by a shared incident.
         """
         try:
             # Validate request data
-            if not request.data.get('locations') or not isinstance(request.data.get('locations'), list):
+            locations = request.data.get('locations')
+            if not locations or not isinstance(locations, list):
                 return Response(
                     {'error': 'At least one location is required'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            if not all(isinstance(location, dict) for location in locations):
+                return Response(
+                    {'error': 'Each location must be an object with latitude and longitude'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            # Create main report from the first location
-            first_location = request.data.get('locations')[0]
-            report_data = {
-                'description': request.data.get('description'),
-                'reporter_type': request.data.get('reporter_type', 'SPECTATOR'),
-                'is_emergency': request.data.get('is_emergency', True),
-                'latitude': first_location.get('latitude'),
-                'longitude': first_location.get('longitude'),
-                'tag_ids': request.data.get('tag_ids', [])
-            }
+            reports_data = [
+                {
+                    'description': request.data.get('description'),
+                    'reporter_type': request.data.get('reporter_type', 'SPECTATOR'),
+                    'is_emergency': request.data.get('is_emergency', True),
+                    'latitude': location.get('latitude'),
+                    'longitude': location.get('longitude'),
+                    'tag_ids': request.data.get('tag_ids', [])
+                }
+                for location in locations
+            ]
             
-            # Create emergency report
-            report_serializer = self.get_serializer(data=report_data)
-            if report_serializer.is_valid():
-                main_report = report_serializer.save(reporter=request.user)
-                
-                # Create additional reports for other locations
-                additional_reports = []
-                for location_data in request.data.get('locations')[1:]:
-                    additional_report_data = {
-                        'description': request.data.get('description'),
-                        'reporter_type': request.data.get('reporter_type', 'SPECTATOR'),
-                        'is_emergency': request.data.get('is_emergency', True),
-                        'latitude': location_data.get('latitude'),
-                        'longitude': location_data.get('longitude'),
-                        'tag_ids': request.data.get('tag_ids', [])
-                    }
-                    additional_report_serializer = self.get_serializer(data=additional_report_data)
-                    if additional_report_serializer.is_valid():
-                        additional_report = additional_report_serializer.save(reporter=request.user)
-                        additional_reports.append(additional_report_serializer.data)
-                
-                # Return combined response
-                return Response({
-                    'main_report': report_serializer.data,
-                    'additional_reports': additional_reports,
-                    'total_locations': len(request.data.get('locations'))
-                }, status=status.HTTP_201_CREATED)
+            # Validate all locations up front
+            serializer = self.get_serializer(data=reports_data, many=True)
+            if not serializer.is_valid():
+                return Response({'locations': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
             
-            return Response(report_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            incident, reports = create_incident_reports(
+                request.user,
+                serializer.validated_data,
+                description=request.data.get('description')
+            )
+            
+            prefetch_related_objects(reports, 'tags')
+            reports_data = self.get_serializer(reports, many=True).data
+            
+            # Return combined response
+            return Response({
+                'incident': str(incident.id),
+                'main_report': reports_data[0],
+                'additional_reports': reports_data[1:],
+                'total_locations': len(reports)
+            }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
             logger.exception("Error in multi_location")
@@ -381,6 +665,52 @@ class NearbyEmergenciesView(generics.ListAPIView):
         distance = R * c
         return round(distance, 2)
 
+class EmergencyIncidentViewSet(mixins.RetrieveModelMixin,
+                              mixins.ListModelMixin,
+                              GenericViewSet):
+    """
+    Incidents that group duplicate reports of the same event.
+    Reports are assigned to incidents automatically when they are created.
+    """
+    serializer_class = EmergencyIncidentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['is_active']
+    ordering_fields = ['timestamp', 'last_reported_at', 'report_count']
+    ordering = ['-last_reported_at']
+    
+    def get_queryset(self):
+        """
+        - Admin and emergency services: all incidents
+        - Regular users: incidents containing one of their reports
+        """
+        user = self.request.user
+        incidents = EmergencyIncident.objects.prefetch_related('tags')
+        if user.is_staff or user.role in ['FIRE_STATION', 'POLICE', 'RED_CRESCENT']:
+            return incidents
+        return incidents.filter(reports__reporter=user).distinct()
+
+class NearbyIncidentsView(generics.ListAPIView):
+    """Find active incidents within a specific radius, nearest first"""
+    serializer_class = EmergencyIncidentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        lat = self.request.query_params.get('lat')
+        lng = self.request.query_params.get('lng')
+        radius = float(self.request.query_params.get('radius', 5.0))  # Default 5km
+        
+        if not lat or not lng:
+            return EmergencyIncident.objects.none()
+        
+        # Only incidents in the grid cells around the point are loaded
+        incidents = []
+        for distance, incident in nearby_incidents(float(lat), float(lng), radius):
+            incident.distance = round(distance, 2)  # Attach distance for serializer
+            incidents.append(incident)
+        prefetch_related_objects(incidents, 'tags')
+        return incidents
+
 class EmergencyStatsByTagView(generics.ListAPIView):
     """Get statistics about emergency reports by tag type"""
     serializer_class = EmergencyTagSerializer
@@ -395,17 +725,8 @@ class EmergencyStatsByTagView(generics.ListAPIView):
         return EmergencyTag.objects.all()
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        data = []
-        
-        for tag in queryset:
-            # Count reports with this tag
-            report_count = tag.reports.count()
-            data.append({
-                'id': tag.id,
-                'name': tag.name,
-                'emergency_type': tag.emergency_type,
-                'count': report_count
-            })
-            
-        return Response(data)
\ No newline at end of file
+        user = request.user
+        if not (user.is_staff or user.role in ['FIRE_STATION', 'POLICE', 'RED_CRESCENT']):
+            return Response([])
+        
+        return tag_stats_response(request)
\ No newline at end of file
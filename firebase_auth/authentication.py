@@ -4,6 +4,7 @@ from rest_framework.exceptions import AuthenticationFailed
 import requests
 import json
 from django.conf import settings
+from monitoring.metrics import firebase_auth_seconds, firebase_auth_total
 
 User = get_user_model()
 
@@ -28,15 +29,22 @@ class FirebaseAuthentication(authentication.BaseAuthentication):
             firebase_api_key = settings.FIREBASE_CONFIG['apiKey']
             verification_url = f"https://identitytoolkit.googleapis.com/v1/accounts:lookup?key={firebase_api_key}"
             
-            response = requests.post(
-                verification_url,
-                json={"idToken": id_token}
-            )
+            try:
+                with firebase_auth_seconds.time():
+                    response = requests.post(
+                        verification_url,
+                        json={"idToken": id_token}
+                    )
+            except requests.RequestException:
+                firebase_auth_total.inc(result='error')
+                raise
             
             if response.status_code != 200:
+                firebase_auth_total.inc(result='rejected')
                 error_data = response.json()
                 raise AuthenticationFailed(f"Firebase token verification failed: {error_data.get('error', {}).get('message')}")
             
+            firebase_auth_total.inc(result='success')
             user_data = response.json().get('users', [])[0]
             firebase_uid = user_data.get('localId')
             email = user_data.get('email', '')
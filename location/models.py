@@ -15,5 +15,24 @@ class Location(models.Model):
             models.Index(fields=['user', 'timestamp']),  
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_stored_state()
+        return instance
+
+    def _remember_stored_state(self):
+        # Whether the stored location is an emergency (None if not loaded), so
+        # the map signals can skip updates of ordinary locations
+        self.stored_is_emergency = self.__dict__.get('is_emergency')
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_stored_state()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_stored_state()
+
     def __str__(self):
         return f"{self.user.username} - {self.timestamp}"
\ No newline at end of file
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MapServicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'map_services'
+
+    def ready(self):
+        import map_services.signals
@@ -0,0 +1,408 @@
+"""
+Hierarchical clustering of emergency points for interactive maps.
+
+The index covers active emergency reports and emergency Locations. Like
+supercluster it answers "clusters in this bounding box at this zoom" from
+precomputed per-zoom aggregates, but the clusters are the cells of a grid
+MAP_CLUSTER_RADIUS_PX screen pixels wide at each zoom. Every point falls in
+exactly one cell per zoom, so adding or removing a point updates one count
+per zoom level instead of re-running the clustering.
+
+Processes share changes through a journal in the cache: every change gets a
+sequence number (see record_point_changes) and each worker's index replays
+the entries it has not applied yet, rebuilding from the database only when
+it falls too far behind or an entry expired.
+"""
+import math
+import threading
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from emergency.models import EmergencyReport
+from location.models import Location
+from .hazards import ACTIVE_STATUSES
+from .tiles import mercator
+
+TILE_SIZE_BITS = 8  # 256 px map tiles
+
+CLUSTER_SEQUENCE_KEY = 'map:clusters:sequence'
+
+
+class ZoomLevel:
+    """Point count and coordinate sums per non-empty grid cell at one zoom"""
+
+    def __init__(self, bits):
+        self.bits = bits  # The grid is 2**bits cells across
+        self.cells = {}  # cell key (y << bits | x) -> slot in the arrays below
+        self.counts = array('l')
+        self.latitude_sums = array('d')
+        self.longitude_sums = array('d')
+        # XOR of the member point ids: the id of the only member when count is 1
+        self.members = array('q')
+        self._free = []
+
+    def add(self, cell, point, latitude, longitude):
+        """Add a point to a cell and return the cell's slot"""
+        slot = self.cells.get(cell)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self.counts)
+                for values in (self.counts, self.latitude_sums, self.longitude_sums, self.members):
+                    values.append(0)
+            self.cells[cell] = slot
+        self.counts[slot] += 1
+        self.latitude_sums[slot] += latitude
+        self.longitude_sums[slot] += longitude
+        self.members[slot] ^= point
+        return slot
+
+    def remove(self, cell, point, latitude, longitude):
+        slot = self.cells[cell]
+        self.counts[slot] -= 1
+        if self.counts[slot] == 0:
+            del self.cells[cell]
+            self.latitude_sums[slot] = self.longitude_sums[slot] = 0.0
+            self.members[slot] = 0
+            self._free.append(slot)
+            return
+        self.latitude_sums[slot] -= latitude
+        self.longitude_sums[slot] -= longitude
+        self.members[slot] ^= point
+
+    def cells_within(self, x0, y0, x1, y1):
+        """(cell, slot) of the non-empty cells in a range of grid coordinates"""
+        bits, cells = self.bits, self.cells
+        # Walk whichever is smaller: the cells in the range or the non-empty cells
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(cells):
+            for y in range(y0, y1 + 1):
+                row = y << bits
+                for x in range(x0, x1 + 1):
+                    slot = cells.get(row | x)
+                    if slot is not None:
+                        yield row | x, slot
+        else:
+            mask = (1 << bits) - 1
+            for cell, slot in cells.items():
+                x, y = cell & mask, cell >> bits
+                if x0 <= x <= x1 and y0 <= y <= y1:
+                    yield cell, slot
+
+
+class ClusterIndex:
+    """
+    Per-zoom cell aggregates (zooms 0 to MAP_CLUSTER_MAX_ZOOM) of a set of
+    points keyed by (kind, id), e.g. ('report', '<uuid>').
+
+    Cells are radius_px (rounded down to a power of two) screen pixels wide,
+    so every cell splits into exactly four at the next zoom: a point's cell
+    at any zoom is its finest cell shifted right. Points in the same finest
+    cell are chained in a linked list, to list them beyond max_zoom.
+    """
+
+    def __init__(self, max_zoom=None, radius_px=None):
+        self.max_zoom = settings.MAP_CLUSTER_MAX_ZOOM if max_zoom is None else max_zoom
+        radius_bits = max(0, int(math.log2(radius_px or settings.MAP_CLUSTER_RADIUS_PX)))
+        self.levels = [
+            ZoomLevel(max(0, TILE_SIZE_BITS + zoom - radius_bits))
+            for zoom in range(self.max_zoom + 1)
+        ]
+        self.bits = self.levels[-1].bits
+        self.shifts = [self.bits - level.bits for level in self.levels]
+
+        self.points = {}  # key -> point id
+        self.keys = []  # point id -> key (None once removed)
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.finest_x = array('l')
+        self.finest_y = array('l')
+        self.next_point = array('q')  # Next point in the same finest cell, or -1
+        self.first_point = array('q')  # Finest cell slot -> first point, or -1
+        self._free = []
+        # Journal position this index reflects (see ClusterRegistry)
+        self.sequence = 0
+
+    def __len__(self):
+        return len(self.points)
+
+    def add(self, key, latitude, longitude):
+        """Add a point, or move it if the key is already indexed"""
+        if key in self.points:
+            self.remove(key)
+        point = self.add_to_finest(key, latitude, longitude)
+        x, y = self.finest_x[point], self.finest_y[point]
+        for level, shift in zip(self.levels[:-1], self.shifts):
+            level.add((y >> shift) << level.bits | (x >> shift), point, latitude, longitude)
+
+    def add_to_finest(self, key, latitude, longitude):
+        """Store a new point and add it to its finest cell only; returns the point id"""
+        mx, my = mercator(latitude, longitude)
+        size = 1 << self.bits
+        x = min(max(int(mx * size), 0), size - 1)
+        y = min(max(int(my * size), 0), size - 1)
+
+        if self._free:
+            point = self._free.pop()
+            self.keys[point] = key
+            self.latitudes[point], self.longitudes[point] = latitude, longitude
+            self.finest_x[point], self.finest_y[point] = x, y
+        else:
+            point = len(self.keys)
+            self.keys.append(key)
+            self.latitudes.append(latitude)
+            self.longitudes.append(longitude)
+            self.finest_x.append(x)
+            self.finest_y.append(y)
+            self.next_point.append(-1)
+        self.points[key] = point
+
+        finest = self.levels[-1]
+        slot = finest.add(y << finest.bits | x, point, latitude, longitude)
+        while len(self.first_point) <= slot:
+            self.first_point.append(-1)
+        self.next_point[point] = self.first_point[slot] if finest.counts[slot] > 1 else -1
+        self.first_point[slot] = point
+        return point
+
+    def remove(self, key):
+        point = self.points.pop(key, None)
+        if point is None:
+            return
+        latitude, longitude = self.latitudes[point], self.longitudes[point]
+        x, y = self.finest_x[point], self.finest_y[point]
+
+        finest = self.levels[-1]
+        slot = finest.cells[y << finest.bits | x]
+        if self.first_point[slot] == point:
+            self.first_point[slot] = self.next_point[point]
+        else:
+            previous = self.first_point[slot]
+            while self.next_point[previous] != point:
+                previous = self.next_point[previous]
+            self.next_point[previous] = self.next_point[point]
+
+        for level, shift in zip(self.levels, self.shifts):
+            level.remove((y >> shift) << level.bits | (x >> shift), point, latitude, longitude)
+        self.keys[point] = None
+        self._free.append(point)
+
+    def load(self, changes):
+        """
+        Fill an empty index from journal entries in one pass: points go into
+        the finest cells, and each coarser level is summed from the level
+        below, which is much faster than adding points one by one.
+        """
+        for kind, object_id, latitude, longitude in changes:
+            if latitude is None or longitude is None:
+                continue
+            key = (kind, object_id)
+            if key in self.points:
+                self.remove(key)
+            self.add_to_finest(key, latitude, longitude)
+
+        for finer, level, finer_shift, shift in zip(
+                reversed(self.levels), reversed(self.levels[:-1]),
+                reversed(self.shifts), reversed(self.shifts[:-1])):
+            step = shift - finer_shift
+            mask = (1 << finer.bits) - 1
+            cells, counts, latitude_sums, longitude_sums, members = (
+                level.cells, level.counts, level.latitude_sums, level.longitude_sums, level.members
+            )
+            for cell, finer_slot in finer.cells.items():
+                parent = ((cell >> finer.bits) >> step) << level.bits | ((cell & mask) >> step)
+                slot = cells.get(parent)
+                if slot is None:
+                    cells[parent] = len(counts)
+                    counts.append(finer.counts[finer_slot])
+                    latitude_sums.append(finer.latitude_sums[finer_slot])
+                    longitude_sums.append(finer.longitude_sums[finer_slot])
+                    members.append(finer.members[finer_slot])
+                else:
+                    counts[slot] += finer.counts[finer_slot]
+                    latitude_sums[slot] += finer.latitude_sums[finer_slot]
+                    longitude_sums[slot] += finer.longitude_sums[finer_slot]
+                    members[slot] ^= finer.members[finer_slot]
+
+    def apply(self, change):
+        """Apply a journal entry (kind, id, latitude, longitude); no position means removal"""
+        kind, object_id, latitude, longitude = change
+        if latitude is None or longitude is None:
+            self.remove((kind, object_id))
+        else:
+            self.add((kind, object_id), latitude, longitude)
+
+    def _cell_range(self, level, west, south, east, north):
+        """Grid coordinate range (x0, y0, x1, y1) of a bbox at a level"""
+        size = 1 << level.bits
+        min_mx, max_my = mercator(south, west)
+        max_mx, min_my = mercator(north, east)
+        return (
+            max(int(min_mx * size), 0), max(int(min_my * size), 0),
+            min(int(max_mx * size), size - 1), min(int(max_my * size), size - 1),
+        )
+
+    def clusters(self, bbox, zoom):
+        """
+        Clusters and single points centered inside bbox (west, south, east,
+        north) at a map zoom level. A bbox with west > east crosses the
+        antimeridian. Beyond max_zoom every point is returned on its own.
+        """
+        west, south, east, north = bbox
+        spans = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+        level = self.levels[max(0, min(zoom, self.max_zoom))]
+        counts, members = level.counts, level.members
+
+        results = []
+        for span_west, span_east in spans:
+            for _, slot in level.cells_within(*self._cell_range(level, span_west, south, span_east, north)):
+                count = counts[slot]
+                if count == 1 or zoom > self.max_zoom:
+                    if count == 1:
+                        points = [members[slot]]
+                    else:
+                        points = []
+                        point = self.first_point[slot]
+                        while point != -1:
+                            points.append(point)
+                            point = self.next_point[point]
+                    for point in points:
+                        latitude, longitude = self.latitudes[point], self.longitudes[point]
+                        if south <= latitude <= north and span_west <= longitude <= span_east:
+                            kind, object_id = self.keys[point]
+                            results.append({'latitude': latitude, 'longitude': longitude, 'count': 1, kind: object_id})
+                    continue
+                latitude = level.latitude_sums[slot] / count
+                longitude = level.longitude_sums[slot] / count
+                if south <= latitude <= north and span_west <= longitude <= span_east:
+                    results.append({
+                        'latitude': round(latitude, 6),
+                        'longitude': round(longitude, 6),
+                        'count': count,
+                    })
+        return results
+
+
+def _change_key(sequence):
+    return f'map:clusters:change:{sequence}'
+
+
+def current_sequence():
+    sequence = cache.get(CLUSTER_SEQUENCE_KEY)
+    if sequence is None:
+        cache.add(CLUSTER_SEQUENCE_KEY, 0, None)
+        sequence = cache.get(CLUSTER_SEQUENCE_KEY, 0)
+    return sequence
+
+
+def record_point_changes(changes):
+    """
+    Journal (kind, id, latitude, longitude) changes for every worker's
+    cluster index once the current transaction commits. A position of
+    None removes the point.
+    """
+    changes = list(changes)
+    if not changes:
+        return
+
+    def record():
+        cache.add(CLUSTER_SEQUENCE_KEY, 0, None)
+        last = cache.incr(CLUSTER_SEQUENCE_KEY, len(changes))
+        first = last - len(changes) + 1
+        cache.set_many(
+            {_change_key(first + i): change for i, change in enumerate(changes)},
+            settings.MAP_CLUSTER_JOURNAL_TIMEOUT
+        )
+
+    transaction.on_commit(record)
+
+
+def report_change(report):
+    """Journal entry for a report: its position while active and located, otherwise removal"""
+    if report.status in ACTIVE_STATUSES and report.latitude is not None and report.longitude is not None:
+        return ('report', str(report.pk), report.latitude, report.longitude)
+    return ('report', str(report.pk), None, None)
+
+
+def location_change(location):
+    """Journal entry for a Location: its position if it is an emergency, otherwise removal"""
+    if location.is_emergency:
+        return ('location', str(location.pk), float(location.latitude), float(location.longitude))
+    return ('location', str(location.pk), None, None)
+
+
+def load_points():
+    """Journal entries for every point the index should contain, read from the database"""
+    reports = EmergencyReport.objects.filter(
+        status__in=ACTIVE_STATUSES, latitude__isnull=False, longitude__isnull=False
+    ).values_list('id', 'latitude', 'longitude')
+    for report_id, latitude, longitude in reports.iterator(chunk_size=5000):
+        yield ('report', str(report_id), latitude, longitude)
+    locations = Location.objects.filter(is_emergency=True).values_list('id', 'latitude', 'longitude')
+    for location_id, latitude, longitude in locations.iterator(chunk_size=5000):
+        yield ('location', str(location_id), float(latitude), float(longitude))
+
+
+class ClusterRegistry:
+    """Process-wide ClusterIndex, kept in step with the shared change journal"""
+
+    def __init__(self):
+        # _lock guards the loaded index; _build_lock lets one thread at a time
+        # load a new one from the database without holding up the others
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._index = None
+
+    def build(self):
+        """Build an index from the database, positioned at the current journal sequence"""
+        index = ClusterIndex()
+        # Changes journaled while loading are replayed afterwards; they carry
+        # the final position, so applying one twice is harmless
+        index.sequence = current_sequence()
+        index.load(load_points())
+        return index
+
+    def _catch_up(self, index, sequence):
+        """Replay journal entries up to sequence; False if some are missing"""
+        if sequence < index.sequence or sequence - index.sequence > settings.MAP_CLUSTER_JOURNAL_MAX:
+            return False
+        keys = [_change_key(s) for s in range(index.sequence + 1, sequence + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return False
+        for key in keys:
+            index.apply(changes[key])
+        index.sequence = sequence
+        return True
+
+    def _up_to_date(self):
+        """Whether the loaded index is (brought) up to date; call with _lock held"""
+        if self._index is None:
+            return False
+        sequence = current_sequence()
+        return self._index.sequence == sequence or self._catch_up(self._index, sequence)
+
+    def clusters(self, bbox, zoom):
+        """ClusterIndex.clusters on the up-to-date index"""
+        with self._lock:
+            if self._up_to_date():
+                return self._index.clusters(bbox, zoom)
+        with self._build_lock:
+            # Another thread may have built it while we waited
+            with self._lock:
+                if self._up_to_date():
+                    return self._index.clusters(bbox, zoom)
+            index = self.build()
+            with self._lock:
+                self._index = index
+                return index.clusters(bbox, zoom)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+
+
+cluster_registry = ClusterRegistry()
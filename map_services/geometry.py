@@ -0,0 +1,125 @@
+"""
+Compact route geometry: delta-encoded int32 coordinates (byte-shuffled and
+zlib compressed) for storage, and Douglas-Peucker simplification for
+rendering at a zoom level.
+"""
+import math
+import sys
+import zlib
+from array import array
+
+from .polyline import encode
+
+# Stored coordinates are integer 1e-5 degrees (about 1 m), the resolution of
+# the encoded polylines they are rendered to
+GEOMETRY_PRECISION = 5
+GEOMETRY_FORMAT_VERSION = 1
+
+METERS_PER_DEGREE = 111320
+# Ground resolution of web map tiles at zoom 0 on the equator (256 px tiles)
+METERS_PER_PIXEL_Z0 = 156543.03
+
+
+def pack(coordinates, precision=GEOMETRY_PRECISION):
+    """
+    Pack (lat, lng) pairs into bytes: one version byte followed by the
+    little-endian int32 sequence lat0, lng0, dlat1, dlng1, ... with its bytes
+    regrouped by significance, zlib compressed. Consecutive route points are
+    close, so the deltas are small: their high bytes are all 0x00 or 0xff
+    and compress to almost nothing.
+    """
+    factor = 10 ** precision
+    values = array('i', [0]) * (2 * len(coordinates))
+    previous_lat = previous_lng = 0
+    for i, (latitude, longitude) in enumerate(coordinates):
+        lat = round(latitude * factor)
+        lng = round(longitude * factor)
+        values[2 * i] = lat - previous_lat
+        values[2 * i + 1] = lng - previous_lng
+        previous_lat, previous_lng = lat, lng
+    if sys.byteorder == 'big':
+        values.byteswap()
+    raw = values.tobytes()
+    shuffled = b''.join(raw[i::4] for i in range(4))
+    return bytes([GEOMETRY_FORMAT_VERSION]) + zlib.compress(shuffled, 9)
+
+
+def unpack(data, precision=GEOMETRY_PRECISION):
+    """Inverse of pack: a list of (lat, lng) pairs"""
+    data = bytes(data)
+    if not data:
+        return []
+    if data[0] != GEOMETRY_FORMAT_VERSION:
+        raise ValueError(f"Unsupported geometry format {data[0]}")
+    shuffled = zlib.decompress(data[1:])
+    plane = len(shuffled) // 4
+    raw = bytearray(len(shuffled))
+    for i in range(4):
+        raw[i::4] = shuffled[i * plane:(i + 1) * plane]
+    values = array('i')
+    values.frombytes(raw)
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    factor = 10 ** precision
+    coordinates = []
+    lat = lng = 0
+    for i in range(0, len(values), 2):
+        lat += values[i]
+        lng += values[i + 1]
+        coordinates.append((lat / factor, lng / factor))
+    return coordinates
+
+
+def zoom_tolerance_m(zoom, latitude=0.0, pixels=1.0):
+    """Ground distance covered by `pixels` screen pixels at a web map zoom level"""
+    return pixels * METERS_PER_PIXEL_Z0 * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+
+def simplify(coordinates, tolerance_m):
+    """
+    Douglas-Peucker simplification: drop points closer than tolerance_m to
+    the line through their neighbours. The first and last points are kept.
+    """
+    count = len(coordinates)
+    if count < 3 or tolerance_m <= 0:
+        return list(coordinates)
+
+    # Project to a local plane in meters once
+    scale = math.cos(math.radians(sum(c[0] for c in coordinates) / count)) * METERS_PER_DEGREE
+    xs = [c[1] * scale for c in coordinates]
+    ys = [c[0] * METERS_PER_DEGREE for c in coordinates]
+    tolerance = tolerance_m * tolerance_m
+
+    keep = bytearray(count)
+    keep[0] = keep[-1] = 1
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        length = dx * dx + dy * dy
+
+        farthest, farthest_distance = None, tolerance
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            if length:
+                t = max(0.0, min(1.0, (px * dx + py * dy) / length))
+                px, py = px - t * dx, py - t * dy
+            distance = px * px + py * py
+            if distance > farthest_distance:
+                farthest, farthest_distance = i, distance
+
+        if farthest is not None:
+            keep[farthest] = 1
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    return [c for c, kept in zip(coordinates, keep) if kept]
+
+
+def render_polyline(coordinates, zoom=None):
+    """Encoded polyline of a route, simplified to one pixel at zoom if given"""
+    if zoom is not None and coordinates:
+        coordinates = simplify(coordinates, zoom_tolerance_m(zoom, coordinates[0][0]))
+    return encode(coordinates)
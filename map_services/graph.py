@@ -0,0 +1,322 @@
+import heapq
+import math
+import pickle
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from collections import defaultdict
+
+EARTH_RADIUS_M = 6371000
+
+# Highway classes cars can route over, with a default speed (km/h) used when
+# a way has no usable maxspeed tag
+HIGHWAY_SPEEDS = {
+    'motorway': 110,
+    'motorway_link': 60,
+    'trunk': 90,
+    'trunk_link': 50,
+    'primary': 70,
+    'primary_link': 40,
+    'secondary': 60,
+    'secondary_link': 40,
+    'tertiary': 50,
+    'tertiary_link': 30,
+    'unclassified': 40,
+    'residential': 30,
+    'living_street': 10,
+    'service': 20,
+    'road': 30,
+}
+
+ONEWAY_VALUES = {'yes', 'true', '1'}
+
+GRAPH_FORMAT_VERSION = 1
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in meters"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_maxspeed(value):
+    """km/h from an OSM maxspeed tag ('50', '30 mph'), or None"""
+    if not value:
+        return None
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', value)
+    if not match:
+        return None
+    speed = float(match.group(1))
+    if match.group(2):
+        speed *= 1.609344
+    return speed if speed > 0 else None
+
+
+class RoadGraph:
+    """
+    Directed road graph in compressed sparse row form.
+
+    Node i sits at (lat[i], lng[i]); its outgoing edges are the slots
+    offsets[i]..offsets[i + 1] - 1 of targets, lengths (meters) and
+    times (seconds). Everything lives in flat typed arrays, so a city graph
+    takes a few tens of bytes per edge and loads from disk in one read.
+    """
+
+    def __init__(self, lat, lng, offsets, targets, lengths, times,
+                 landmarks=(), landmark_from=(), landmark_to=()):
+        self.lat = lat
+        self.lng = lng
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        self.times = times
+        # ALT preprocessing (see build_landmarks): travel times from and to
+        # each landmark node, used as A* lower bounds
+        self.landmarks = list(landmarks)
+        self.landmark_from = list(landmark_from)
+        self.landmark_to = list(landmark_to)
+        # Fastest speed on any edge (m/s), which keeps the A* time heuristic admissible
+        self.max_speed = max(
+            (length / time for length, time in zip(lengths, times) if time > 0),
+            default=1.0
+        )
+        self._node_grid = None
+        self._radians = None
+
+    @property
+    def node_count(self):
+        return len(self.lat)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    @classmethod
+    def from_edges(cls, coordinates, edges):
+        """
+        Build a graph from [(lat, lng)] node positions and directed
+        (source, target, seconds) edges. Edge lengths are computed from the
+        node positions.
+        """
+        lat = array('d', (c[0] for c in coordinates))
+        lng = array('d', (c[1] for c in coordinates))
+
+        degree = [0] * (len(coordinates) + 1)
+        for source, _, _ in edges:
+            degree[source + 1] += 1
+        offsets = array('i', [0]) * (len(coordinates) + 1)
+        for i in range(1, len(degree)):
+            offsets[i] = offsets[i - 1] + degree[i]
+
+        targets = array('i', [0]) * len(edges)
+        lengths = array('f', [0.0]) * len(edges)
+        times = array('f', [0.0]) * len(edges)
+        cursor = array('i', offsets[:-1])
+        for source, target, seconds in edges:
+            slot = cursor[source]
+            cursor[source] += 1
+            targets[slot] = target
+            lengths[slot] = haversine_m(lat[source], lng[source], lat[target], lng[target])
+            times[slot] = seconds
+        return cls(lat, lng, offsets, targets, lengths, times)
+
+    @classmethod
+    def from_osm(cls, path):
+        """
+        Build a graph from an OSM XML extract (.osm), keeping drivable ways.
+        Travel times come from maxspeed tags or the highway class default.
+        """
+        positions = {}
+        ways = []
+        for _, element in ET.iterparse(path, events=('end',)):
+            if element.tag == 'node':
+                positions[element.get('id')] = (float(element.get('lat')), float(element.get('lon')))
+            elif element.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+                highway = tags.get('highway')
+                if highway in HIGHWAY_SPEEDS:
+                    refs = [nd.get('ref') for nd in element.iter('nd')]
+                    speed = parse_maxspeed(tags.get('maxspeed')) or HIGHWAY_SPEEDS[highway]
+                    oneway = tags.get('oneway', '').lower()
+                    if oneway == '-1':
+                        refs.reverse()
+                    is_oneway = (
+                        oneway in ONEWAY_VALUES or oneway == '-1' or
+                        (highway == 'motorway' and oneway != 'no') or
+                        tags.get('junction') == 'roundabout'
+                    )
+                    ways.append((refs, speed, is_oneway))
+            if element.tag in ('node', 'way', 'relation'):
+                element.clear()
+
+        # Only nodes on drivable ways become graph nodes
+        node_ids = {}
+        coordinates = []
+        edges = []
+        for refs, speed, is_oneway in ways:
+            refs = [ref for ref in refs if ref in positions]
+            for a, b in zip(refs, refs[1:]):
+                for ref in (a, b):
+                    if ref not in node_ids:
+                        node_ids[ref] = len(coordinates)
+                        coordinates.append(positions[ref])
+                source, target = node_ids[a], node_ids[b]
+                seconds = haversine_m(*coordinates[source], *coordinates[target]) / (speed / 3.6)
+                edges.append((source, target, seconds))
+                if not is_oneway:
+                    edges.append((target, source, seconds))
+        return cls.from_edges(coordinates, edges)
+
+    def save(self, path):
+        """Write the arrays to a compact binary file (see load)"""
+        with open(path, 'wb') as f:
+            pickle.dump({
+                'version': GRAPH_FORMAT_VERSION,
+                'arrays': {
+                    name: getattr(self, name)
+                    for name in (
+                        'lat', 'lng', 'offsets', 'targets', 'lengths', 'times',
+                        'landmarks', 'landmark_from', 'landmark_to'
+                    )
+                },
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a graph written by save, or build one from an .osm extract.
+        Only load binary graph files you produced yourself.
+        """
+        if path.endswith('.osm'):
+            return cls.from_osm(path)
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('version') != GRAPH_FORMAT_VERSION:
+            raise ValueError(f"Unsupported road graph format in {path}")
+        return cls(**data['arrays'])
+
+    def neighbors(self, node):
+        """(target, length_m, seconds, edge) for each edge leaving node"""
+        for edge in range(self.offsets[node], self.offsets[node + 1]):
+            yield self.targets[edge], self.lengths[edge], self.times[edge], edge
+
+    def reversed_edges(self):
+        """(offsets, sources, times) of the reverse graph, in CSR form"""
+        n = self.node_count
+        degree = [0] * (n + 1)
+        for target in self.targets:
+            degree[target + 1] += 1
+        offsets = array('i', [0]) * (n + 1)
+        for i in range(1, n + 1):
+            offsets[i] = offsets[i - 1] + degree[i]
+
+        sources = array('i', [0]) * self.edge_count
+        times = array('f', [0.0]) * self.edge_count
+        cursor = array('i', offsets[:-1])
+        for node in range(n):
+            for edge in range(self.offsets[node], self.offsets[node + 1]):
+                target = self.targets[edge]
+                slot = cursor[target]
+                cursor[target] += 1
+                sources[slot] = node
+                times[slot] = self.times[edge]
+        return offsets, sources, times
+
+    def build_landmarks(self, count=8):
+        """
+        Precompute ALT landmarks: pick count nodes spread around the edge of
+        the network (farthest-point selection) and store the travel time from
+        and to every node. By the triangle inequality these give A* lower
+        bounds far tighter than straight-line distance over top speed.
+        """
+        n = self.node_count
+        if not n or count <= 0:
+            self.landmarks, self.landmark_from, self.landmark_to = [], [], []
+            return
+
+        # Planar coordinates are plenty for choosing well spread landmarks
+        mean_lat = sum(self.lat) / n
+        scale = math.cos(math.radians(mean_lat))
+        xs = [lng * scale for lng in self.lng]
+        ys = self.lat
+        center_x, center_y = sum(xs) / n, sum(ys) / n
+        nearest = [(x - center_x) ** 2 + (y - center_y) ** 2 for x, y in zip(xs, ys)]
+
+        landmarks = []
+        for _ in range(min(count, n)):
+            landmark = max(range(n), key=nearest.__getitem__)
+            landmarks.append(landmark)
+            lx, ly = xs[landmark], ys[landmark]
+            nearest = [min(d, (x - lx) ** 2 + (y - ly) ** 2) for d, x, y in zip(nearest, xs, ys)]
+
+        reverse = self.reversed_edges()
+        self.landmarks = landmarks
+        self.landmark_from = [_dijkstra_all(self.offsets, self.targets, self.times, l, n) for l in landmarks]
+        self.landmark_to = [_dijkstra_all(*reverse, l, n) for l in landmarks]
+
+    def radians(self):
+        """(latitudes, longitudes, cos(latitudes)) in radians, computed once"""
+        if self._radians is None:
+            phis = array('d', map(math.radians, self.lat))
+            self._radians = (phis, array('d', map(math.radians, self.lng)), array('d', map(math.cos, phis)))
+        return self._radians
+
+    def _build_node_grid(self, cell_size=0.005):
+        grid = defaultdict(list)
+        for node in range(self.node_count):
+            grid[(math.floor(self.lng[node] / cell_size), math.floor(self.lat[node] / cell_size))].append(node)
+        self._node_grid = (cell_size, dict(grid))
+
+    def nearest_node(self, latitude, longitude, max_distance_m=None):
+        """
+        Return (node, distance_m) of the node closest to a point, or
+        (None, None) when no node lies within max_distance_m.
+        """
+        if self._node_grid is None:
+            self._build_node_grid()
+        cell_size, grid = self._node_grid
+        cx, cy = math.floor(longitude / cell_size), math.floor(latitude / cell_size)
+        # Narrowest cell side in meters, for the ring distance bound
+        side = cell_size * 111320 * max(math.cos(math.radians(min(abs(latitude) + 1, 89.9))), 0.01)
+        max_ring = max(1, math.ceil(max_distance_m / side) + 1) if max_distance_m else 1000
+
+        best, best_distance = None, math.inf
+        for ring in range(max_ring + 1):
+            if (ring - 1) * side > best_distance:
+                break
+            cells = [(cx, cy)] if ring == 0 else (
+                [(x, cy - ring) for x in range(cx - ring, cx + ring + 1)] +
+                [(x, cy + ring) for x in range(cx - ring, cx + ring + 1)] +
+                [(cx - ring, y) for y in range(cy - ring + 1, cy + ring)] +
+                [(cx + ring, y) for y in range(cy - ring + 1, cy + ring)]
+            )
+            for cell in cells:
+                for node in grid.get(cell, ()):
+                    distance = haversine_m(latitude, longitude, self.lat[node], self.lng[node])
+                    if distance < best_distance:
+                        best, best_distance = node, distance
+
+        if best is None or (max_distance_m is not None and best_distance > max_distance_m):
+            return None, None
+        return best, best_distance
+
+
+def _dijkstra_all(offsets, targets, weights, source, n):
+    """Travel time from source to every node (inf if unreachable)"""
+    distances = array('d', [math.inf]) * n
+    distances[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        for edge in range(offsets[node], offsets[node + 1]):
+            neighbor = targets[edge]
+            candidate = distance + weights[edge]
+            if candidate < distances[neighbor]:
+                distances[neighbor] = candidate
+                heapq.heappush(heap, (candidate, neighbor))
+    return array('f', distances)
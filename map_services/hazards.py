@@ -0,0 +1,217 @@
+import math
+import threading
+import uuid
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from emergency.models import EmergencyReport
+
+# Reports in these statuses are hazards to route around
+ACTIVE_STATUSES = ['PENDING', 'RESPONDING', 'ON_SCENE']
+
+# Shared cache key bumped whenever an active report is created, moved, resolved
+# or deleted (see map_services.signals). Workers compare it with the version their
+# hazard set was synced at.
+HAZARD_VERSION_KEY = 'map:hazards:version'
+
+METERS_PER_DEGREE = 111320
+
+
+def bump_hazard_version():
+    """Tell every worker to re-sync its hazard set on the next hazard-aware query"""
+    cache.set(HAZARD_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def current_hazard_version():
+    version = cache.get(HAZARD_VERSION_KEY)
+    if version is None:
+        cache.add(HAZARD_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(HAZARD_VERSION_KEY)
+    return version
+
+
+def _segment_distance_m(latitude, longitude, lat1, lng1, lat2, lng2):
+    """Distance from a point to a short segment, in a local planar projection"""
+    scale = math.cos(math.radians(latitude))
+    ax, ay = (lng1 - longitude) * scale, lat1 - latitude
+    bx, by = (lng2 - longitude) * scale, lat2 - latitude
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length))
+    return math.hypot(ax + t * dx, ay + t * dy) * METERS_PER_DEGREE
+
+
+class EdgeIndex:
+    """Uniform grid of graph edges keyed by their midpoint"""
+
+    def __init__(self, graph, cell_size=0.005):
+        self.graph = graph
+        self.cell_size = cell_size
+        self.grid = defaultdict(list)
+        self.max_half_length = 0.0
+
+        # Source node of every edge, for segment distance checks
+        self.sources = array('i', [0]) * graph.edge_count
+
+        lat, lng, offsets, targets = graph.lat, graph.lng, graph.offsets, graph.targets
+        for node in range(graph.node_count):
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+                middle = ((lat[node] + lat[target]) / 2, (lng[node] + lng[target]) / 2)
+                self.grid[self._cell(*middle)].append(edge)
+                self.sources[edge] = node
+                self.max_half_length = max(self.max_half_length, graph.lengths[edge] / 2)
+
+    def _cell(self, latitude, longitude):
+        return math.floor(longitude / self.cell_size), math.floor(latitude / self.cell_size)
+
+    def edges_within(self, latitude, longitude, radius_m):
+        """{edge: distance_m} for edges passing within radius_m of a point"""
+        graph = self.graph
+        # Any point of an edge is within half its length of the midpoint
+        reach = radius_m + self.max_half_length
+        d_lat = reach / METERS_PER_DEGREE
+        d_lng = reach / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        min_x, min_y = self._cell(latitude - d_lat, longitude - d_lng)
+        max_x, max_y = self._cell(latitude + d_lat, longitude + d_lng)
+
+        found = {}
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                for edge in self.grid.get((x, y), ()):
+                    source, target = self.sources[edge], graph.targets[edge]
+                    distance = _segment_distance_m(
+                        latitude, longitude,
+                        graph.lat[source], graph.lng[source], graph.lat[target], graph.lng[target]
+                    )
+                    if distance <= radius_m:
+                        found[edge] = distance
+        return found
+
+
+class HazardSet:
+    """
+    Travel time multipliers for edges near active emergencies.
+
+    Edges within HAZARD_BLOCK_RADIUS_M of a hazard get HAZARD_BLOCK_PENALTY,
+    which keeps routes out of the area unless the destination is inside it;
+    edges within HAZARD_RADIUS_M get HAZARD_PENALTY. Per-edge counters make
+    adding and removing a hazard touch only the edges around it.
+    """
+
+    def __init__(self, graph):
+        self.edge_index = EdgeIndex(graph)
+        self.hazards = {}  # key -> ((latitude, longitude), {edge: is_blocked})
+        self.blocked = defaultdict(int)
+        self.penalized = defaultdict(int)
+        self.penalties = {}  # edge -> multiplier, read by shortest_path
+        self.version = None
+
+    def _refresh(self, edge):
+        if self.blocked.get(edge):
+            self.penalties[edge] = settings.HAZARD_BLOCK_PENALTY
+        elif self.penalized.get(edge):
+            self.penalties[edge] = settings.HAZARD_PENALTY
+        else:
+            self.penalties.pop(edge, None)
+            self.blocked.pop(edge, None)
+            self.penalized.pop(edge, None)
+
+    def add(self, key, latitude, longitude):
+        """Add a hazard and return the edges it affects"""
+        if key in self.hazards:
+            self.remove(key)
+        block_radius = settings.HAZARD_BLOCK_RADIUS_M
+        edges = self.edge_index.edges_within(latitude, longitude, max(settings.HAZARD_RADIUS_M, block_radius))
+        tiers = {}
+        for edge, distance in edges.items():
+            counts = self.blocked if distance <= block_radius else self.penalized
+            counts[edge] += 1
+            tiers[edge] = counts is self.blocked
+            self._refresh(edge)
+        self.hazards[key] = ((latitude, longitude), tiers)
+        return set(tiers)
+
+    def remove(self, key):
+        """Remove a hazard and return the edges it affected"""
+        _, tiers = self.hazards.pop(key, (None, {}))
+        for edge, is_blocked in tiers.items():
+            counts = self.blocked if is_blocked else self.penalized
+            counts[edge] -= 1
+            self._refresh(edge)
+        return set(tiers)
+
+    def sync(self, active):
+        """
+        Apply the difference between the current hazards and active
+        ({key: (latitude, longitude)}). A moved hazard is removed and added
+        again. Returns (added keys, removed keys).
+        """
+        removed = [
+            key for key, (position, _) in self.hazards.items()
+            if active.get(key) != position
+        ]
+        for key in removed:
+            self.remove(key)
+        added = [key for key in active if key not in self.hazards]
+        for key in added:
+            self.add(key, *active[key])
+        return added, removed
+
+
+def active_hazards():
+    """{report id: (latitude, longitude)} of active, located emergency reports"""
+    reports = EmergencyReport.objects.filter(
+        status__in=ACTIVE_STATUSES,
+        latitude__isnull=False,
+        longitude__isnull=False
+    )
+    return {
+        report_id: (latitude, longitude)
+        for report_id, latitude, longitude in reports.values_list('id', 'latitude', 'longitude')
+    }
+
+
+class HazardRegistry:
+    """Process-wide HazardSet for the loaded road graph, synced when the shared version changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hazards = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """
+        Call callback(added_edges, removed) after every sync that changed the
+        hazards: added_edges are the edges affected by new hazards, removed
+        tells whether any hazard went away.
+        """
+        self._listeners.append(callback)
+
+    def current(self, graph):
+        """The HazardSet for graph, brought up to date with the active reports"""
+        version = current_hazard_version()
+        hazards = self._hazards
+        if hazards is not None and hazards.edge_index.graph is graph and hazards.version == version:
+            return hazards
+
+        with self._lock:
+            if self._hazards is None or self._hazards.edge_index.graph is not graph:
+                self._hazards = HazardSet(graph)
+            hazards = self._hazards
+            if hazards.version != version:
+                added, removed = hazards.sync(active_hazards())
+                hazards.version = version
+                if added or removed:
+                    added_edges = set()
+                    for key in added:
+                        added_edges.update(hazards.hazards[key][1])
+                    for callback in self._listeners:
+                        callback(added_edges, bool(removed))
+        return hazards
+
+
+hazard_registry = HazardRegistry()
@@ -0,0 +1,58 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from map_services.clusters import ClusterIndex
+
+
+class Command(BaseCommand):
+    help = 'Time cluster queries against a synthetic cluster index (no database access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=100000, help='Number of synthetic points')
+        parser.add_argument('--hotspots', type=int, default=40, help='Cities the points are spread around')
+        parser.add_argument('--queries', type=int, default=1000, help='Number of queries to time')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Points around cities in a country-sized box (roughly Turkey)
+        hotspots = [(rng.uniform(36, 42), rng.uniform(26, 45)) for _ in range(options['hotspots'])]
+        points = []
+        for i in range(options['points']):
+            latitude, longitude = rng.choice(hotspots)
+            points.append(('report', str(i), latitude + rng.gauss(0, 0.3), longitude + rng.gauss(0, 0.3)))
+
+        started = time.perf_counter()
+        index = ClusterIndex()
+        index.load(points)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for kind, object_id, latitude, longitude in points[:1000]:
+            index.add((kind, object_id), latitude + 0.01, longitude)
+        update_ms = (time.perf_counter() - started) * 1000 / min(1000, len(points))
+
+        # A 1280 x 800 px viewport at a random zoom over the country
+        timings = []
+        shown = 0
+        for _ in range(options['queries']):
+            zoom = rng.randint(4, 18)
+            latitude, longitude = rng.choice(hotspots)
+            width, height = 1280 * 360 / (256 << zoom), 800 * 180 / (256 << zoom)
+            bbox = (longitude - width / 2, latitude - height / 2, longitude + width / 2, latitude + height / 2)
+            started = time.perf_counter()
+            clusters = index.clusters(bbox, zoom)
+            timings.append((time.perf_counter() - started) * 1000)
+            shown = max(shown, sum(cluster['count'] for cluster in clusters))
+
+        timings.sort()
+        def percentile(p):
+            return timings[min(int(len(timings) * p), len(timings) - 1)]
+
+        self.stdout.write(f"Built index of {len(points)} points in {build_ms:.1f} ms, {update_ms:.3f} ms per update")
+        self.stdout.write(
+            f"{len(timings)} viewport queries (up to {shown} points on screen): "
+            f"p50 {percentile(0.5):.3f} ms, p95 {percentile(0.95):.3f} ms, p99 {percentile(0.99):.3f} ms"
+        )
@@ -0,0 +1,87 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from map_services.graph import RoadGraph, HIGHWAY_SPEEDS, haversine_m
+from map_services.routing import shortest_path
+
+
+def grid_city(size, seed=1, spacing=0.0015, origin=(38.40, 27.10)):
+    """
+    A synthetic size x size street grid (~165 m blocks) with jittered
+    intersections, a few arterial roads, one-way streets and missing blocks.
+    """
+    rng = random.Random(seed)
+    coordinates = [
+        (origin[0] + row * spacing + rng.uniform(-0.0003, 0.0003),
+         origin[1] + col * spacing + rng.uniform(-0.0003, 0.0003))
+        for row in range(size) for col in range(size)
+    ]
+    edges = []
+
+    def connect(a, b, line):
+        if rng.random() < 0.05:
+            return  # Missing block
+        highway = 'primary' if line % 10 == 0 else 'residential'
+        seconds = haversine_m(*coordinates[a], *coordinates[b]) / (HIGHWAY_SPEEDS[highway] / 3.6)
+        edges.append((a, b, seconds))
+        if highway == 'primary' or rng.random() > 0.15:
+            edges.append((b, a, seconds))
+
+    for row in range(size):
+        for col in range(size):
+            node = row * size + col
+            if col + 1 < size:
+                connect(node, node + 1, row)
+            if row + 1 < size:
+                connect(node, node + size, col)
+    return RoadGraph.from_edges(coordinates, edges)
+
+
+class Command(BaseCommand):
+    help = 'Time A* route queries on a road graph file or a synthetic city-sized grid'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graph', help='Graph file (default: synthetic grid)')
+        parser.add_argument('--size', type=int, default=300, help='Synthetic grid side (size^2 intersections)')
+        parser.add_argument('--landmarks', type=int, default=8, help='ALT landmarks to build (0 for plain A*)')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['graph']:
+            graph = RoadGraph.load(options['graph'])
+        else:
+            graph = grid_city(options['size'], seed=options['seed'])
+        self.stdout.write(
+            f"Graph: {graph.node_count} nodes, {graph.edge_count} edges, "
+            f"loaded in {time.perf_counter() - started:.2f}s"
+        )
+
+        if options['landmarks'] != len(graph.landmarks):
+            started = time.perf_counter()
+            graph.build_landmarks(options['landmarks'])
+            self.stdout.write(f"Built {len(graph.landmarks)} landmarks in {time.perf_counter() - started:.2f}s")
+
+        rng = random.Random(options['seed'])
+        timings = []
+        unreachable = 0
+        for _ in range(options['queries']):
+            source = rng.randrange(graph.node_count)
+            target = rng.randrange(graph.node_count)
+            started = time.perf_counter()
+            result = shortest_path(graph, source, target)
+            timings.append((time.perf_counter() - started) * 1000)
+            if result is None:
+                unreachable += 1
+
+        timings.sort()
+        def percentile(p):
+            return timings[min(int(len(timings) * p), len(timings) - 1)]
+
+        self.stdout.write(
+            f"{len(timings)} random queries ({unreachable} unreachable): "
+            f"p50 {percentile(0.5):.1f} ms, p95 {percentile(0.95):.1f} ms, p99 {percentile(0.99):.1f} ms"
+        )
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from map_services.graph import RoadGraph
+
+
+class Command(BaseCommand):
+    help = 'Convert an OSM XML extract into the compact road graph file used for routing (ROAD_GRAPH_FILE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_file', help='OSM XML extract (.osm), e.g. from osmium or the Overpass API')
+        parser.add_argument('output', help='Path of the graph file to write')
+        parser.add_argument('--landmarks', type=int, default=8, help='ALT landmarks to precompute (0 to skip)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            graph = RoadGraph.from_osm(options['osm_file'])
+        except (OSError, SyntaxError) as e:
+            raise CommandError(f"Could not read {options['osm_file']}: {e}")
+
+        if not graph.node_count:
+            raise CommandError('The extract contains no drivable roads')
+
+        graph.build_landmarks(options['landmarks'])
+        graph.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {graph.node_count} nodes and {graph.edge_count} edges to {options['output']} "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map_services', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='routerequest',
+            name='served_from_cache',
+            field=models.BooleanField(default=False),
+        ),
+    ]
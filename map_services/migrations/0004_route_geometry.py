@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('map_services', '0003_routerequest_served_from_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='geometry',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='route',
+            name='polyline',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
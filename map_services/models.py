@@ -1,6 +1,8 @@
 import uuid
 from django.db import models
 from users.models import User
+from .geometry import render_polyline, unpack
+from .polyline import decode
 
 class RouteRequest(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -9,6 +11,7 @@ class RouteRequest(models.Model):
     end_location = models.CharField(max_length=255)
     waypoints = models.JSONField(blank=True, null=True)  
     avoid_hazards = models.BooleanField(default=True)
+    served_from_cache = models.BooleanField(default=False)  # Route came from the route cache
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -20,10 +23,23 @@ class RouteRequest(models.Model):
 class Route(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     request = models.ForeignKey(RouteRequest, on_delete=models.CASCADE, related_name='routes')
-    polyline = models.TextField()  # Encoded polyline from Google Directions API
+    polyline = models.TextField(blank=True, default='')  # Encoded polyline (routes stored before geometry existed)
+    geometry = models.BinaryField(null=True, blank=True)  # Packed coordinates, see map_services.geometry
     distance = models.FloatField()  # Kilometers
     duration = models.FloatField()  # Minutes
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    def coordinates(self):
+        """The route's (lat, lng) points"""
+        if self.geometry:
+            return unpack(self.geometry)
+        return decode(self.polyline)
+
+    def render_polyline(self, zoom=None):
+        """Encoded polyline, simplified for a map zoom level if given"""
+        if zoom is None and not self.geometry:
+            return self.polyline
+        return render_polyline(self.coordinates(), zoom)
+
     def __str__(self):
         return f"Route {self.id}"
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Google encoded polyline format
+(https://developers.google.com/maps/documentation/utilities/polylinealgorithm).
+"""
+
+
+def _encode_value(value, chunks):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def encode(coordinates, precision=5):
+    """Encode a sequence of (latitude, longitude) pairs"""
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lng = 0
+    for latitude, longitude in coordinates:
+        lat = round(latitude * factor)
+        lng = round(longitude * factor)
+        _encode_value(lat - previous_lat, chunks)
+        _encode_value(lng - previous_lng, chunks)
+        previous_lat, previous_lng = lat, lng
+    return ''.join(chunks)
+
+
+def decode(polyline, precision=5):
+    """Decode a polyline into a list of (latitude, longitude) pairs"""
+    factor = 10 ** precision
+    coordinates = []
+    index = lat = lng = 0
+    length = len(polyline)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                byte = ord(polyline[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        coordinates.append((lat / factor, lng / factor))
+    return coordinates
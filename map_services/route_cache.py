@@ -0,0 +1,142 @@
+import threading
+from array import array
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .hazards import hazard_registry
+from .geometry import pack
+
+# Approximate fixed cost of one entry (key, entry object, LRU links), in bytes
+ENTRY_OVERHEAD = 300
+
+
+class CachedRoute:
+    """A computed route kept in compact form"""
+
+    __slots__ = ('geometry', 'distance', 'duration', 'edges', 'bbox', 'size')
+
+    def __init__(self, result):
+        self.geometry = pack(result.coordinates)
+        self.distance = result.distance
+        self.duration = result.duration
+        self.edges = array('i', result.edges)
+        latitudes = [c[0] for c in result.coordinates]
+        longitudes = [c[1] for c in result.coordinates]
+        self.bbox = (min(latitudes), min(longitudes), max(latitudes), max(longitudes))
+        self.size = ENTRY_OVERHEAD + len(self.geometry) + self.edges.itemsize * len(self.edges)
+
+
+class RouteCache:
+    """
+    In-process LRU cache of routes between snapped graph nodes.
+
+    Keys are the snapped nodes of the request plus, for hazard-aware
+    routes, the hazard generation. Geometry is kept packed, as stored on
+    Route.
+
+    When hazards are added only the cached hazard-aware routes that use an
+    affected edge are dropped: every other route keeps its cost while
+    alternatives only get more expensive, so it is still the best one. When
+    a hazard is removed roads get cheaper and any route may improve, so the
+    generation moves on and all hazard-aware routes are dropped.
+
+    Entries are evicted least recently used first once their total size
+    exceeds ROUTE_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._graph = None
+        self.size = 0
+        self.generation = 0
+        # Bumped on every hazard change; routes computed before a change are not stored
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, nodes, avoid_hazards):
+        return (tuple(nodes), self.generation if avoid_hazards else None)
+
+    def get(self, graph, key):
+        with self._lock:
+            if graph is not self._graph:
+                self._reset(graph)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, graph, key, result, epoch):
+        """Store a RouteResult computed at epoch (skipped if hazards changed meanwhile)"""
+        entry = CachedRoute(result)
+        max_bytes = settings.ROUTE_CACHE_MAX_BYTES
+        with self._lock:
+            if graph is not self._graph or epoch != self.epoch or entry.size > max_bytes:
+                return entry
+            if key in self._entries:
+                self.size -= self._entries.pop(key).size
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+        return entry
+
+    def hazards_changed(self, added_edges, removed):
+        """Hazard registry listener, see the class docstring"""
+        with self._lock:
+            self.epoch += 1
+            if removed:
+                self.generation += 1
+                for key in [key for key in self._entries if key[1] is not None]:
+                    self.size -= self._entries.pop(key).size
+                return
+
+            graph = self._graph
+            if graph is None or not added_edges:
+                return
+            # Bounding box of the new hazards' edges, to skip distant routes cheaply
+            nodes = [graph.targets[edge] for edge in added_edges]
+            min_lat = min(graph.lat[node] for node in nodes) - 0.01
+            max_lat = max(graph.lat[node] for node in nodes) + 0.01
+            min_lng = min(graph.lng[node] for node in nodes) - 0.01
+            max_lng = max(graph.lng[node] for node in nodes) + 0.01
+
+            stale = []
+            for key, entry in self._entries.items():
+                if key[1] is None:
+                    continue  # Ignores hazards
+                south, west, north, east = entry.bbox
+                if south > max_lat or north < min_lat or west > max_lng or east < min_lng:
+                    continue
+                if not added_edges.isdisjoint(entry.edges):
+                    stale.append(key)
+            for key in stale:
+                self.size -= self._entries.pop(key).size
+
+    def _reset(self, graph):
+        self._entries.clear()
+        self._graph = graph
+        self.size = 0
+
+    def clear(self):
+        with self._lock:
+            self._reset(None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+route_cache = RouteCache()
+hazard_registry.add_listener(route_cache.hazards_changed)
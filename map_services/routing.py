@@ -0,0 +1,256 @@
+import heapq
+import logging
+import math
+import os
+import threading
+
+from django.conf import settings
+
+from .graph import RoadGraph, EARTH_RADIUS_M
+from .hazards import hazard_registry
+from .models import Route
+from .route_cache import route_cache
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingError(Exception):
+    """A route could not be computed; the message is safe to show to users"""
+
+
+class RoutingUnavailable(RoutingError):
+    """No road graph is configured"""
+
+
+class RouteResult:
+    """A path through the road graph"""
+
+    def __init__(self, nodes, edges, distance, duration, coordinates):
+        self.nodes = nodes
+        self.edges = edges
+        self.distance = distance  # Meters
+        self.duration = duration  # Seconds
+        self.coordinates = coordinates  # [(lat, lng)]
+
+    @classmethod
+    def join(cls, legs):
+        """Concatenate consecutive legs (each starting where the previous one ended)"""
+        nodes, edges, coordinates = [], [], []
+        for leg in legs:
+            skip = 1 if nodes else 0
+            nodes.extend(leg.nodes[skip:])
+            coordinates.extend(leg.coordinates[skip:])
+            edges.extend(leg.edges)
+        return cls(
+            nodes, edges,
+            sum(leg.distance for leg in legs),
+            sum(leg.duration for leg in legs),
+            coordinates
+        )
+
+
+# Landmarks used per query, chosen for the tightest bound between source and target
+ACTIVE_LANDMARKS = 4
+
+
+def _landmark_bounds(graph, source, target):
+    """[(from_landmark, to_landmark, from_target, to_target)] for the best landmarks"""
+    bounds = []
+    for from_landmark, to_landmark in zip(graph.landmark_from, graph.landmark_to):
+        from_target, to_target = from_landmark[target], to_landmark[target]
+        gain = max(from_target - from_landmark[source], to_landmark[source] - to_target)
+        bounds.append((gain, from_landmark, to_landmark, from_target, to_target))
+    bounds.sort(key=lambda bound: -bound[0] if bound[0] == bound[0] else math.inf)
+    return [bound[1:] for bound in bounds[:ACTIVE_LANDMARKS]]
+
+
+def shortest_path(graph, source, target, weight='time', penalties=None):
+    """
+    A* search from source to target, minimizing travel time ('time') or
+    length ('distance'). Returns a RouteResult, or None if target is
+    unreachable.
+
+    penalties optionally maps edges to cost multipliers (>= 1), e.g. the
+    edges near active emergencies (see map_services.hazards). The reported
+    distance and duration are always the real, unpenalized ones.
+
+    Time queries on graphs with landmarks use ALT lower bounds; otherwise
+    the heuristic is the straight-line distance to the target (divided by
+    the top speed for time). Neither overestimates, so the result is optimal.
+    """
+    weights = graph.times if weight == 'time' else graph.lengths
+    scale = 1 / graph.max_speed if weight == 'time' else 1.0
+
+    offsets, targets = graph.offsets, graph.targets
+    landmarks = _landmark_bounds(graph, source, target) if weight == 'time' else []
+    if landmarks:
+        def heuristic(node):
+            best = 0.0
+            for from_landmark, to_landmark, from_target, to_target in landmarks:
+                bound = from_target - from_landmark[node]
+                if bound > best:
+                    best = bound
+                bound = to_landmark[node] - to_target
+                if bound > best:
+                    best = bound
+            return best
+    else:
+        phis, lambdas, cosines = graph.radians()
+        target_phi, target_lambda, cos_target = phis[target], lambdas[target], cosines[target]
+        factor = 2 * EARTH_RADIUS_M * scale
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+
+        def heuristic(node):
+            a = sin((target_phi - phis[node]) / 2) ** 2 + \
+                cosines[node] * cos_target * sin((target_lambda - lambdas[node]) / 2) ** 2
+            return factor * asin(min(1.0, sqrt(a)))
+
+    push, pop = heapq.heappush, heapq.heappop
+    penalty = penalties.get if penalties else None
+    cost = {source: 0.0}
+    parent = {source: None}  # node -> (previous node, edge)
+    closed = set()
+    heap = [(0.0, 0.0, source)]
+
+    while heap:
+        _, g, node = pop(heap)
+        if node == target:
+            break
+        if node in closed:
+            continue
+        closed.add(node)
+        for edge in range(offsets[node], offsets[node + 1]):
+            neighbor = targets[edge]
+            if neighbor in closed:
+                continue
+            candidate = weights[edge]
+            if penalty is not None:
+                # Penalties only raise costs, so the lower bounds stay valid
+                candidate *= penalty(edge, 1.0)
+            candidate += g
+            if candidate < cost.get(neighbor, math.inf):
+                cost[neighbor] = candidate
+                parent[neighbor] = (node, edge)
+                push(heap, (candidate + heuristic(neighbor), candidate, neighbor))
+    else:
+        return None
+
+    # Walk the parent links back from the target
+    edges = []
+    nodes = [target]
+    node = target
+    while parent[node] is not None:
+        node, edge = parent[node]
+        edges.append(edge)
+        nodes.append(node)
+    edges.reverse()
+    nodes.reverse()
+
+    return RouteResult(
+        nodes, edges,
+        sum(graph.lengths[edge] for edge in edges),
+        sum(graph.times[edge] for edge in edges),
+        [(graph.lat[n], graph.lng[n]) for n in nodes]
+    )
+
+
+_road_graph = None
+_road_graph_lock = threading.Lock()
+
+
+def get_road_graph():
+    """Return the process-wide road graph (loaded on first use), or None if not configured"""
+    global _road_graph
+    if _road_graph is None:
+        path = getattr(settings, 'ROAD_GRAPH_FILE', '')
+        if not path or not os.path.exists(path):
+            logger.warning(f"Road graph file not found: {path!r}, routing is unavailable")
+            return None
+        with _road_graph_lock:
+            if _road_graph is None:
+                _road_graph = RoadGraph.load(path)
+                logger.info(f"Loaded road graph with {_road_graph.node_count} nodes and {_road_graph.edge_count} edges")
+    return _road_graph
+
+
+def parse_location(value):
+    """
+    (latitude, longitude) from 'lat,lng' strings, [lat, lng] lists or
+    {'latitude', 'longitude'} dicts. Raises RoutingError otherwise.
+    """
+    try:
+        if isinstance(value, dict):
+            latitude, longitude = value['latitude'], value['longitude']
+        elif isinstance(value, str):
+            latitude, longitude = value.split(',')
+        else:
+            latitude, longitude = value
+        latitude, longitude = float(latitude), float(longitude)
+    except (KeyError, TypeError, ValueError):
+        raise RoutingError(f"Invalid location {value!r}, expected 'latitude,longitude'")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise RoutingError(f"Location {value!r} is out of range")
+    return latitude, longitude
+
+
+def snap(graph, location):
+    """Nearest graph node to a (lat, lng) point within ROUTING_SNAP_DISTANCE_M"""
+    node, _ = graph.nearest_node(*location, max_distance_m=settings.ROUTING_SNAP_DISTANCE_M)
+    if node is None:
+        raise RoutingError(f"Location {location[0]},{location[1]} is too far from the road network")
+    return node
+
+
+def route_nodes(graph, nodes, penalties=None):
+    """Fastest route visiting the graph nodes in order"""
+    legs = []
+    for source, target in zip(nodes, nodes[1:]):
+        leg = shortest_path(graph, source, target, penalties=penalties)
+        if leg is None:
+            raise RoutingError('No route found between the given locations')
+        legs.append(leg)
+    return RouteResult.join(legs)
+
+
+def route_between(graph, locations, penalties=None):
+    """Fastest route visiting the (lat, lng) locations in order"""
+    return route_nodes(graph, [snap(graph, location) for location in locations], penalties)
+
+
+def plan_route(route_request):
+    """
+    Compute the route for a RouteRequest (start, waypoints, end) and store
+    it as a Route, steering clear of active emergencies if avoid_hazards is
+    set. Routes between the same snapped nodes are served from the route
+    cache, which is recorded on the request. Raises RoutingError if routing
+    is unavailable or fails.
+    """
+    graph = get_road_graph()
+    if graph is None:
+        raise RoutingUnavailable('Routing is not available')
+
+    locations = [parse_location(route_request.start_location)]
+    locations.extend(parse_location(waypoint) for waypoint in route_request.waypoints or [])
+    locations.append(parse_location(route_request.end_location))
+    nodes = [snap(graph, location) for location in locations]
+
+    penalties = None
+    if route_request.avoid_hazards:
+        penalties = hazard_registry.current(graph).penalties
+
+    key = route_cache.key(nodes, route_request.avoid_hazards)
+    epoch = route_cache.epoch
+    cached = route_cache.get(graph, key)
+    if cached is None:
+        cached = route_cache.put(graph, key, route_nodes(graph, nodes, penalties), epoch)
+        route_request.served_from_cache = False
+    else:
+        route_request.served_from_cache = True
+    route_request.save(update_fields=['served_from_cache'])
+
+    return Route.objects.create(
+        request=route_request,
+        geometry=cached.geometry,
+        distance=round(cached.distance / 1000, 3),
+        duration=round(cached.duration / 60, 2)
+    )
@@ -1,17 +1,54 @@
 # map_services/serializers.py
 from rest_framework import serializers
 from .models import RouteRequest, Route
+from .routing import RoutingError, parse_location
+
+class RouteSerializer(serializers.ModelSerializer):
+    polyline = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Route
+        fields = ['id', 'request', 'polyline', 'distance', 'duration', 'timestamp']
+    
+    def get_polyline(self, obj):
+        """Encoded polyline, simplified for the map zoom level given as ?zoom="""
+        request = self.context.get('request')
+        zoom = request.query_params.get('zoom') if request is not None else None
+        try:
+            zoom = min(max(int(zoom), 0), 22) if zoom not in (None, '') else None
+        except ValueError:
+            zoom = None
+        return obj.render_polyline(zoom)
 
 class RouteRequestSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
+    routes = RouteSerializer(many=True, read_only=True)
     class Meta:
         model = RouteRequest
         fields = [
             'id', 'user', 'start_location', 'end_location', 
-            'waypoints', 'avoid_hazards', 'timestamp'
+            'waypoints', 'avoid_hazards', 'served_from_cache', 'timestamp', 'routes'
         ]
-
-class RouteSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Route
-        fields = ['id', 'request', 'polyline', 'distance', 'duration', 'timestamp']
\ No newline at end of file
+        read_only_fields = ['served_from_cache']
+    
+    def _validate_location(self, value):
+        try:
+            parse_location(value)
+        except RoutingError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+    
+    def validate_start_location(self, value):
+        return self._validate_location(value)
+    
+    def validate_end_location(self, value):
+        return self._validate_location(value)
+    
+    def validate_waypoints(self, value):
+        if value is None:
+            return value
+        if not isinstance(value, list):
+            raise serializers.ValidationError('Waypoints must be a list of locations')
+        for waypoint in value:
+            self._validate_location(waypoint)
+        return value
@@ -0,0 +1,61 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from emergency.models import EmergencyReport
+from location.models import Location
+from .clusters import location_change, record_point_changes, report_change
+from .hazards import ACTIVE_STATUSES, bump_hazard_version
+from .tiles import invalidate_tiles
+
+def _map_state(fields):
+    """(latitude, longitude, status) as shown on maps, from a report's field values"""
+    return fields.get('latitude'), fields.get('longitude'), fields.get('status')
+
+def _hazard_position(state):
+    """The position of a report that routing avoids, or None"""
+    latitude, longitude, status = state
+    if status in ACTIVE_STATUSES and latitude is not None and longitude is not None:
+        return latitude, longitude
+    return None
+
+@receiver(post_save, sender=EmergencyReport)
+def update_report_map(sender, instance, created, **kwargs):
+    """
+    Refresh the tiles a report was and is now shown on, its cluster point and
+    the routing hazards, if its marker changed (e.g. not for description edits)
+    """
+    # loaded_state is still the previous one: the model updates it after the save
+    old = None if created else _map_state(instance.loaded_state)
+    new = _map_state(instance.__dict__)
+    if old == new:
+        return
+    positions = [_hazard_position(state) for state in (old, new) if state is not None]
+    positions = [position for position in positions if position is not None]
+    if positions:
+        bump_hazard_version()
+        invalidate_tiles(positions)
+    record_point_changes([report_change(instance)])
+
+@receiver(post_delete, sender=EmergencyReport)
+def remove_report_from_map(sender, instance, **kwargs):
+    position = _hazard_position(_map_state(instance.loaded_state))
+    if position is not None:
+        bump_hazard_version()
+        invalidate_tiles([position])
+    record_point_changes([('report', str(instance.pk), None, None)])
+
+@receiver(post_save, sender=Location)
+def update_location_map(sender, instance, created, **kwargs):
+    """
+    Emergency locations are cluster points. Other saves are skipped unless
+    they end an emergency, so frequent location pings leave the journal alone.
+    """
+    # stored_is_emergency is still the previous one: the model updates it after the save
+    was_emergency = False if created else getattr(instance, 'stored_is_emergency', None)
+    if instance.is_emergency or was_emergency is not False:
+        record_point_changes([location_change(instance)])
+
+@receiver(post_delete, sender=Location)
+def remove_location_from_map(sender, instance, **kwargs):
+    if instance.is_emergency:
+        record_point_changes([('location', str(instance.pk), None, None)])
@@ -1,3 +1,616 @@
-from django.test import TestCase
+import heapq
+import math
+import os
+import random
+import tempfile
+import threading
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from emergency.models import EmergencyReport
+from location.models import Location
+from users.models import User
+from .clusters import ClusterIndex, ClusterRegistry, cluster_registry, current_sequence
+from .graph import RoadGraph, haversine_m
+from .hazards import HazardSet, bump_hazard_version, current_hazard_version
+from .models import Route, RouteRequest
+from .geometry import pack, simplify, unpack
+from .polyline import decode, encode
+from .route_cache import route_cache
+from .routing import shortest_path
+from .tiles import tile_bounds, tile_for
+from . import routing
+
+OSM_EXTRACT = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="38.4000" lon="27.1000"/>
+  <node id="2" lat="38.4000" lon="27.1100"/>
+  <node id="3" lat="38.4100" lon="27.1100"/>
+  <node id="4" lat="38.4100" lon="27.1000"/>
+  <node id="5" lat="38.5000" lon="27.5000"/>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="highway" v="primary"/>
+  </way>
+  <way id="11">
+    <nd ref="3"/><nd ref="4"/><nd ref="1"/>
+    <tag k="highway" v="residential"/>
+    <tag k="oneway" v="yes"/>
+  </way>
+  <way id="12">
+    <nd ref="4"/><nd ref="5"/>
+    <tag k="highway" v="footway"/>
+  </way>
+</osm>
+"""
+
+
+def grid_graph(size=30, seed=1):
+    """Small random street grid with some one-way and missing blocks"""
+    rng = random.Random(seed)
+    coordinates = [
+        (38.4 + row * 0.002 + rng.uniform(-0.0004, 0.0004), 27.1 + col * 0.002 + rng.uniform(-0.0004, 0.0004))
+        for row in range(size) for col in range(size)
+    ]
+    edges = []
+    for row in range(size):
+        for col in range(size):
+            node = row * size + col
+            for neighbor in ((node + 1) if col + 1 < size else None, (node + size) if row + 1 < size else None):
+                if neighbor is None or rng.random() < 0.1:
+                    continue
+                seconds = rng.uniform(10, 60)
+                edges.append((node, neighbor, seconds))
+                if rng.random() < 0.8:
+                    edges.append((neighbor, node, seconds))
+    return RoadGraph.from_edges(coordinates, edges)
+
+
+def dijkstra(graph, source, target):
+    costs = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if node == target:
+            return cost
+        if cost > costs[node]:
+            continue
+        for neighbor, _, seconds, _ in graph.neighbors(node):
+            if cost + seconds < costs.get(neighbor, math.inf):
+                costs[neighbor] = cost + seconds
+                heapq.heappush(heap, (cost + seconds, neighbor))
+    return None
+
+
+class RoutingEngineTests(TestCase):
+    """A* matches Dijkstra, with and without ALT landmarks"""
+
+    def assert_optimal(self, graph):
+        rng = random.Random(3)
+        for _ in range(40):
+            source, target = rng.randrange(graph.node_count), rng.randrange(graph.node_count)
+            expected = dijkstra(graph, source, target)
+            result = shortest_path(graph, source, target)
+            if expected is None:
+                self.assertIsNone(result)
+            else:
+                self.assertAlmostEqual(result.duration, expected, delta=1e-3 * max(expected, 1))
+                self.assertEqual((result.nodes[0], result.nodes[-1]), (source, target))
+
+    def test_astar_is_optimal(self):
+        self.assert_optimal(grid_graph())
+
+    def test_alt_is_optimal(self):
+        graph = grid_graph()
+        graph.build_landmarks(4)
+        self.assert_optimal(graph)
+
+    def test_osm_extract(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.osm', delete=False) as f:
+            f.write(OSM_EXTRACT)
+        self.addCleanup(os.remove, f.name)
+
+        graph = RoadGraph.from_osm(f.name)
+        # The footway and its far node are not drivable
+        self.assertEqual(graph.node_count, 4)
+        # 2 two-way primary segments + 2 one-way residential segments
+        self.assertEqual(graph.edge_count, 6)
+
+        start, _ = graph.nearest_node(38.4, 27.1)
+        corner, _ = graph.nearest_node(38.41, 27.1)
+        # The residential street is one-way 3 -> 4 -> 1, so 1 -> 4 goes round via 2 and 3
+        self.assertEqual(len(shortest_path(graph, start, corner).nodes), 4)
+        self.assertEqual(len(shortest_path(graph, corner, start).nodes), 2)
+
+    def test_save_and_load(self):
+        graph = grid_graph(10)
+        graph.build_landmarks(2)
+        with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as f:
+            path = f.name
+        self.addCleanup(os.remove, path)
+
+        graph.save(path)
+        loaded = RoadGraph.load(path)
+        self.assertEqual(list(loaded.targets), list(graph.targets))
+        self.assertEqual(loaded.landmarks, graph.landmarks)
+        self.assertEqual(shortest_path(loaded, 0, 99).nodes, shortest_path(graph, 0, 99).nodes)
+
+    def test_polyline_round_trip(self):
+        # Example from the polyline algorithm documentation
+        coordinates = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        self.assertEqual(encode(coordinates), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(decode('_p~iF~ps|U_ulLnnqC_mqNvxq`@'), coordinates)
+
+    def test_packed_geometry(self):
+        rng = random.Random(4)
+        coordinates = [(38.4 + i * 0.0001 + rng.uniform(-5e-5, 5e-5), 27.1 - i * 0.0002) for i in range(500)]
+        data = pack(coordinates)
+        for (lat, lng), (expected_lat, expected_lng) in zip(unpack(data), coordinates):
+            self.assertAlmostEqual(lat, expected_lat, places=5)
+            self.assertAlmostEqual(lng, expected_lng, places=5)
+        # Smaller than the encoded polyline of the same points
+        self.assertLess(len(data), len(encode(coordinates)))
+        self.assertEqual(unpack(pack([])), [])
+
+    def test_simplify(self):
+        line = [(38.4, 27.1 + i * 0.001) for i in range(50)]
+        self.assertEqual(simplify(line, 1), [line[0], line[-1]])
+
+        corner = line + [(38.4 + i * 0.001, 27.149) for i in range(1, 50)]
+        self.assertEqual(simplify(corner, 1), [corner[0], line[-1], corner[-1]])
+        # Wiggles smaller than the tolerance disappear, larger ones stay
+        wiggly = [(38.4 + (0.00001 if i % 2 else 0), 27.1 + i * 0.001) for i in range(50)]
+        self.assertEqual(len(simplify(wiggly, 5)), 2)
+        self.assertEqual(len(simplify(wiggly, 0.5)), 50)
+
+
+class RouteRequestTests(TestCase):
+    """Route requests are answered from the local road graph"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('driver', 'driver@example.com', 'pass', role='FIRE_STATION')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        routing._road_graph = grid_graph()
+        self.addCleanup(setattr, routing, '_road_graph', None)
+
+    def test_route_is_persisted(self):
+        response = self.client.post('/api/map/routes/', {
+            'start_location': '38.4,27.1',
+            'end_location': '38.45,27.15',
+            'waypoints': ['38.43,27.1'],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        route = Route.objects.get(request_id=response.data['id'])
+        self.assertGreater(route.distance, 0)
+        self.assertGreater(route.duration, 0)
+        points = route.coordinates()
+        self.assertAlmostEqual(points[0][0], 38.4, places=2)
+        self.assertAlmostEqual(points[-1][1], 27.15, places=2)
+        self.assertEqual(len(response.data['routes']), 1)
+        self.assertEqual(decode(response.data['routes'][0]['polyline']), decode(encode(points)))
+
+    def test_polyline_is_simplified_for_zoom(self):
+        response = self.client.post('/api/map/routes/', {
+            'start_location': '38.4,27.1',
+            'end_location': '38.45,27.15',
+        }, format='json')
+        url = f"/api/map/routes/{response.data['id']}/"
+
+        full = decode(self.client.get(url).data['routes'][0]['polyline'])
+        overview = decode(self.client.get(url, {'zoom': 10}).data['routes'][0]['polyline'])
+        self.assertLess(len(overview), len(full))
+        self.assertEqual((overview[0], overview[-1]), (full[0], full[-1]))
+
+    def test_invalid_and_unroutable_locations(self):
+        response = self.client.post('/api/map/routes/', {'start_location': 'home', 'end_location': '38.45,27.15'})
+        self.assertEqual(response.status_code, 400)
+
+        # Far away from every road
+        response = self.client.post('/api/map/routes/', {'start_location': '40.0,30.0', 'end_location': '38.45,27.15'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RouteRequest.objects.exists())
+
+    @override_settings(ROAD_GRAPH_FILE='/nonexistent/road_graph.bin')
+    def test_routing_unavailable(self):
+        routing._road_graph = None
+        response = self.client.post('/api/map/routes/', {'start_location': '38.4,27.1', 'end_location': '38.45,27.15'})
+        self.assertEqual(response.status_code, 503)
+
+
+def uniform_grid(size=15, spacing=0.002):
+    """Two-way street grid with 30 km/h on every block"""
+    coordinates = [(38.4 + row * spacing, 27.1 + col * spacing) for row in range(size) for col in range(size)]
+    edges = []
+    for row in range(size):
+        for col in range(size):
+            node = row * size + col
+            for neighbor in ((node + 1) if col + 1 < size else None, (node + size) if row + 1 < size else None):
+                if neighbor is not None:
+                    seconds = haversine_m(*coordinates[node], *coordinates[neighbor]) / (30 / 3.6)
+                    edges.append((node, neighbor, seconds))
+                    edges.append((neighbor, node, seconds))
+    return RoadGraph.from_edges(coordinates, edges)
+
+
+@override_settings(HAZARD_RADIUS_M=400, HAZARD_BLOCK_RADIUS_M=150)
+class HazardRoutingTests(TestCase):
+    """Hazard-aware routes keep away from active emergencies"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('driver', 'driver@example.com', 'pass', role='FIRE_STATION')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.graph = uniform_grid()
+        routing._road_graph = self.graph
+        self.addCleanup(setattr, routing, '_road_graph', None)
+        # Across the middle row of the grid
+        self.start, self.end = '38.414,27.1', '38.414,27.128'
+        self.hazard = (38.414, 27.114)
+
+    def route_points(self, avoid_hazards=True):
+        response = self.client.post('/api/map/routes/', {
+            'start_location': self.start,
+            'end_location': self.end,
+            'avoid_hazards': avoid_hazards,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return decode(response.data['routes'][0]['polyline'])
+
+    def closest_approach(self, points):
+        return min(haversine_m(*point, *self.hazard) for point in points)
+
+    def test_routes_avoid_active_reports(self):
+        self.assertLess(self.closest_approach(self.route_points()), 1)
+
+        report = EmergencyReport.objects.create(
+            reporter=self.user, reporter_type='SPECTATOR', description='Fire',
+            latitude=self.hazard[0], longitude=self.hazard[1]
+        )
+        self.assertGreater(self.closest_approach(self.route_points()), 150)
+        # Without avoid_hazards the direct route is kept
+        self.assertLess(self.closest_approach(self.route_points(avoid_hazards=False)), 1)
+
+        report.status = 'RESOLVED'
+        report.save()
+        self.assertLess(self.closest_approach(self.route_points()), 1)
+
+    def test_destination_inside_hazard_is_reachable(self):
+        EmergencyReport.objects.create(
+            reporter=self.user, reporter_type='SPECTATOR', description='Fire',
+            latitude=self.hazard[0], longitude=self.hazard[1]
+        )
+        self.end = '%s,%s' % self.hazard
+        self.assertLess(self.closest_approach(self.route_points()), 1)
+
+    def test_incremental_updates(self):
+        hazards = HazardSet(self.graph)
+        first = hazards.add('a', *self.hazard)
+        second = hazards.add('b', 38.416, 27.114)
+        self.assertTrue(first & second)
+
+        hazards.remove('a')
+        self.assertEqual(set(hazards.penalties), second)
+        hazards.sync({})
+        self.assertEqual(hazards.penalties, {})
+
+
+class RouteCacheTests(TestCase):
+    """Repeated routes come from the cache until a hazard touches them"""
+
+    def setUp(self):
+        cache.clear()
+        route_cache.clear()
+        self.user = User.objects.create_user('driver', 'driver@example.com', 'pass', role='FIRE_STATION')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        routing._road_graph = uniform_grid()
+        self.addCleanup(setattr, routing, '_road_graph', None)
+
+    def request_route(self, start='38.414,27.1', end='38.414,27.128', avoid_hazards=True):
+        response = self.client.post('/api/map/routes/', {
+            'start_location': start,
+            'end_location': end,
+            'avoid_hazards': avoid_hazards,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def add_report(self, latitude, longitude):
+        EmergencyReport.objects.create(
+            reporter=self.user, reporter_type='SPECTATOR', description='Fire',
+            latitude=latitude, longitude=longitude
+        )
+
+    def test_repeated_route_is_cached(self):
+        first = self.request_route()
+        self.assertFalse(first['served_from_cache'])
+
+        # A nearby start snaps to the same node
+        second = self.request_route(start='38.4141,27.1001')
+        self.assertTrue(second['served_from_cache'])
+        self.assertEqual(second['routes'][0]['polyline'], first['routes'][0]['polyline'])
+        self.assertTrue(RouteRequest.objects.get(pk=second['id']).served_from_cache)
+
+    def test_only_routes_near_new_hazards_are_invalidated(self):
+        self.request_route()
+        self.request_route(start='38.4,27.1', end='38.4,27.12')
+        self.request_route(avoid_hazards=False)
+
+        # On the first route only
+        self.add_report(38.414, 27.114)
+        self.assertFalse(self.request_route()['served_from_cache'])
+        self.assertTrue(self.request_route(start='38.4,27.1', end='38.4,27.12')['served_from_cache'])
+        self.assertTrue(self.request_route(avoid_hazards=False)['served_from_cache'])
+
+    def test_resolved_hazard_invalidates_hazard_aware_routes(self):
+        self.add_report(38.414, 27.114)
+        detour = self.request_route()
+
+        EmergencyReport.objects.update(status='RESOLVED')
+        bump_hazard_version()
+        direct = self.request_route()
+        self.assertFalse(direct['served_from_cache'])
+        self.assertLess(direct['routes'][0]['duration'], detour['routes'][0]['duration'])
+
+    def test_hazard_version_follows_marker_changes_only(self):
+        report = EmergencyReport.objects.create(
+            reporter=self.user, reporter_type='SPECTATOR', description='Fire', latitude=38.414, longitude=27.114
+        )
+        version = current_hazard_version()
+
+        # Edits that leave the position and status alone keep routes cached
+        report.description = 'Fire spreading'
+        report.save()
+        report.is_emergency = True
+        report.save()
+        self.assertEqual(current_hazard_version(), version)
+
+        report.latitude = 38.415
+        report.save()
+        self.assertNotEqual(current_hazard_version(), version)
+
+        version = current_hazard_version()
+        report.status = 'RESOLVED'
+        report.save()
+        self.assertNotEqual(current_hazard_version(), version)
+
+        # Resolved reports are no hazards either before or after a change
+        version = current_hazard_version()
+        report.latitude = 38.416
+        report.save()
+        report.delete()
+        self.assertEqual(current_hazard_version(), version)
+
+    @override_settings(ROUTE_CACHE_MAX_BYTES=1000)
+    def test_lru_eviction(self):
+        self.request_route()
+        self.request_route(start='38.4,27.1', end='38.4,27.12')
+        self.request_route(start='38.42,27.1', end='38.42,27.12')
+        self.assertLessEqual(route_cache.stats()['bytes'], 1000)
+        # The oldest route was evicted, the newest is kept
+        self.assertTrue(self.request_route(start='38.42,27.1', end='38.42,27.12')['served_from_cache'])
+        self.assertFalse(self.request_route()['served_from_cache'])
+
+
+class MapTileTests(TestCase):
+    """Clustered report tiles are cached and invalidated per tile"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('mapper', 'mapper@example.com', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_report(self, latitude, longitude, **fields):
+        return EmergencyReport.objects.create(
+            reporter=self.user, reporter_type='SPECTATOR', description='Fire',
+            latitude=latitude, longitude=longitude, **fields
+        )
+
+    def get_tile(self, zoom, latitude, longitude):
+        x, y = tile_for(latitude, longitude, zoom)
+        response = self.client.get(f'/api/map/tiles/{zoom}/{x}/{y}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_tile_math(self):
+        self.assertEqual(tile_for(38.4, 27.1, 0), (0, 0))
+        self.assertEqual(tile_for(38.4, 27.1, 1), (1, 0))
+        for zoom in (3, 10, 16):
+            south, west, north, east = tile_bounds(zoom, *tile_for(38.4, 27.1, zoom))
+            self.assertTrue(south <= 38.4 < north and west <= 27.1 < east)
+
+    def test_reports_are_clustered(self):
+        for i in range(5):
+            self.add_report(38.4 + i * 0.001, 27.1)
+        self.add_report(-33.9, 18.4)
+        self.add_report(38.4, 27.1, status='RESOLVED')
+        self.add_report(None, None)
+
+        world = self.get_tile(0, 0, 0)
+        self.assertEqual(world['count'], 6)
+        self.assertEqual(sorted(cluster['count'] for cluster in world['clusters']), [1, 5])
+        cluster = next(cluster for cluster in world['clusters'] if cluster['count'] == 5)
+        self.assertEqual(cluster['statuses'], {'PENDING': 5})
+        self.assertAlmostEqual(cluster['latitude'], 38.402)
+
+        # Far enough in, every report is its own point
+        street = self.get_tile(18, 38.4, 27.1)
+        self.assertEqual(street['count'], 1)
+        self.assertEqual(street['clusters'][0]['status'], 'PENDING')
+
+    def test_tiles_are_invalidated_per_tile(self):
+        report = self.add_report(38.4, 27.1)
+        self.get_tile(12, 38.4, 27.1)
+        self.get_tile(12, -33.9, 18.4)
+
+        # A report elsewhere leaves this tile cached
+        self.add_report(-33.9, 18.4)
+        with self.assertNumQueries(0):
+            self.client.get('/api/map/tiles/12/%d/%d/' % tile_for(38.4, 27.1, 12))
+        self.assertEqual(self.get_tile(12, -33.9, 18.4)['count'], 1)
+
+        # Moving a report refreshes both the tile it left and the one it entered
+        report.latitude, report.longitude = -33.9, 18.4
+        report.save()
+        self.assertEqual(self.get_tile(12, 38.4, 27.1)['count'], 0)
+        self.assertEqual(self.get_tile(12, -33.9, 18.4)['count'], 2)
+
+        report.status = 'RESOLVED'
+        report.save()
+        self.assertEqual(self.get_tile(12, -33.9, 18.4)['count'], 1)
+
+    def test_invalid_tile(self):
+        self.assertEqual(self.client.get('/api/map/tiles/2/4/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/map/tiles/40/0/0/').status_code, 404)
+
+
+class ClusterIndexTests(TestCase):
+    """The cluster index matches a brute-force scan and follows report changes"""
+
+    def setUp(self):
+        cache.clear()
+        cluster_registry.clear()
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'pass')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def random_points(self, count, seed=1):
+        rng = random.Random(seed)
+        return [
+            ('report', str(i), rng.uniform(38.0, 38.6), rng.uniform(26.8, 27.4))
+            for i in range(count)
+        ]
+
+    def test_matches_brute_force(self):
+        points = self.random_points(2000)
+        index = ClusterIndex(max_zoom=16)
+        index.load(points)
+
+        # Every point is counted once at every zoom
+        for zoom in range(17):
+            clusters = index.clusters((-180, -85, 180, 85), zoom)
+            self.assertEqual(sum(cluster['count'] for cluster in clusters), len(points))
+
+        # Beyond max_zoom the points themselves are returned
+        bbox = (27.0, 38.2, 27.1, 38.3)
+        expected = sorted(
+            object_id for _, object_id, latitude, longitude in points
+            if bbox[1] <= latitude <= bbox[3] and bbox[0] <= longitude <= bbox[2]
+        )
+        self.assertEqual(sorted(cluster['report'] for cluster in index.clusters(bbox, 17)), expected)
+
+    def test_incremental_updates_match_a_rebuild(self):
+        points = self.random_points(1000)
+        index = ClusterIndex(max_zoom=16)
+        for kind, object_id, latitude, longitude in points:
+            index.add((kind, object_id), latitude, longitude)
+        for kind, object_id, _, _ in points[:300]:
+            index.remove((kind, object_id))
+        index.add(('report', '999'), 38.1, 26.9)  # Moved
+
+        rebuilt = ClusterIndex(max_zoom=16)
+        rebuilt.load(points[300:999] + [('report', '999', 38.1, 26.9)])
+        for zoom in (0, 5, 10, 14, 16, 18):
+            bbox = (26.8, 38.0, 27.4, 38.6)
+            self.assertEqual(
+                sorted(map(str, index.clusters(bbox, zoom))),
+                sorted(map(str, rebuilt.clusters(bbox, zoom)))
+            )
+
+    def get_clusters(self, bbox='26.8,38.0,27.4,38.6', zoom=18):
+        response = self.client.get('/api/map/clusters/', {'bbox': bbox, 'zoom': zoom})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_endpoint_follows_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            report = EmergencyReport.objects.create(
+                reporter=self.user, reporter_type='VICTIM', description='Flood',
+                latitude=38.4, longitude=27.1
+            )
+            Location.objects.create(user=self.user, latitude=38.41, longitude=27.11, is_emergency=True)
+            Location.objects.create(user=self.user, latitude=38.42, longitude=27.12)
+
+        data = self.get_clusters()
+        self.assertEqual(data['count'], 2)
+        kinds = {kind for cluster in data['clusters'] for kind in ('report', 'location') if kind in cluster}
+        self.assertEqual(kinds, {'report', 'location'})
+        self.assertEqual(self.get_clusters(zoom=5)['clusters'][0]['count'], 2)
+
+        # Changes are replayed from the journal, without a rebuild
+        index = cluster_registry._index
+        with self.captureOnCommitCallbacks(execute=True):
+            report.status = 'RESOLVED'
+            report.save()
+        self.assertEqual(self.get_clusters()['count'], 1)
+        self.assertIs(cluster_registry._index, index)
+
+    def test_ordinary_location_updates_skip_the_journal(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            location = Location.objects.create(user=self.user, latitude=38.42, longitude=27.12)
+        sequence = current_sequence()
+        with self.captureOnCommitCallbacks(execute=True):
+            location.latitude = 38.43
+            location.save()
+            Location.objects.get(pk=location.pk).save()
+        self.assertEqual(current_sequence(), sequence)
+
+        # Becoming an emergency and ending one are recorded
+        with self.captureOnCommitCallbacks(execute=True):
+            location.is_emergency = True
+            location.save()
+        self.assertEqual(self.get_clusters()['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            location = Location.objects.get(pk=location.pk)
+            location.is_emergency = False
+            location.save()
+        self.assertEqual(self.get_clusters()['count'], 0)
+
+    def test_one_build_at_a_time_outside_the_lock(self):
+        points = self.random_points(100)
+        building = threading.Event()
+        release = threading.Event()
+
+        class SlowRegistry(ClusterRegistry):
+            builds = 0
+
+            def build(self):
+                SlowRegistry.builds += 1
+                building.set()
+                release.wait(5)
+                index = ClusterIndex()
+                index.sequence = current_sequence()
+                index.load(points)
+                return index
+
+        registry = SlowRegistry()
+        bbox = (-180, -85, 180, 85)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.clusters(bbox, 0)))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(building.wait(5))
+        # Loading does not hold the lock guarding the loaded index
+        self.assertTrue(registry._lock.acquire(timeout=1))
+        registry._lock.release()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(SlowRegistry.builds, 1)
+        self.assertEqual([sum(cluster['count'] for cluster in clusters) for clusters in results], [100] * 3)
+
+    def test_invalid_query(self):
+        self.assertEqual(self.client.get('/api/map/clusters/', {'zoom': 3}).status_code, 400)
+        self.assertEqual(self.client.get('/api/map/clusters/', {'bbox': '0,0,1', 'zoom': 3}).status_code, 400)
+        self.assertEqual(self.client.get('/api/map/clusters/', {'bbox': '0,10,1,5', 'zoom': 3}).status_code, 400)
@@ -0,0 +1,144 @@
+"""
+Pre-clustered emergency map tiles.
+
+Tiles follow the web map (slippy map) scheme: at zoom z the Web Mercator
+world is split into 2^z x 2^z tiles numbered from the north-west corner.
+Each tile holds the active, located emergency reports inside it, merged
+into clusters on a grid of MAP_TILE_CLUSTER_GRID x MAP_TILE_CLUSTER_GRID
+cells, so a tile is a few kilobytes however many reports it covers.
+
+Built tiles are cached per (zoom, x, y). A report change only invalidates
+the tiles containing its old and new position, one per zoom level (see
+map_services.signals).
+"""
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+from emergency.models import EmergencyReport
+from .hazards import ACTIVE_STATUSES
+
+# Latitude limit of the square Web Mercator world
+MAX_LATITUDE = 85.0511287798
+
+
+def tile_count(zoom):
+    return 1 << zoom
+
+
+def is_valid_tile(zoom, x, y):
+    return 0 <= zoom <= settings.MAP_TILE_MAX_ZOOM and 0 <= x < tile_count(zoom) and 0 <= y < tile_count(zoom)
+
+
+def mercator(latitude, longitude):
+    """Position in the unit Web Mercator square, (0, 0) being the north-west corner"""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    phi = math.radians(latitude)
+    mx = (longitude + 180) / 360
+    my = (1 - math.log(math.tan(phi) + 1 / math.cos(phi)) / math.pi) / 2
+    return mx, my
+
+
+def _latitude(my):
+    """Inverse of the Mercator y projection"""
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * my))))
+
+
+def tile_for(latitude, longitude, zoom):
+    """(x, y) of the tile containing a point at zoom"""
+    n = tile_count(zoom)
+    mx, my = mercator(latitude, longitude)
+    return min(n - 1, max(0, math.floor(mx * n))), min(n - 1, max(0, math.floor(my * n)))
+
+
+def tile_bounds(zoom, x, y):
+    """(south, west, north, east) of a tile in degrees"""
+    n = tile_count(zoom)
+    return _latitude((y + 1) / n), x / n * 360 - 180, _latitude(y / n), (x + 1) / n * 360 - 180
+
+
+def tile_key(zoom, x, y):
+    return f'map:tile:{zoom}:{x}:{y}'
+
+
+def build_tile(zoom, x, y):
+    """Cluster the active reports inside a tile"""
+    south, west, north, east = tile_bounds(zoom, x, y)
+    reports = EmergencyReport.objects.filter(
+        status__in=ACTIVE_STATUSES, latitude__isnull=False, longitude__gte=west
+    )
+    # The outermost tiles take in everything beyond the Mercator limits and the antimeridian
+    if y < tile_count(zoom) - 1:
+        reports = reports.filter(latitude__gte=south)
+    if y > 0:
+        reports = reports.filter(latitude__lt=north)
+    if x < tile_count(zoom) - 1:
+        reports = reports.filter(longitude__lt=east)
+
+    grid = settings.MAP_TILE_CLUSTER_GRID
+    scale = tile_count(zoom) * grid
+    cells = {}
+    for report_id, latitude, longitude, report_status in reports.values_list(
+            'id', 'latitude', 'longitude', 'status'):
+        mx, my = mercator(latitude, longitude)
+        cell = (
+            min(grid - 1, max(0, math.floor(mx * scale) - x * grid)),
+            min(grid - 1, max(0, math.floor(my * scale) - y * grid)),
+        )
+        members = cells.setdefault(cell, [])
+        members.append((report_id, latitude, longitude, report_status))
+
+    clusters = []
+    for cell in sorted(cells):
+        members = cells[cell]
+        if len(members) == 1:
+            report_id, latitude, longitude, report_status = members[0]
+            clusters.append({
+                'latitude': latitude,
+                'longitude': longitude,
+                'count': 1,
+                'report': str(report_id),
+                'status': report_status,
+            })
+            continue
+        statuses = {}
+        for member in members:
+            statuses[member[3]] = statuses.get(member[3], 0) + 1
+        clusters.append({
+            'latitude': round(sum(member[1] for member in members) / len(members), 6),
+            'longitude': round(sum(member[2] for member in members) / len(members), 6),
+            'count': len(members),
+            'statuses': statuses,
+        })
+
+    return {
+        'zoom': zoom,
+        'x': x,
+        'y': y,
+        'bounds': [round(value, 6) for value in (south, west, north, east)],
+        'count': sum(cluster['count'] for cluster in clusters),
+        'clusters': clusters,
+    }
+
+
+def get_tile(zoom, x, y):
+    """A tile from the cache, built on a miss"""
+    key = tile_key(zoom, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        tile = build_tile(zoom, x, y)
+        cache.set(key, tile, settings.MAP_TILE_CACHE_TIMEOUT)
+    return tile
+
+
+def invalidate_tiles(positions):
+    """Drop the cached tiles containing any of the (latitude, longitude) positions, at every zoom"""
+    keys = set()
+    for latitude, longitude in positions:
+        if latitude is None or longitude is None:
+            continue
+        for zoom in range(settings.MAP_TILE_MAX_ZOOM + 1):
+            keys.add(tile_key(zoom, *tile_for(latitude, longitude, zoom)))
+    if keys:
+        cache.delete_many(list(keys))
@@ -1,12 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-# We'll add the URL patterns once you build the map_services app views
-# For now, we'll just provide an empty router to prevent import errors
+from .views import MapClusterView, MapTileView, RouteRequestViewSet
 
 router = DefaultRouter()
-# Add viewsets here when they're created
+router.register(r'routes', RouteRequestViewSet, basename='routerequest')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('clusters/', MapClusterView.as_view(), name='map-clusters'),
+    path('tiles/<int:z>/<int:x>/<int:y>/', MapTileView.as_view(), name='map-tile'),
 ]
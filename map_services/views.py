@@ -1,3 +1,89 @@
-from django.shortcuts import render
+from django.db import transaction
+from rest_framework import mixins, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import GenericViewSet
+import logging
 
-# Create your views here.
+from .clusters import cluster_registry
+from .models import RouteRequest
+from .routing import RoutingError, RoutingUnavailable, plan_route
+from .serializers import RouteRequestSerializer
+from .tiles import get_tile, is_valid_tile
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+class RouteRequestViewSet(mixins.CreateModelMixin,
+                          mixins.RetrieveModelMixin,
+                          mixins.ListModelMixin,
+                          GenericViewSet):
+    """
+    Request a route between two 'latitude,longitude' locations (optionally
+    through waypoints). Routes are computed on the local road graph and
+    stored with the request.
+    """
+    serializer_class = RouteRequestSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        """Users only see their own route requests"""
+        return RouteRequest.objects.filter(user=self.request.user).prefetch_related('routes')
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            # Keep the request only if a route was found for it
+            with transaction.atomic():
+                route_request = serializer.save(user=request.user)
+                plan_route(route_request)
+        except RoutingUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except RoutingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(self.get_serializer(route_request).data, status=status.HTTP_201_CREATED)
+
+
+class MapTileView(APIView):
+    """
+    Active emergency reports inside web map tile z/x/y, clustered on a grid
+    so each tile stays small at any zoom. Tiles are cached until a report
+    inside them changes.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, z, x, y):
+        if not is_valid_tile(z, x, y):
+            return Response({'error': f"Tile {z}/{x}/{y} does not exist"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(get_tile(z, x, y))
+
+
+class MapClusterView(APIView):
+    """
+    Clusters of active emergency reports and emergency locations in a
+    bounding box (?bbox=west,south,east,north) at a map zoom level
+    (?zoom=), answered from the in-memory cluster index.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            west, south, east, north = (float(value) for value in request.query_params.get('bbox', '').split(','))
+            zoom = int(request.query_params.get('zoom', ''))
+        except ValueError:
+            return Response(
+                {'error': 'bbox (west,south,east,north) and zoom are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90) or zoom < 0:
+            return Response({'error': 'bbox or zoom is out of range'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        clusters = cluster_registry.clusters((west, south, east, north), zoom)
+        return Response({
+            'zoom': zoom,
+            'count': sum(cluster['count'] for cluster in clusters),
+            'clusters': clusters,
+        })
@@ -0,0 +1,383 @@
+"""
+Load testing of the core API endpoints against the configured database.
+
+seed() fills the database with synthetic users, locations, tagged reports and
+notifications (all owned by users named loadtest_*, so they can be removed
+again), and run_scenario() replays one endpoint many times in-process through
+the full Django stack, measuring latency percentiles and throughput. See the
+seed_load_data and benchmark_api management commands.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from analytics.cubes import rebuild_cubes
+from analytics.regions import get_region_index
+from config.caching import invalidate
+from emergency.models import EmergencyReport, EmergencyTag
+from location.models import Location
+from notifications.models import Notification
+from users.models import User
+
+USERNAME_PREFIX = 'loadtest_'
+
+# Synthetic data lies in a country-sized box (roughly Turkey), as in benchmark_dispatch
+BOUNDS = (36.0, 26.0, 42.0, 45.0)
+
+ROLE_WEIGHTS = {'CITIZEN': 0.94, 'FIRE_STATION': 0.02, 'POLICE': 0.02, 'RED_CRESCENT': 0.02}
+STATUS_WEIGHTS = {'PENDING': 0.15, 'RESPONDING': 0.05, 'ON_SCENE': 0.05, 'RESOLVED': 0.75}
+NOTIFICATION_TYPES = [choice for choice, _ in Notification.NOTIFICATION_TYPES]
+
+# Tags created when the database has none
+DEFAULT_TAGS = [
+    ('Building Fire', 'FIRE'), ('Forest Fire', 'FIRE'), ('Earthquake', 'NATURAL'),
+    ('Flood', 'NATURAL'), ('Car Accident', 'TRAFFIC'), ('Road Blocked', 'TRAFFIC'),
+    ('Medical', 'OTHER'), ('Missing Person', 'OTHER'),
+]
+
+
+def percentile(timings, p):
+    """p-th quantile of an already sorted list"""
+    return timings[min(int(len(timings) * p), len(timings) - 1)]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the timestamps set on the objects instead of now()"""
+    fields = [model._meta.get_field('timestamp') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Seeder:
+    def __init__(self, seed=1, days=90, batch_size=5000, log=None):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def point(self):
+        south, west, north, east = BOUNDS
+        return self.rng.uniform(south, north), self.rng.uniform(west, east)
+
+    def timestamp(self):
+        return self.now - timedelta(seconds=self.rng.uniform(0, self.days * 86400))
+
+    def weighted(self, weights):
+        return self.rng.choices(list(weights), weights=list(weights.values()))[0]
+
+    def batches(self, total, build):
+        """Yield lists of up to batch_size objects made by build()"""
+        for start in range(0, total, self.batch_size):
+            yield [build() for _ in range(min(self.batch_size, total - start))]
+
+    def users(self, total):
+        """Create users with weighted roles; the first load test user is also staff. Returns {role: [ids]}"""
+        offset = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        created = {}
+        for start in range(0, total, self.batch_size):
+            batch = [
+                User(
+                    username=f'{USERNAME_PREFIX}{number}',
+                    email=f'{USERNAME_PREFIX}{number}@example.com',
+                    password='loadtest',
+                    role=self.weighted(ROLE_WEIGHTS),
+                    first_name='Load',
+                    last_name=f'Test {number}',
+                    is_staff=number == 0,
+                )
+                for number in range(offset + start, offset + min(start + self.batch_size, total))
+            ]
+            User.objects.bulk_create(batch)
+            for user in batch:
+                created.setdefault(user.role, []).append(user.id)
+        self.log(f'Created {total} users')
+        return created
+
+    def tags(self):
+        tags = list(EmergencyTag.objects.values_list('id', flat=True))
+        if not tags:
+            # One by one, so the tag catalog is invalidated
+            tags = [EmergencyTag.objects.create(name=name, emergency_type=emergency_type).id
+                    for name, emergency_type in DEFAULT_TAGS]
+        return tags
+
+    def locations(self, total, user_ids):
+        def build():
+            latitude, longitude = self.point()
+            return Location(
+                user_id=self.rng.choice(user_ids),
+                latitude=Decimal(f'{latitude:.6f}'),
+                longitude=Decimal(f'{longitude:.6f}'),
+                is_emergency=self.rng.random() < 0.01,
+                timestamp=self.timestamp(),
+            )
+
+        with explicit_timestamps(Location):
+            for count, batch in enumerate(self.batches(total, build), 1):
+                Location.objects.bulk_create(batch)
+                if count % 100 == 0:
+                    self.log(f'  {count * self.batch_size} locations')
+        self.log(f'Created {total} locations')
+
+    def reports(self, total, reporter_ids, tag_ids):
+        index = get_region_index()
+        report_ids = []
+
+        def build():
+            latitude, longitude = self.point()
+            return EmergencyReport(
+                reporter_id=self.rng.choice(reporter_ids),
+                reporter_type=self.rng.choice(['SPECTATOR', 'VICTIM']),
+                description='Synthetic load test report',
+                latitude=latitude,
+                longitude=longitude,
+                is_emergency=self.rng.random() < 0.3,
+                status=self.weighted(STATUS_WEIGHTS),
+                timestamp=self.timestamp(),
+            )
+
+        Tagging = EmergencyReport.tags.through
+        with explicit_timestamps(EmergencyReport):
+            for batch in self.batches(total, build):
+                regions = index.assign_many([(r.latitude, r.longitude) for r in batch])
+                for report, region in zip(batch, regions):
+                    report.region = region
+                EmergencyReport.objects.bulk_create(batch)
+                Tagging.objects.bulk_create([
+                    Tagging(emergencyreport_id=report.id, emergencytag_id=tag_id)
+                    for report in batch
+                    for tag_id in self.rng.sample(tag_ids, self.rng.randint(1, min(3, len(tag_ids))))
+                ])
+                report_ids.extend(report.id for report in batch)
+        self.log(f'Created {total} reports')
+        return report_ids
+
+    def notifications(self, total, user_ids, report_ids):
+        def build():
+            return Notification(
+                recipient_id=self.rng.choice(user_ids),
+                title='Synthetic notification',
+                message='Load test notification',
+                notification_type=self.rng.choice(NOTIFICATION_TYPES),
+                is_read=self.rng.random() < 0.6,
+                status='SENT',
+                timestamp=self.timestamp(),
+                emergency_report_id=self.rng.choice(report_ids) if report_ids and self.rng.random() < 0.5 else None,
+            )
+
+        with explicit_timestamps(Notification):
+            for batch in self.batches(total, build):
+                Notification.objects.bulk_create(batch)
+        self.log(f'Created {total} notifications')
+
+
+def seed(users, locations, reports, notifications, seed=1, days=90, batch_size=5000, log=None):
+    """
+    Bulk insert synthetic data. Signals do not fire for bulk inserts, so
+    report regions are assigned here, and the analytics cubes are rebuilt
+    and the cached responses outdated at the end.
+    """
+    seeder = Seeder(seed=seed, days=days, batch_size=batch_size, log=log)
+    by_role = seeder.users(users)
+    citizens = by_role.get('CITIZEN') or [user_id for ids in by_role.values() for user_id in ids]
+    everyone = [user_id for ids in by_role.values() for user_id in ids]
+
+    seeder.locations(locations, everyone)
+    report_ids = seeder.reports(reports, citizens, seeder.tags())
+    seeder.notifications(notifications, everyone, report_ids)
+    rebuild_cubes()
+    seeder.log('Rebuilt analytics cubes')
+    for namespace in ('users', 'reports', 'tags', 'notifications'):
+        invalidate(namespace)
+
+
+def clear():
+    """Delete every load test user along with their data"""
+    return User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+
+def data_counts():
+    return {
+        'users': User.objects.count(),
+        'locations': Location.objects.count(),
+        'reports': EmergencyReport.objects.count(),
+        'notifications': Notification.objects.count(),
+    }
+
+
+class Scenario:
+    """One endpoint request as one type of user; payload(rng) builds POST bodies"""
+
+    def __init__(self, name, path, role, method='get', payload=None, expected=200):
+        self.name = name
+        self.path = path
+        self.role = role
+        self.method = method
+        self.payload = payload
+        self.expected = expected
+
+
+def _report_payload(rng, tag_ids):
+    south, west, north, east = BOUNDS
+    return {
+        'reporter_type': 'VICTIM',
+        'description': 'Load test report',
+        'latitude': round(rng.uniform(south, north), 6),
+        'longitude': round(rng.uniform(west, east), 6),
+        # Not an emergency: emergencies are posted to social media
+        'is_emergency': False,
+        'tag_ids': [str(rng.choice(tag_ids))] if tag_ids else [],
+    }
+
+
+def scenarios(rng):
+    """Every benchmarked scenario by name"""
+    tag_ids = list(EmergencyTag.objects.values_list('id', flat=True))
+    latitude, longitude = (BOUNDS[0] + BOUNDS[2]) / 2, (BOUNDS[1] + BOUNDS[3]) / 2
+    return {scenario.name: scenario for scenario in [
+        Scenario('report_create', '/api/emergency/reports/', 'CITIZEN', method='post',
+                 payload=lambda: _report_payload(rng, tag_ids), expected=201),
+        Scenario('report_nearby', f'/api/emergency/nearby/?lat={latitude}&lng={longitude}&radius=5', 'CITIZEN'),
+        Scenario('report_list', '/api/emergency/reports/', 'CITIZEN'),
+        Scenario('dashboard_citizen', '/api/dashboards/citizen/', 'CITIZEN'),
+        Scenario('dashboard_service', '/api/dashboards/emergency-service/', 'FIRE_STATION'),
+        Scenario('dashboard_admin', '/api/dashboards/admin/', 'ADMIN'),
+        Scenario('analytics_global', '/api/analytics/global/?days=30', 'FIRE_STATION'),
+        Scenario('analytics_timeseries', '/api/analytics/timeseries/?days=30&group_by=type', 'FIRE_STATION'),
+        Scenario('analytics_user', '/api/analytics/user/?days=30', 'CITIZEN'),
+        Scenario('notification_list', '/api/notifications/', 'CITIZEN'),
+    ]}
+
+
+def benchmark_users(rng):
+    """A random load test user for each role, and the load test admin"""
+    users = {}
+    for role in ROLE_WEIGHTS:
+        ids = list(User.objects.filter(
+            username__startswith=USERNAME_PREFIX, role=role, is_staff=False
+        ).values_list('id', flat=True)[:1000])
+        if ids:
+            users[role] = User.objects.get(id=rng.choice(ids))
+    admin = User.objects.filter(username__startswith=USERNAME_PREFIX, is_staff=True).first()
+    if admin is not None:
+        users['ADMIN'] = admin
+    return users
+
+
+@contextmanager
+def capture_queries():
+    """Yields the list of queries run inside the block, on the primary and the read replicas"""
+    queries = []
+    with ExitStack() as stack:
+        # Aliases may share a connection, e.g. test mirrors
+        databases = {id(connections[alias]): connections[alias] for alias in ['default', *settings.READ_REPLICAS]}
+        captured = [stack.enter_context(CaptureQueriesContext(database)) for database in databases.values()]
+        yield queries
+    for context in captured:
+        queries.extend(context.captured_queries)
+
+
+def _client(user):
+    # SERVER_NAME must be an allowed host outside the test runner
+    client = APIClient(SERVER_NAME='localhost')
+    client.force_authenticate(user)
+    return client
+
+
+def _request(client, scenario):
+    if scenario.method == 'post':
+        return client.post(scenario.path, scenario.payload(), format='json')
+    return client.get(scenario.path)
+
+
+def run_scenario(scenario, user, requests=100, warmup=5, threads=1):
+    """
+    Time `requests` requests of a scenario spread over `threads` threads,
+    after `warmup` untimed ones (the first of which also counts the queries
+    of one request).
+    """
+    client = _client(user)
+    queries = None
+    for i in range(warmup):
+        if i == 0:
+            with capture_queries() as captured:
+                _request(client, scenario)
+            queries = len(captured)
+        else:
+            _request(client, scenario)
+
+    def worker(count):
+        client = _client(user)
+        timings = []
+        errors = 0
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                response = _request(client, scenario)
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != scenario.expected:
+                    errors += 1
+        finally:
+            if threads > 1:
+                connections.close_all()
+        return timings, errors
+
+    shares = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    started = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(worker, shares))
+    else:
+        results = [worker(requests)]
+    elapsed = time.perf_counter() - started
+
+    timings = sorted(timing for result in results for timing in result[0])
+    return {
+        'requests': len(timings),
+        'errors': sum(result[1] for result in results),
+        'threads': threads,
+        'queries': queries,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(timings) / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def compare(baseline, results, tolerance=0.2):
+    """
+    Regressions of results against a baseline run, as messages: a p95
+    latency more than `tolerance` above the baseline, a throughput more than
+    `tolerance` below it, or more queries per request.
+    """
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None or base.get('threads') != result['threads']:
+            continue  # Not comparable
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if base.get('throughput_rps') and result['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s")
+        if base.get('queries') is not None and result['queries'] is not None and result['queries'] > base['queries']:
+            regressions.append(f"{name}: queries {base['queries']} -> {result['queries']}")
+    return regressions
@@ -0,0 +1,86 @@
+import io
+import json
+import logging
+import random
+from contextlib import contextmanager, redirect_stdout
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from monitoring.loadtest import benchmark_users, compare, data_counts, run_scenario, scenarios
+
+
+@contextmanager
+def quiet_logger(name):
+    logger = logging.getLogger(name)
+    level = logger.level
+    logger.setLevel(logging.ERROR)
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+
+class Command(BaseCommand):
+    help = 'Time the core API endpoints in-process against the data created by seed_load_data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario')
+        parser.add_argument('--threads', type=int, default=1, help='Concurrent clients per scenario')
+        parser.add_argument('--scenario', action='append', help='Only run these scenarios (repeatable)')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Fail on regressions against this earlier results file')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative p95/throughput change')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        available = scenarios(rng)
+        names = options['scenario'] or list(available)
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise CommandError(f"Unknown scenarios {unknown}, choose from {list(available)}")
+
+        users = benchmark_users(rng)
+        if not users:
+            raise CommandError('No load test users found, run seed_load_data first')
+
+        results = {
+            'created_at': timezone.now().isoformat(),
+            'database': {'vendor': connection.vendor, 'name': str(connection.settings_dict['NAME'])},
+            'data': data_counts(),
+            'options': {key: options[key] for key in ('requests', 'warmup', 'threads', 'seed')},
+            'scenarios': {},
+        }
+        for name in names:
+            scenario = available[name]
+            user = users.get(scenario.role)
+            if user is None:
+                self.stdout.write(self.style.WARNING(f'{name}: skipped, no {scenario.role} load test user'))
+                continue
+            # Some views print request details, and the query count warnings would repeat every request
+            with redirect_stdout(io.StringIO()), quiet_logger('monitoring.middleware'):
+                result = run_scenario(
+                    scenario, user, requests=options['requests'], warmup=options['warmup'], threads=options['threads']
+                )
+            results['scenarios'][name] = result
+            self.stdout.write(
+                f"{name}: {result['throughput_rps']} req/s, p50 {result['p50_ms']:.1f} ms, "
+                f"p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+                f"{result['queries']} queries, {result['errors']} errors"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = compare(baseline, results, tolerance=options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against {}:\n  {}'.format(options['compare'], '\n  '.join(regressions)))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
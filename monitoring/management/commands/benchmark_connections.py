@@ -0,0 +1,73 @@
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from monitoring.loadtest import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the request cycle with a new database connection per request versus persistent '
+        'connections (CONN_MAX_AGE), with and without health checks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Simulated requests per mode')
+        parser.add_argument('--queries', type=int, default=3, help='Queries per request')
+        parser.add_argument('--max-age', type=int, default=60, help='CONN_MAX_AGE of the persistent modes')
+
+    def handle(self, *args, **options):
+        modes = [
+            ('new connection per request', 0, False),
+            ('persistent', options['max_age'], False),
+            ('persistent with health checks', options['max_age'], True),
+        ]
+        settings_dict = connection.settings_dict
+        saved = settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS']
+
+        connects = []
+        def count_connection(sender, connection, **kwargs):
+            connects.append(connection.alias)
+        connection_created.connect(count_connection)
+
+        means = {}
+        try:
+            for name, max_age, health_checks in modes:
+                connection.close()
+                settings_dict['CONN_MAX_AGE'] = max_age
+                settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+                del connects[:]
+                timings = self.run_requests(options['requests'], options['queries'])
+                means[name] = sum(timings) / len(timings)
+                self.stdout.write(
+                    f"{name}: {len(connects)} connections opened, mean {means[name]:.3f} ms, "
+                    f"p50 {percentile(timings, 0.5):.3f} ms, p95 {percentile(timings, 0.95):.3f} ms, "
+                    f"p99 {percentile(timings, 0.99):.3f} ms"
+                )
+        finally:
+            connection_created.disconnect(count_connection)
+            connection.close()
+            settings_dict['CONN_MAX_AGE'], settings_dict['CONN_HEALTH_CHECKS'] = saved
+
+        saved_ms = means['new connection per request'] - means['persistent']
+        self.stdout.write(f"Connection setup per request: {saved_ms:.3f} ms ({connection.vendor})")
+
+    def run_requests(self, requests, queries):
+        """Sorted request durations in ms, going through the signals Django sends around a request"""
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            # Closes connections past CONN_MAX_AGE or unusable ones, as at the start of a request
+            request_started.send(sender=WSGIHandler)
+            with connection.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+            request_finished.send(sender=WSGIHandler)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return timings
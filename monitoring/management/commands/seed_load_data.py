@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from monitoring.loadtest import clear, data_counts, seed
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic users, locations, reports and notifications for benchmark_api'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--locations', type=int, default=2000000)
+        parser.add_argument('--reports', type=int, default=300000, help='Reports, each with 1-3 tags')
+        parser.add_argument('--notifications', type=int, default=500000)
+        parser.add_argument('--days', type=int, default=90, help='Spread timestamps over the last N days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help='Delete earlier load test data first')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = clear()
+            self.stdout.write(f'Deleted {deleted} load test rows')
+
+        started = time.perf_counter()
+        seed(
+            options['users'], options['locations'], options['reports'], options['notifications'],
+            seed=options['seed'], days=options['days'], batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded in {time.perf_counter() - started:.1f} s, database now holds {data_counts()}'
+        ))
@@ -0,0 +1,237 @@
+"""
+Prometheus metrics for the operationally critical paths, served at /metrics
+in the Prometheus text format.
+
+Observations go to a process-local registry: one dict update under a lock.
+With METRICS_MULTIPROC_DIR set to a directory shared by the workers of a
+host, every process also writes its values to a file there (from a
+background thread, at most every METRICS_FLUSH_INTERVAL seconds and only
+when they changed) and /metrics adds up all the files, so a scrape sees the
+whole host whichever worker answers it. Files of exited workers are kept so
+their counts are not lost; a new worker reusing a pid overwrites its file,
+which Prometheus treats as a counter reset.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+# Latency histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _labels(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # name -> Counter or Histogram
+        self._values = {}  # (name, labels) -> float, or [bucket counts..., sum, count]
+        self._pid = os.getpid()
+        self._dirty = False
+        self._flusher = None
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def _check_process(self):
+        """Forked workers start from empty values and their own flusher"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._values = {}
+            self._flusher = None
+        if self._flusher is None and settings.METRICS_MULTIPROC_DIR:
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+            self._flusher.start()
+
+    def increment(self, name, labels, amount):
+        with self._lock:
+            self._check_process()
+            key = (name, labels)
+            self._values[key] = self._values.get(key, 0.0) + amount
+            self._dirty = True
+
+    def observe(self, name, labels, buckets, value):
+        with self._lock:
+            self._check_process()
+            key = (name, labels)
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            values[bisect_left(buckets, value)] += 1
+            values[-2] += value
+            values[-1] += 1
+            self._dirty = True
+
+    def _path(self):
+        return os.path.join(settings.METRICS_MULTIPROC_DIR, f'metrics_{os.getpid()}.json')
+
+    def flush(self):
+        """Write this process's values to its file in METRICS_MULTIPROC_DIR"""
+        with self._lock:
+            if not self._dirty or not settings.METRICS_MULTIPROC_DIR:
+                return
+            data = [[name, labels, values] for (name, labels), values in self._values.items()]
+            self._dirty = False
+        path = self._path()
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def _flush_periodically(self):
+        while settings.METRICS_MULTIPROC_DIR:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                pass  # Retried on the next tick
+        with self._lock:
+            self._flusher = None
+
+    def collect(self):
+        """{(name, labels): values} summed over every worker process of the host"""
+        directory = settings.METRICS_MULTIPROC_DIR
+        if not directory:
+            with self._lock:
+                return {key: list(values) if isinstance(values, list) else values
+                        for key, values in self._values.items()}
+
+        self.flush()
+        totals = {}
+        for filename in os.listdir(directory):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # Being replaced
+            for name, labels, values in data:
+                key = (name, tuple(tuple(label) for label in labels))
+                if isinstance(values, list):
+                    total = totals.setdefault(key, [0] * len(values))
+                    for i, value in enumerate(values):
+                        total[i] += value
+                else:
+                    totals[key] = totals.get(key, 0.0) + values
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        values = self.collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            series = sorted((labels, value) for (name, labels), value in values.items() if name == metric.name)
+            for labels, value in series:
+                lines.extend(metric.samples(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+registry = MetricsRegistry()
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        registry.increment(self.name, _labels(labels), amount)
+
+    def samples(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        registry.observe(self.name, _labels(labels), self.buckets, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block, in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self, labels, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), values):
+            cumulative += count
+            le = bound if bound == '+Inf' else _format_value(float(bound))
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', str(le)),))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(values[-2])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {int(values[-1])}")
+        return lines
+
+
+report_create_seconds = Histogram('resq_report_create_seconds', 'Emergency report creation latency by endpoint')
+report_create_total = Counter('resq_report_create_total', 'Emergency report creation requests by endpoint and response code')
+report_status_update_seconds = Histogram('resq_report_status_update_seconds', 'Report update_status latency')
+report_status_update_total = Counter('resq_report_status_update_total', 'Report update_status requests by response code')
+push_send_seconds = Histogram('resq_push_send_seconds', 'Push notification send latency by target (device, topic)')
+push_send_total = Counter('resq_push_send_total', 'Push notifications sent by target and result')
+social_post_seconds = Histogram('resq_social_post_seconds', 'Social media post latency by platform')
+social_post_total = Counter('resq_social_post_total', 'Social media posts by platform and result')
+firebase_auth_seconds = Histogram('resq_firebase_auth_seconds', 'Firebase ID token verification latency')
+firebase_auth_total = Counter('resq_firebase_auth_total', 'Firebase ID token verifications by result')
+chatbot_response_seconds = Histogram('resq_chatbot_response_seconds', 'Chatbot model response time')
+chatbot_response_total = Counter('resq_chatbot_response_total', 'Chatbot responses by result')
+cache_requests_total = Counter('resq_cache_requests_total', 'Cache-aside lookups by cache name and result (hit, miss, wait)')
+cache_fill_seconds = Histogram('resq_cache_fill_seconds', 'Time to compute a missing cache-aside value, by cache name')
+
+
+def timed_view(histogram, counter, **labels):
+    """View method decorator observing its latency and counting responses by status code"""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            code = 500
+            try:
+                response = method(*args, **kwargs)
+                code = response.status_code
+                return response
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+                counter.inc(code=code, **labels)
+        return wrapper
+    return decorator
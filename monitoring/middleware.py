@@ -0,0 +1,133 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .queries import QueryRecorder, current_recorder, query_stats
+
+logger = logging.getLogger(__name__)
+
+
+def endpoint_name(request):
+    """Low-cardinality name of the view that served a request, e.g. 'GET emergencyreport-list'"""
+    match = getattr(request, 'resolver_match', None)
+    return f"{request.method} {match.view_name if match else 'unmatched'}"
+
+
+def _recording(content, recorder):
+    """Iterate over a streaming body with recorder counting its queries"""
+    iterator = iter(content)
+    while True:
+        # Set around each step: a server may consume every chunk in another context
+        token = current_recorder.set(recorder)
+        try:
+            chunk = next(iterator, None)
+        finally:
+            current_recorder.reset(token)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def _arecording(content, recorder):
+    iterator = aiter(content)
+    while True:
+        token = current_recorder.set(recorder)
+        try:
+            chunk = await anext(iterator, None)
+        finally:
+            current_recorder.reset(token)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class QueryStatsMiddleware:
+    """
+    Record the query count, database time, duplicate queries and latency
+    of every request into the per-endpoint statistics served at
+    /api/monitoring/queries/. With QUERY_STATS_HEADERS (on in DEBUG) the
+    numbers are also returned as X-DB-* response headers. Requests over
+    QUERY_COUNT_WARNING queries, repeating one query QUERY_DUPLICATE_WARNING
+    times or slower than SLOW_REQUEST_WARNING_MS are logged.
+
+    A streaming response is recorded when it is closed, with the queries its
+    body ran; its headers can only cover the view.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.QUERY_STATS_ENABLED:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        token = current_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not settings.QUERY_STATS_ENABLED:
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        token = current_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    def finish(self, request, response, recorder, started):
+        if settings.QUERY_STATS_HEADERS:
+            # For a streaming response only the view's part: the headers are
+            # sent before the body runs its queries
+            duplicates = recorder.duplicates()
+            response['X-DB-Query-Count'] = str(recorder.count)
+            response['X-DB-Time-Ms'] = f"{recorder.time * 1000:.1f}"
+            response['X-DB-Duplicate-Queries'] = str(sum(duplicates.values()) - len(duplicates))
+            response['X-Response-Time-Ms'] = f"{(time.perf_counter() - started) * 1000:.1f}"
+
+        if not response.streaming:
+            self.record(request, recorder, started)
+            return response
+
+        # Exports run most of their queries while the body is consumed, after
+        # this returns: count those too and record the request once it is closed
+        if response.is_async:
+            response.streaming_content = _arecording(response.streaming_content, recorder)
+        else:
+            response.streaming_content = _recording(response.streaming_content, recorder)
+        response._resource_closers.append(lambda: self.record(request, recorder, started))
+        return response
+
+    def record(self, request, recorder, started):
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        endpoint = endpoint_name(request)
+        duplicates = recorder.duplicates()
+        query_stats.record(endpoint, latency_ms, recorder, duplicates)
+
+        most_repeated = max(duplicates.items(), key=lambda item: item[1], default=(None, 0))
+        if (recorder.count > settings.QUERY_COUNT_WARNING or
+                most_repeated[1] >= settings.QUERY_DUPLICATE_WARNING or
+                latency_ms > settings.SLOW_REQUEST_WARNING_MS):
+            logger.warning(
+                f"{endpoint} {request.path}: {recorder.count} queries in {recorder.time * 1000:.1f} ms, "
+                f"{latency_ms:.1f} ms total"
+                + (f", repeated {most_repeated[1]} times: {most_repeated[0][:300]}" if most_repeated[0] else '')
+            )
@@ -0,0 +1,185 @@
+"""
+Per-request database query statistics, aggregated per endpoint.
+
+Every database connection gets an execute wrapper passing its queries to
+the QueryRecorder of the request being handled (see QueryStatsMiddleware).
+The recorder is held in a context variable, which also reaches the threads
+running the sync parts of async views with their own connections. It
+counts queries, sums their time and groups them by fingerprint: the SQL
+with literals and IN lists collapsed, so the same ORM query run once per
+row of a list (an N+1) shows up as one fingerprint repeated many times.
+
+The aggregates are kept per worker process.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Duplicate fingerprints kept per endpoint, most frequent first
+MAX_DUPLICATES = 20
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL with parameters and literals replaced by ? and IN lists collapsed"""
+    sql = sql.replace('%s', '?')
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper counting and timing the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0  # Seconds
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        """{fingerprint: executions} for fingerprints run more than once"""
+        fingerprints = Counter()
+        for sql, count in self.statements.items():
+            fingerprints[fingerprint(sql)] += count
+        return {sql: count for sql, count in fingerprints.items() if count > 1}
+
+
+current_recorder = ContextVar('query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver adding record_query to new connections"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class Histogram:
+    """Counts of observations per bucket (upper bounds, plus an overflow bucket)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (None in the overflow bucket)"""
+        if not self.count:
+            return None
+        rank = p * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self):
+        labels = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'buckets': dict(zip(labels, self.counts)),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS_MS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_time = 0.0  # Milliseconds
+        self.max_queries = 0
+        # Fingerprint -> requests in which it ran more than once, and the most repeats seen
+        self.duplicate_requests = Counter()
+        self.max_repeats = {}
+
+    def record(self, latency_ms, recorder, duplicates):
+        self.latency.observe(latency_ms)
+        self.queries.observe(recorder.count)
+        self.db_time += recorder.time * 1000
+        self.max_queries = max(self.max_queries, recorder.count)
+        for sql, count in duplicates.items():
+            self.duplicate_requests[sql] += 1
+            self.max_repeats[sql] = max(self.max_repeats.get(sql, 0), count)
+        if len(self.duplicate_requests) > 5 * MAX_DUPLICATES:
+            kept = dict(self.duplicate_requests.most_common(MAX_DUPLICATES))
+            self.duplicate_requests = Counter(kept)
+            self.max_repeats = {sql: self.max_repeats[sql] for sql in kept}
+
+    def as_dict(self):
+        requests = self.latency.count
+        return {
+            'requests': requests,
+            'latency_ms': self.latency.as_dict(),
+            'queries': self.queries.as_dict(),
+            'avg_queries': round(self.queries.sum / requests, 2),
+            'max_queries': self.max_queries,
+            'avg_db_time_ms': round(self.db_time / requests, 3),
+            'duplicate_queries': [
+                {'sql': sql, 'requests': count, 'max_repeats': self.max_repeats[sql]}
+                for sql, count in self.duplicate_requests.most_common(MAX_DUPLICATES)
+            ],
+        }
+
+
+class QueryStats:
+    """Process-wide EndpointStats keyed by endpoint ('GET emergencyreport-list')"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, latency_ms, recorder, duplicates):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.record(latency_ms, recorder, duplicates)
+
+    def snapshot(self):
+        """Per-endpoint statistics, the endpoints spending the most database time first"""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items(), key=lambda item: -item[1].db_time)
+            return {endpoint: stats.as_dict() for endpoint, stats in endpoints}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+query_stats = QueryStats()
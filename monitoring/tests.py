@@ -0,0 +1,319 @@
+import json
+import os
+import random
+import re
+import tempfile
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from emergency.models import EmergencyIncident, EmergencyReport, EmergencyStatusTransition, EmergencyTag
+from location.models import Location
+from notifications.models import Notification
+from users.models import User
+from config.tests import RoutedReadsTestCase
+from .loadtest import (
+    USERNAME_PREFIX, benchmark_users, capture_queries, clear, compare, data_counts, run_scenario, scenarios,
+    seed
+)
+from .metrics import chatbot_response_total
+from .queries import fingerprint, query_stats
+
+
+class QueryStatsTests(RoutedReadsTestCase):
+    """Requests are recorded per endpoint with their queries and duplicates"""
+
+    def setUp(self):
+        query_stats.reset()
+        self.admin = User.objects.create_user('admin', 'admin@example.com', 'pass', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) AND "n" = 5 AND "s" = \'x\''),
+            'SELECT "a" FROM "t" WHERE "id" IN (...) AND "n" = ? AND "s" = ?'
+        )
+        self.assertEqual(fingerprint('SELECT "t"."x1" FROM "t"  WHERE "id" = %s'), 'SELECT "t"."x1" FROM "t" WHERE "id" = ?')
+
+    @override_settings(QUERY_STATS_HEADERS=True)
+    def test_request_is_recorded(self):
+        for i in range(3):
+            EmergencyReport.objects.create(reporter=self.admin, reporter_type='VICTIM', description=str(i))
+
+        response = self.client.get('/api/emergency/reports/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-DB-Query-Count']), 0)
+        self.assertIn('X-Response-Time-Ms', response)
+
+        stats = self.client.get('/api/monitoring/queries/').data
+        endpoint = stats['GET emergencyreport-list']
+        self.assertEqual(endpoint['requests'], 1)
+        self.assertEqual(endpoint['max_queries'], int(response['X-DB-Query-Count']))
+        self.assertEqual(endpoint['latency_ms']['count'], 1)
+
+    @override_settings(QUERY_STATS_HEADERS=True)
+    def test_streamed_body_is_recorded(self):
+        for i in range(3):
+            EmergencyReport.objects.create(reporter=self.admin, reporter_type='VICTIM', description=str(i))
+
+        response = self.client.get('/api/analytics/export/reports/', {'export_format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('GET analytics:history_export', query_stats.snapshot())
+
+        # Recorded once the body is consumed and closed, with the export queries
+        b''.join(response.streaming_content)
+        endpoint = query_stats.snapshot()['GET analytics:history_export']
+        self.assertEqual(endpoint['requests'], 1)
+        self.assertGreater(endpoint['max_queries'], int(response['X-DB-Query-Count']))
+
+    @override_settings(QUERY_STATS_HEADERS=True)
+    async def test_async_view_is_recorded(self):
+        # Its queries run in a thread, on another connection than the middleware's
+        response = await self.async_client.post(
+            '/api/chatbot/chat/', {'message': ''}, content_type='application/json',
+            headers={'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(int(response['X-DB-Query-Count']), 1)  # The user of the token
+        self.assertEqual(query_stats.snapshot()['POST chatbot']['requests'], 1)
+
+    @override_settings(QUERY_STATS_HEADERS=False)
+    def test_headers_are_off_outside_debug(self):
+        self.assertNotIn('X-DB-Query-Count', self.client.get('/api/monitoring/queries/'))
+
+    @override_settings(QUERY_COUNT_WARNING=0)
+    def test_threshold_is_logged(self):
+        with self.assertLogs('monitoring.middleware', level='WARNING') as logs:
+            self.client.get('/api/emergency/reports/')
+        self.assertIn('GET emergencyreport-list', logs.output[0])
+
+    def test_admin_only(self):
+        citizen = User.objects.create_user('citizen', 'citizen@example.com', 'pass')
+        self.client.force_authenticate(citizen)
+        self.assertEqual(self.client.get('/api/monitoring/queries/').status_code, 403)
+
+
+def sample(text, series):
+    """Value of one series in a Prometheus exposition, 0 if absent"""
+    match = re.search(rf'^{re.escape(series)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+class MetricsTests(TestCase):
+    """Hot-path metrics are exposed in the Prometheus text format"""
+
+    def setUp(self):
+        self.police = User.objects.create_user('police', 'police@example.com', 'pass', role='POLICE')
+        self.client = APIClient()
+        self.client.force_authenticate(self.police)
+
+    def scrape(self, **headers):
+        response = self.client.get('/metrics', **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_status_updates_are_counted(self):
+        report = EmergencyReport.objects.create(reporter=self.police, reporter_type='VICTIM', description='Fire')
+        before = self.scrape()
+
+        response = self.client.post(f'/api/emergency/reports/{report.id}/update_status/', {'status': 'RESPONDING'})
+        self.assertEqual(response.status_code, 200)
+
+        after = self.scrape()
+        series = 'resq_report_status_update_total{code="200"}'
+        self.assertEqual(sample(after, series) - sample(before, series), 1)
+        count = 'resq_report_status_update_seconds_count'
+        self.assertEqual(sample(after, count) - sample(before, count), 1)
+        self.assertIn('# TYPE resq_report_status_update_seconds histogram', after)
+        self.assertIn('resq_report_status_update_seconds_bucket{le="+Inf"}', after)
+
+    def test_worker_files_are_summed(self):
+        series = 'resq_chatbot_response_total{result="success"}'
+        local = sample(self.scrape(), series)
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            # Another worker's file
+            with open(os.path.join(directory, 'metrics_1.json'), 'w') as f:
+                json.dump([['resq_chatbot_response_total', [['result', 'success']], 5.0]], f)
+            chatbot_response_total.inc(2, result='success')
+            self.assertEqual(sample(self.scrape(), series), local + 2 + 5)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+
+
+class LoadTestTests(RoutedReadsTestCase):
+    """Synthetic data seeding and in-process endpoint benchmarks"""
+
+    def setUp(self):
+        seed(users=40, locations=100, reports=60, notifications=80, days=30, batch_size=25)
+
+    def test_seed(self):
+        counts = data_counts()
+        self.assertEqual(counts, {'users': 40, 'locations': 100, 'reports': 60, 'notifications': 80})
+        self.assertEqual(User.objects.filter(is_staff=True).count(), 1)
+        # Timestamps are spread over the period, not all now()
+        timestamps = EmergencyReport.objects.values_list('timestamp', flat=True)
+        self.assertGreater(max(timestamps) - min(timestamps), timedelta(days=1))
+        self.assertFalse(EmergencyReport.objects.filter(tags=None).exists())
+        self.assertTrue(EmergencyReport._meta.get_field('timestamp').auto_now_add)
+
+        seed(users=5, locations=0, reports=0, notifications=0)
+        self.assertTrue(User.objects.filter(username=f'{USERNAME_PREFIX}44').exists())
+        clear()
+        self.assertEqual(sum(data_counts().values()), 0)
+
+    def test_run_scenario(self):
+        rng = random.Random(1)
+        users = benchmark_users(rng)
+        for name in ('report_create', 'dashboard_citizen', 'notification_list'):
+            scenario = scenarios(rng)[name]
+            result = run_scenario(scenario, users[scenario.role], requests=4, warmup=1)
+            self.assertEqual(result['requests'], 4)
+            self.assertEqual(result['errors'], 0, name)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(EmergencyReport.objects.count(), 65)
+
+    def test_compare(self):
+        baseline = {'scenarios': {'list': {'threads': 1, 'p95_ms': 10.0, 'throughput_rps': 100.0, 'queries': 3}}}
+        same = {'scenarios': {'list': {'threads': 1, 'p95_ms': 11.0, 'throughput_rps': 95.0, 'queries': 3}}}
+        self.assertEqual(compare(baseline, same), [])
+        worse = {'scenarios': {'list': {'threads': 1, 'p95_ms': 20.0, 'throughput_rps': 50.0, 'queries': 4}}}
+        self.assertEqual(len(compare(baseline, worse)), 3)
+        worse['scenarios']['list']['threads'] = 4
+        self.assertEqual(compare(baseline, worse), [])
+
+
+class QueryCountTests(RoutedReadsTestCase):
+    """
+    Queries per request of the main API endpoints, checked against a budget.
+
+    Each endpoint is measured against a small and then a larger data set. A
+    count that grows with the rows returned is an N+1. Counts are taken with
+    an empty cache, the worst case. When a change adds or removes queries on
+    purpose, update the budget.
+    """
+
+    QUERY_BUDGETS = {
+        ('CITIZEN', '/api/emergency/reports/'): 2,
+        ('POLICE', '/api/emergency/reports/'): 2,
+        ('POLICE', '/api/emergency/reports/?status=PENDING'): 2,
+        ('CITIZEN', '/api/emergency/nearby/?lat=41.0&lng=29.0&radius=50'): 2,
+        ('POLICE', '/api/emergency/incidents/'): 2,
+        ('POLICE', '/api/emergency/nearby/incidents/?lat=41.0&lng=29.0&radius=50'): 1,
+        ('POLICE', '/api/emergency/tags/'): 1,
+        ('POLICE', '/api/emergency/stats/tags/'): 1,
+        ('CITIZEN', '/api/dashboards/citizen/'): 6,
+        ('POLICE', '/api/dashboards/emergency-service/'): 8,
+        ('FIRE_STATION', '/api/dashboards/emergency-service/'): 8,
+        ('ADMIN', '/api/dashboards/admin/'): 10,
+        ('POLICE', '/api/analytics/global/'): 7,
+        ('POLICE', '/api/analytics/timeseries/'): 1,
+        ('POLICE', '/api/analytics/regional/'): 1,
+        ('CITIZEN', '/api/analytics/user/'): 3,
+        ('CITIZEN', '/api/notifications/'): 2,
+        ('CITIZEN', '/api/locations/'): 1,
+        ('ADMIN', '/api/users/list/'): 1,
+        ('POLICE', '/api/map/routes/'): 1,
+        ('CITIZEN', '/api/map/tiles/0/0/0/'): 1,
+    }
+    REPORT_CREATE_BUDGET = 19
+    STATUS_UPDATE_BUDGET = 21
+
+    def setUp(self):
+        self.users = {
+            role: User.objects.create_user(role.lower(), f'{role.lower()}@example.com', 'pass', role=role)
+            for role in ('CITIZEN', 'POLICE', 'FIRE_STATION')
+        }
+        self.users['ADMIN'] = User.objects.create_user('admin', 'admin@example.com', 'pass', role='CITIZEN', is_staff=True)
+        self.tags = [
+            EmergencyTag.objects.create(name=name, emergency_type=emergency_type)
+            for name, emergency_type in (('Fire', 'FIRE'), ('Flood', 'NATURAL'), ('Crash', 'TRAFFIC'))
+        ]
+        self.added = 0
+
+    def add_data(self, count):
+        """count more of every related row each endpoint returns"""
+        for i in range(self.added, self.added + count):
+            latitude = 41 + i * 0.001
+            for user in self.users.values():
+                Notification.objects.create(recipient=user, title='Alert', message=f'Message {i}')
+                Location.objects.create(user=user, latitude=latitude, longitude=29, is_emergency=True)
+            incident = EmergencyIncident.objects.create(
+                description=f'Incident {i}', latitude=latitude, longitude=29, report_count=2
+            )
+            incident.tags.set(self.tags[:2])
+            for report_status in ('PENDING', 'RESOLVED'):
+                report = EmergencyReport.objects.create(
+                    reporter=self.users['CITIZEN'], reporter_type='VICTIM', description=f'Report {i}',
+                    latitude=latitude, longitude=29, is_emergency=True, status=report_status, incident=incident
+                )
+                report.tags.set(self.tags[:2])
+                EmergencyStatusTransition.objects.create(
+                    report=report, from_status='PENDING', to_status='RESPONDING', changed_by=self.users['POLICE']
+                )
+        self.added += count
+
+    def client_for(self, role):
+        client = APIClient()
+        client.force_authenticate(self.users[role])
+        return client
+
+    def count_queries(self, request):
+        cache.clear()
+        with capture_queries() as captured:
+            response = request()
+        self.assertLess(response.status_code, 300, response.content[:200])
+        return len(captured), response
+
+    def measure_reads(self):
+        return {
+            (role, path): self.count_queries(lambda: self.client_for(role).get(path))[0]
+            for role, path in self.QUERY_BUDGETS
+        }
+
+    def test_read_endpoints(self):
+        self.add_data(2)
+        small = self.measure_reads()
+        self.add_data(5)
+        large = self.measure_reads()
+
+        for key, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(endpoint=key):
+                self.assertEqual(large[key], small[key], f'{key}: queries grow with the data (N+1)')
+                self.assertLessEqual(large[key], budget, f'{key}: more queries than its budget')
+
+    def create_report(self, tags):
+        return self.client_for('CITIZEN').post('/api/emergency/reports/', {
+            'reporter_type': 'VICTIM',
+            'description': 'New report',
+            'latitude': 41.0,
+            'longitude': 29.0,
+            'is_emergency': False,
+            'tag_ids': [str(tag.id) for tag in tags],
+        }, format='json')
+
+    def update_status(self, report_id):
+        return self.client_for('POLICE').post(
+            f'/api/emergency/reports/{report_id}/update_status/', {'status': 'RESPONDING'}, format='json'
+        )
+
+    def test_write_endpoints(self):
+        self.add_data(2)
+        # First writes also create the analytics cube rows of their bucket
+        self.update_status(self.create_report(self.tags[:1]).data['id'])
+
+        one_tag, _ = self.count_queries(lambda: self.create_report(self.tags[:1]))
+        all_tags, response = self.count_queries(lambda: self.create_report(self.tags))
+        self.assertEqual(all_tags, one_tag, 'report create queries grow with the tags (N+1)')
+        self.assertLessEqual(all_tags, self.REPORT_CREATE_BUDGET)
+
+        count, _ = self.count_queries(lambda: self.update_status(response.data['id']))
+        self.assertLessEqual(count, self.STATUS_UPDATE_BUDGET)
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'monitoring'
+
+urlpatterns = [
+    path('queries/', views.QueryStatsView.as_view(), name='query_stats'),
+]
@@ -0,0 +1,35 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .metrics import registry
+from .queries import query_stats
+
+
+class QueryStatsView(APIView):
+    """
+    Per-endpoint query count, database time and latency histograms of this
+    worker process, with the queries most often repeated within a request.
+    DELETE clears the statistics.
+    """
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response(query_stats.snapshot())
+    
+    def delete(self, request):
+        query_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint (text exposition format)"""
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
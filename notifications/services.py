@@ -6,6 +6,7 @@ import firebase_admin
 from firebase_admin import credentials, messaging
 from .models import Notification
 from users.models import User
+from monitoring.metrics import push_send_seconds, push_send_total
 
 logger = logging.getLogger(__name__)
 
@@ -69,20 +70,24 @@ def send_push_notification(user_id, title, body, data=None):
             payload['data'] = data
         
         # Send the notification
-        response = requests.post(
-            fcm_url, 
-            headers=headers, 
-            data=json.dumps(payload)
-        )
+        with push_send_seconds.time(target='device'):
+            response = requests.post(
+                fcm_url, 
+                headers=headers, 
+                data=json.dumps(payload)
+            )
         
         # Check response
         if response.status_code == 200:
+            push_send_total.inc(target='device', result='success')
             return True
         else:
+            push_send_total.inc(target='device', result='failure')
             print(f"FCM notification failed: {response.text}")
             return False
             
     except Exception as e:
+        push_send_total.inc(target='device', result='error')
         print(f"Error sending push notification: {str(e)}")
         return False
 
@@ -115,14 +120,18 @@ def send_topic_notification(topic, title, body, data=None):
         )
         
         # Send message
-        response = messaging.send(message)
+        with push_send_seconds.time(target='topic'):
+            response = messaging.send(message)
+        push_send_total.inc(target='topic', result='success')
         logger.info(f"Successfully sent topic notification to {topic}: {response}")
         return True
         
     except messaging.exceptions.FirebaseError as e:
+        push_send_total.inc(target='topic', result='failure')
         logger.error(f"Firebase topic messaging error: {str(e)}")
         return False
     except Exception as e:
+        push_send_total.inc(target='topic', result='error')
         logger.error(f"Unexpected error sending topic notification: {str(e)}")
         return False
 
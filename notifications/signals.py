@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Notification
+from config.caching import invalidate
+
+@receiver([post_save, post_delete], sender=Notification)
+def invalidate_notification_caches(sender, instance, **kwargs):
+    """Outdate the recipient's cached dashboard notifications and analytics"""
+    invalidate('notifications', instance.recipient_id)
@@ -7,6 +7,7 @@ from rest_framework.pagination import PageNumberPagination
 from .models import Notification
 from .serializers import NotificationSerializer, FCMTokenSerializer
 from users.models import DeviceToken
+from config.caching import invalidate
 
 class NotificationPagination(PageNumberPagination):
     page_size = 20
@@ -91,4 +92,5 @@ def register_fcm_token(request):
 def mark_all_read(request):
     """Mark all notifications as read for the current user"""
     Notification.objects.filter(recipient=request.user).update(is_read=True)
+    invalidate('notifications', request.user.pk)  # update() sends no post_save
     return Response({'status': 'All notifications marked as read'}, status=status.HTTP_200_OK)
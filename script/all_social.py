@@ -8,11 +8,15 @@ FACEBOOK_ACCESS_TOKEN = config("FACEBOOK_ACCESS_TOKEN")
 TELEGRAM_BOT_TOKEN = config("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = config("TELEGRAM_CHAT_ID")
 
+class SocialPostError(Exception):
+    """A platform API did not accept a post"""
+
 # Discord Functions
 def send_file_to_discord(file_path, message=""):
     """
     Send a file (photo or video) to Discord via a webhook.
     If file_path is None, sends only the message.
+    Returns the response; raises SocialPostError if Discord rejects it.
     """
     if file_path:
         with open(file_path, "rb") as file:
@@ -26,14 +30,16 @@ def send_file_to_discord(file_path, message=""):
     
     if response.status_code == 200 or response.status_code == 204:
         print("Message sent to Discord successfully!")
-    else:
-        print(f"Error sending to Discord: {response.status_code}, {response.text}")
+        return response
+    print(f"Error sending to Discord: {response.status_code}, {response.text}")
+    raise SocialPostError(f"Discord returned {response.status_code}: {response.text}")
 
 # Facebook Functions
 def post_to_facebook(file_path, message="", is_video=False):
     """
     Post a photo or video to a Facebook page.
     If file_path is None, creates a text-only post.
+    Returns the response; raises SocialPostError if Facebook rejects it.
     """
     if file_path:
         url = f"https://graph.facebook.com/{FACEBOOK_PAGE_ID}/{'videos' if is_video else 'photos'}"
@@ -55,14 +61,16 @@ def post_to_facebook(file_path, message="", is_video=False):
     
     if response.status_code == 200:
         print("Posted to Facebook successfully!")
-    else:
-        print(f"Error posting to Facebook: {response.json()}")
+        return response
+    print(f"Error posting to Facebook: {response.status_code}, {response.text}")
+    raise SocialPostError(f"Facebook returned {response.status_code}: {response.text}")
 
 # Telegram Functions
 def send_media_to_telegram(file_path, caption="", is_video=False):
     """
     Send a photo or video to a Telegram chat.
     If file_path is None, sends a text-only message.
+    Returns the response; raises SocialPostError if Telegram rejects it.
     """
     if file_path:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/{'sendVideo' if is_video else 'sendPhoto'}"
@@ -85,5 +93,6 @@ def send_media_to_telegram(file_path, caption="", is_video=False):
     
     if response.status_code == 200:
         print(f"{'Message' if not file_path else 'Video' if is_video else 'Photo'} sent to Telegram successfully!")
-    else:
-        print(f"Error sending to Telegram: {response.status_code}, {response.text}")
+        return response
+    print(f"Error sending to Telegram: {response.status_code}, {response.text}")
+    raise SocialPostError(f"Telegram returned {response.status_code}: {response.text}")
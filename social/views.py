@@ -9,6 +9,29 @@ from django.shortcuts import render
 
 from .models import SocialPost
 from script.all_social import send_file_to_discord, post_to_facebook, send_media_to_telegram
+from monitoring.metrics import social_post_seconds, social_post_total
+
+def publish_to_platform(platform, file_path, content, is_video=False):
+    """
+    Post content, with the media file at file_path if given (None posts
+    text only), to one platform. Latency and outcome are recorded per
+    platform. Network errors and API rejections (SocialPostError) are
+    re-raised.
+    """
+    try:
+        with social_post_seconds.time(platform=platform):
+            if platform == 'DISCORD':
+                send_file_to_discord(file_path, content)
+            elif platform == 'FACEBOOK':
+                post_to_facebook(file_path, content, is_video)
+            elif platform == 'TELEGRAM':
+                send_media_to_telegram(file_path, content, is_video)
+            else:
+                raise ValueError(f'Unknown platform {platform}')
+    except Exception:
+        social_post_total.inc(platform=platform, result='failure')
+        raise
+    social_post_total.inc(platform=platform, result='success')
 
 @csrf_exempt
 def social_post(request):
@@ -46,12 +69,7 @@ def social_post(request):
             
             # Post to the platform
             try:
-                if platform == 'DISCORD':
-                    send_file_to_discord(file_path, content)
-                elif platform == 'FACEBOOK':
-                    post_to_facebook(file_path, content, is_video)
-                elif platform == 'TELEGRAM':
-                    send_media_to_telegram(file_path, content, is_video)
+                publish_to_platform(platform, file_path, content, is_video)
                 
                 # Update status to success
                 social_post.status = 'POSTED'
@@ -149,25 +167,9 @@ def post_emergency_to_social_media(emergency_data, location_data=None, media_fil
             )
             social_post.save()
             
-            # Post to the platform
+            # Post to the platform (text only without a media file)
             try:
-                if platform == 'DISCORD':
-                    if file_path:
-                        send_file_to_discord(file_path, content)
-                    else:
-                        send_file_to_discord(None, content)
-                elif platform == 'FACEBOOK':
-                    if file_path:
-                        post_to_facebook(file_path, content, is_video)
-                    else:
-                        # Use Facebook Graph API to post text-only content
-                        post_to_facebook(None, content, False)
-                elif platform == 'TELEGRAM':
-                    if file_path:
-                        send_media_to_telegram(file_path, content, is_video)
-                    else:
-                        # Use Telegram API to send text-only message
-                        send_media_to_telegram(None, content, False)
+                publish_to_platform(platform, file_path, content, is_video)
                 
                 # Update status to success
                 social_post.status = 'POSTED'